@@ -1,124 +1,198 @@
-from flask import Flask, render_template, request, redirect
+from flask import Flask, render_template, request, redirect, jsonify, abort
+import os
+import json
+import math
+import threading
+from datetime import date
+from typing import NamedTuple
 import pandas as pd
-import sqlite3
+import db
+from exportacion import normalizar_aviso
+from importar_excel import leer_excel_por_bloques
 
 app = Flask(__name__)
 
-DB_PATH = "avisos.db"
 EXCEL_PATH = "RutasDatos.xlsx"
+# qué hacer con los avisos seleccionados que ya existen (ver db.importar_avisos)
+POLITICA_IMPORTACION = "ignorar"
 
-# 🔧 Asegura que la tabla existe
-def asegurar_tabla():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS avisos (
-        idAviso INTEGER PRIMARY KEY AUTOINCREMENT,
-        ordenInterna TEXT UNIQUE,
-        cliente TEXT,
-        direccion TEXT,
-        localidad TEXT,
-        codigoPostal TEXT,
-        telefono1 TEXT,
-        telefono2 TEXT,
-        aparato TEXT,
-        marca TEXT,
-        modelo TEXT,
-        fechaAsignacion TEXT,
-        averia TEXT,
-        tipoServicio TEXT,
-        conCargo BOOLEAN,
-        importe REAL,
-        metodoPago TEXT,
-        observacionesCobro TEXT,
-        estado TEXT,
-        fechaVisita TEXT,
-        tecnico TEXT,
-        turno TEXT
-    );
-    """)
-    conn.commit()
-    conn.close()
-
-# 🔍 Verifica si el aviso ya existe
-def verificar_duplicado(orden):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM avisos WHERE ordenInterna = ?", (str(orden),))
-    count = cursor.fetchone()[0]
-    conn.close()
-    return count > 0
-
-# 📋 Carga y marca duplicados
-def cargar_excel():
-    asegurar_tabla()
-    df = pd.read_excel(EXCEL_PATH)
-    df['duplicado'] = df['reparacion'].apply(verificar_duplicado)
-    return df.to_dict(orient='records')
-
-# 🏠 Página principal con filtros
-@app.route("/")
-def index():
-    localidad = request.args.get("localidad", "").lower()
-    tecnico = request.args.get("tecnico", "").lower()
-    avisos = cargar_excel()
+# 🗃️ Caché del libro: leer el Excel es lo más caro de la app, así que se lee una
+# vez por versión del archivo (ruta, fecha de modificación y tamaño) y se guarda
+# en memoria y en un archivo columnar al lado (feather/parquet, o pickle si no hay
+# motor), para que tras reiniciar tampoco haya que volver a leerlo.
+
+class LibroCacheado(NamedTuple):
+    firma: tuple
+    df: pd.DataFrame
+    ordenes: pd.Series  # reparacion normalizada (_texto), alineada con df
+
+_libros = {}  # ruta absoluta -> LibroCacheado
+_libros_lock = threading.Lock()
+
+def _firma_libro(ruta):
+    st = os.stat(ruta)
+    return (os.path.abspath(ruta), st.st_mtime_ns, st.st_size)
+
+def _formato_sidecar():
+    try:
+        import pyarrow  # noqa: F401
+        return "feather"
+    except ImportError:
+        pass
+    try:
+        import fastparquet  # noqa: F401
+        return "parquet"
+    except ImportError:
+        return "pickle"
+
+def _ruta_sidecar(ruta):
+    carpeta, nombre = os.path.split(os.path.abspath(ruta))
+    return os.path.join(carpeta, f".{nombre}.cache")
+
+def _leer_sidecar(ruta, firma):
+    base = _ruta_sidecar(ruta)
+    try:
+        with open(base + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        if tuple(meta["firma"]) != firma[1:]:
+            return None
+        formato = meta["formato"]
+        if formato == "feather":
+            return pd.read_feather(base + ".feather")
+        if formato == "parquet":
+            return pd.read_parquet(base + ".parquet")
+        return pd.read_pickle(base + ".pkl")
+    except Exception:
+        return None  # sidecar dañado o de otra versión: se vuelve a leer el Excel
+
+def _escribir_sidecar(ruta, firma, df):
+    base = _ruta_sidecar(ruta)
+    formato = _formato_sidecar()
+    try:
+        try:
+            if formato == "feather":
+                df.to_feather(base + ".feather")
+            elif formato == "parquet":
+                df.to_parquet(base + ".parquet", index=False)
+        except (ValueError, TypeError, ImportError):
+            formato = "pickle"  # p.ej. columnas con números y texto mezclados
+        if formato == "pickle":
+            df.to_pickle(base + ".pkl")
+        # el .json va el último: sin él (o con otra firma) no se usa el sidecar
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump({"firma": list(firma[1:]), "formato": formato}, f)
+    except OSError:
+        pass  # sin permiso de escritura junto al libro: solo caché en memoria
+
+def libro_cacheado(ruta=None):
+    """El libro `ruta` (por defecto EXCEL_PATH) ya leído; se relee solo si cambia el archivo."""
+    ruta = ruta or EXCEL_PATH
+    firma = _firma_libro(ruta)
+    libro = _libros.get(firma[0])
+    if libro is not None and libro.firma == firma:
+        return libro
+    with _libros_lock:
+        libro = _libros.get(firma[0])
+        if libro is not None and libro.firma == firma:
+            return libro
+        df = _leer_sidecar(ruta, firma)
+        if df is None:
+            bloques = [b for _, _, _, b in leer_excel_por_bloques(ruta, requeridas=("reparacion",))]
+            df = pd.concat(bloques, ignore_index=True) if bloques else pd.DataFrame(columns=["reparacion"])
+            _escribir_sidecar(ruta, firma, df)
+        libro = LibroCacheado(firma, df, df["reparacion"].map(_texto))
+        _libros[firma[0]] = libro
+        return libro
+
+# 📋 El listado sale de la tabla de trabajo de db.py (libro_filas), que se vuelve
+# a llenar desde la caché solo cuando cambia el libro; filtros, orden, páginas y
+# duplicados los resuelve SQLite con índices
+TAMANO_PAGINA = 100
+TAMANO_PAGINA_MAX = 500
+
+def _columna(df, columna):
+    if columna not in df:
+        return [None] * len(df)
+    return df[columna].map(_texto).tolist()
 
-    if localidad:
-        avisos = [a for a in avisos if localidad in a['LOCALIDAD'].lower()]
-    if tecnico:
-        avisos = [a for a in avisos if tecnico in str(a.get('tecnico', '')).lower()]
+def sincronizar_libro():
+    """Vuelca el libro en la base si no está ya esa versión."""
+    libro = libro_cacheado()
+    firma = "|".join(str(v) for v in libro.firma)
+    if db.obtener_firma_libro() == firma:
+        return
+    df = libro.df
+    clientes = [" ".join(t for t in par if t) or None
+                for par in zip(_columna(df, 'NOMBRE'), _columna(df, 'apel1'))]
+    db.cargar_libro(firma, zip(libro.ordenes, clientes, _columna(df, 'aparato'),
+                                _columna(df, 'LOCALIDAD'), _columna(df, 'tecnico')))
 
-    return render_template("index.html", avisos=avisos)
+def _texto(valor):
+    """Celda del Excel -> texto sin espacios (enteros sin '.0', fechas yyyy-MM-dd); vacía -> None."""
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    elif isinstance(valor, date):
+        valor = valor.strftime("%Y-%m-%d")
+    texto = str(valor).strip()
+    return texto or None
 
-# 📥 Importación de avisos seleccionados
+def _aviso_de_fila(row):
+    """Fila del Excel -> columnas de avisos."""
+    return {
+        "ordenInterna": _texto(row['reparacion']),
+        "cliente": " ".join(t for t in (_texto(row['NOMBRE']), _texto(row.get('apel1'))) if t) or None,
+        "direccion": _texto(row['DIRECCION']), "localidad": _texto(row['LOCALIDAD']),
+        "codigoPostal": _texto(row['CODIGOPOSTAL']),
+        "telefono1": _texto(row['TELE1']), "telefono2": _texto(row.get('TELE2')),
+        "aparato": _texto(row['aparato']), "marca": _texto(row['marca']), "modelo": _texto(row['modelo']),
+        "fechaAsignacion": _texto(row['fecha1']), "averia": _texto(row['averia2']),
+        "tipoServicio": "Recogida", "conCargo": 0,
+        "estado": "pendiente", "fechaVisita": "", "tecnico": "", "turno": "",
+    }
+
+# 🏠 Página principal con filtros, orden y páginas
+@app.route("/")
+def index():
+    sincronizar_libro()
+    filtros = {
+        "localidad": request.args.get("localidad", "").strip(),
+        "tecnico": request.args.get("tecnico", "").strip(),
+        "ordenar": request.args.get("ordenar") or "orden",
+    }
+    tamano = min(request.args.get("tamano", TAMANO_PAGINA, type=int), TAMANO_PAGINA_MAX)
+    try:
+        pagina = db.obtener_libro_pagina(
+            tamano=tamano, despues=request.args.get("despues"), antes=request.args.get("antes"), **filtros)
+    except ValueError:
+        abort(400)
+    return render_template("index.html", pagina=pagina, filtros=filtros, tamano=tamano)
+
+# 📥 Importación de avisos seleccionados: un INSERT ... ON CONFLICT por fila, todo
+# en una transacción; los que ya existen se tratan según la política elegida
 @app.route("/importar", methods=["POST"])
 def importar():
-    seleccionados = request.form.getlist("seleccion")
-    df = pd.read_excel(EXCEL_PATH)
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    for _, row in df.iterrows():
-        if str(row['reparacion']) in seleccionados:
-            try:
-                cursor.execute("""
-                    INSERT INTO avisos (
-                        ordenInterna, cliente, direccion, localidad, codigoPostal,
-                        telefono1, telefono2, aparato, marca, modelo,
-                        fechaAsignacion, averia, tipoServicio, conCargo, importe,
-                        metodoPago, observacionesCobro, estado, fechaVisita, tecnico, turno
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    str(row['reparacion']),
-                    f"{row['NOMBRE']} {row.get('apel1', '')}",
-                    row['DIRECCION'], row['LOCALIDAD'], str(row['CODIGOPOSTAL']),
-                    str(row['TELE1']), str(row.get('TELE2', '')),
-                    str(row['aparato']), row['marca'], row['modelo'],
-                    str(row['fecha1']), row['averia2'],
-                    "Recogida", 0, None, None, None,
-                    "pendiente", "", "", ""
-                ))
-            except sqlite3.IntegrityError:
-                pass
-
-    conn.commit()
-    conn.close()
+    seleccionados = set(request.form.getlist("seleccion"))
+    politica = request.form.get("politica") or POLITICA_IMPORTACION
+    if politica not in db.POLITICAS_IMPORTACION:
+        abort(400)
+    libro = libro_cacheado()
+    filas = libro.df[libro.ordenes.isin(seleccionados)].to_dict(orient='records')
+    db.importar_avisos([_aviso_de_fila(row) for row in filas], politica)
     return redirect("/")
 
 # 📝 Ficha editable por aviso (desde base de datos)
+# los campos del formulario, los mismos que guarda /guardar
+_COLUMNAS_EDITAR = ("ordenInterna", "cliente", "direccion", "localidad", "aparato", "marca", "modelo")
+
 @app.route("/editar/<orden>")
 def editar(orden):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM avisos WHERE ordenInterna = ?", (str(orden),))
-    row = cursor.fetchone()
+    row = db.get_connection().execute(
+        f"SELECT {', '.join(_COLUMNAS_EDITAR)} FROM avisos WHERE ordenInterna = ?", (str(orden),)).fetchone()
     if not row:
-        conn.close()
         return f"Aviso {orden} no encontrado en la base de datos", 404
-
-    columnas = [desc[0] for desc in cursor.description]
-    aviso = dict(zip(columnas, row))
-    conn.close()
+    aviso = dict(zip(_COLUMNAS_EDITAR, row))
     return render_template("editar.html", aviso=aviso)
 
 # 💾 Guardar cambios en la base
@@ -131,17 +205,68 @@ def guardar(orden):
     marca = request.form.get("marca")
     modelo = request.form.get("modelo")
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE avisos SET
-            cliente = ?, direccion = ?, localidad = ?,
-            aparato = ?, marca = ?, modelo = ?
-        WHERE ordenInterna = ?
-    """, (cliente, direccion, localidad, aparato, marca, modelo, str(orden)))
-    conn.commit()
-    conn.close()
+    with db.transaccion() as conn:
+        conn.execute("""
+            UPDATE avisos SET
+                cliente = ?, direccion = ?, localidad = ?,
+                aparato = ?, marca = ?, modelo = ?
+            WHERE ordenInterna = ?
+        """, (cliente, direccion, localidad, aparato, marca, modelo, str(orden)))
     return redirect("/")
 
+# 📱 API JSON para la app móvil (mismo formato que la exportación). El ETag es la
+# versión de los datos (db.obtener_version_datos): si el móvil manda la que ya
+# tiene en If-None-Match se responde 304 sin llegar a consultar los avisos
+_CODIGOS_ESTADO = {nombre: codigo for codigo, nombre in db.NOMBRES_ESTADO.items() if nombre}
+
+def _con_etag(generar):
+    # la versión se lee antes que los datos: si cambian entre medias, el ETag
+    # queda viejo y el siguiente sondeo vuelve a descargar (nunca al revés)
+    etag = db.obtener_version_datos()
+    if request.if_none_match.contains(etag):
+        respuesta = app.response_class(status=304)
+    else:
+        respuesta = generar()
+    respuesta.set_etag(etag)
+    respuesta.headers["Cache-Control"] = "no-cache"
+    return respuesta
+
+@app.route("/api/avisos")
+def api_avisos():
+    """?fecha=yyyy-MM-dd, ?tecnico=..., ?estado=pendiente (repetible); al menos uno, se combinan."""
+    filtro = {}
+    if request.args.get("fecha"):
+        filtro["fechaVisita"] = request.args["fecha"]
+    if request.args.get("tecnico"):
+        filtro["tecnico"] = request.args["tecnico"]
+    estados = request.args.getlist("estado")
+    if estados:
+        if any(e not in _CODIGOS_ESTADO for e in estados):
+            abort(400)
+        filtro["estado_code"] = [_CODIGOS_ESTADO[e] for e in estados]
+    if not filtro:
+        abort(400)
+
+    def generar():
+        avisos = [normalizar_aviso(a) for a in db.iter_avisos(filtro, ["fechaVisita ASC", "horaInicio ASC"])]
+        return jsonify({"total": len(avisos), "avisos": avisos})
+    return _con_etag(generar)
+
+@app.route("/api/avisos/<orden>")
+def api_aviso(orden):
+    def generar():
+        aviso = db.obtener_aviso(orden)
+        if aviso is None:
+            abort(404)
+        return jsonify(normalizar_aviso(aviso))
+    return _con_etag(generar)
+
+# 📈 Métricas de db.py (solo desde la propia máquina)
+@app.route("/metrics")
+def metrics():
+    if request.remote_addr not in ("127.0.0.1", "::1"):
+        abort(403)
+    return jsonify(db.stats())
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,345 @@
+"""
+Benchmarks de la capa de datos: lecturas y escrituras de db.py, importadores
+Excel (importar_excel.py y app.importar) y exportación JSON.
+
+Uso (sin entorno gráfico):
+    python benchmark.py                           # 10k y 100k filas
+    python benchmark.py --tamanos 10000,100000,1000000 --salida base.json
+    python benchmark.py --comparar base.json      # compara con una ejecución anterior
+    python benchmark.py --tamanos "" --filas-excel 100000   # solo importadores, libro de 100k filas
+
+Los datos se generan con generar_datos.py (deterministas por semilla). Con
+--dir-datos las bases generadas se guardan y se reutilizan (se trabaja sobre una copia).
+Los resultados (ms por operación: mínimo, mediana, media, máximo) se guardan en JSON.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import generar_datos
+
+UMBRAL_REGRESION = 1.2  # --comparar marca lo que sea un 20% más lento
+
+
+def _medir(fn, repeticiones):
+    tiempos, filas = [], 0
+    for i in range(repeticiones):
+        inicio = time.perf_counter()
+        filas = fn(i)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        "repeticiones": repeticiones,
+        "min_ms": round(min(tiempos), 3),
+        "mediana_ms": round(statistics.median(tiempos), 3),
+        "media_ms": round(statistics.mean(tiempos), 3),
+        "max_ms": round(max(tiempos), 3),
+        "filas": filas,
+    }
+
+
+def _contar(iterable):
+    return sum(1 for _ in iterable)
+
+
+def _preparar_db(filas, semilla, dir_datos, tmp):
+    ruta = os.path.join(tmp, f"avisos_{filas}.db")
+    if dir_datos:
+        os.makedirs(dir_datos, exist_ok=True)
+        guardada = os.path.join(dir_datos, f"avisos_{filas}_{semilla}.db")
+        if not os.path.exists(guardada):
+            generar_datos.crear_db(guardada, filas, semilla)
+        shutil.copyfile(guardada, ruta)
+    else:
+        generar_datos.crear_db(ruta, filas, semilla)
+    return ruta
+
+
+def _parametros(conn):
+    """Valores reales de la base para las consultas (fecha con más avisos, órdenes...)."""
+    fecha = conn.execute("""
+        SELECT fechaVisita FROM avisos WHERE fechaVisita IS NOT NULL
+        GROUP BY fechaVisita ORDER BY COUNT(*) DESC, fechaVisita LIMIT 1
+    """).fetchone()[0]
+    ordenes = [r[0] for r in conn.execute("SELECT ordenInterna FROM avisos ORDER BY idAviso")]
+    seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM avisos_changes").fetchone()[0]
+    return fecha, ordenes, seq
+
+
+def benchmarks_db(repeticiones, tamano_bulk):
+    import db
+    from exportacion import escribir_json_todos, escribir_json_cambios
+
+    conn = db.get_connection()
+    fecha, ordenes, seq_inicial = _parametros(conn)
+    mes = fecha[:8] + "01", fecha[:8] + "31"
+    paso = max(1, len(ordenes) // 1000)
+    muestra = ordenes[::paso]  # órdenes repartidas por toda la tabla
+
+    def orden(i, desplazamiento=0):
+        return muestra[(i * 7 + desplazamiento) % len(muestra)]
+
+    def lote(i):
+        inicio = (i * tamano_bulk) % len(ordenes)
+        return ordenes[inicio:inicio + tamano_bulk]
+
+    def recorrer_paginas(obtener, paginas=20):
+        cursor, n = None, 0
+        for _ in range(paginas):
+            p = obtener(db.TAMANO_PAGINA, cursor)
+            n += len(p.avisos)
+            cursor = p.cursor
+            if not cursor:
+                break
+        return n
+
+    def exportar(avisos_iter, cambios=False):
+        with open(os.devnull, "w", encoding="utf-8") as f:
+            if cambios:
+                return escribir_json_cambios(f, avisos_iter, [], seq_inicial // 2, seq_inicial)
+            return escribir_json_todos(f, avisos_iter)
+
+    lecturas = {
+        "obtener_avisos_pendientes": lambda i: len(db.obtener_avisos_pendientes()),
+        "obtener_avisos_por_fecha": lambda i: len(db.obtener_avisos_por_fecha(fecha)),
+        "obtener_todos_los_avisos": lambda i: len(db.obtener_todos_los_avisos()),
+        "obtener_avisos_sin_fecha": lambda i: len(db.obtener_avisos_sin_fecha()),
+        "obtener_fechas_con_avisos": lambda i: len(db.obtener_fechas_con_avisos()),
+        "conteo_por_fecha (un mes)": lambda i: len(db.conteo_por_fecha(*mes)),
+        "buscar_avisos (selectiva)": lambda i: len(db.buscar_avisos(orden(i))),
+        "buscar_avisos (amplia)": lambda i: len(db.buscar_avisos("vigo")),
+        "buscar_avisos (varias palabras + fecha)": lambda i: len(db.buscar_avisos("calle mayor", fecha=fecha)),
+        "obtener_avisos_pagina (primera)": lambda i: len(db.obtener_avisos_pagina().avisos),
+        "obtener_avisos_pagina (20 páginas)": lambda i: recorrer_paginas(db.obtener_avisos_pagina),
+        "obtener_avisos_sin_fecha_pagina (20 páginas)": lambda i: recorrer_paginas(db.obtener_avisos_sin_fecha_pagina),
+        "iter_avisos (todo)": lambda i: _contar(db.iter_avisos()),
+        "iter_avisos (filtro estado)": lambda i: _contar(db.iter_avisos(filtro={"estado": "pendiente"})),
+        "iter_avisos_sin_fecha": lambda i: _contar(db.iter_avisos_sin_fecha()),
+        "ultimo_cambio": lambda i: db.ultimo_cambio(),
+        "cambios_desde (mitad)": lambda i: len(db.cambios_desde(seq_inicial // 2)),
+        "iter_avisos_cambiados (mitad)": lambda i: _contar(db.iter_avisos_cambiados(seq_inicial // 2)),
+        "exportar JSON (todos)": lambda i: exportar(db.iter_avisos()),
+        "exportar JSON (cambios, mitad)": lambda i: exportar(db.iter_avisos_cambiados(seq_inicial // 2), True),
+    }
+
+    def cacheada(i):
+        db.CACHE_MAX_ENTRADAS = 128
+        try:
+            return len(db.obtener_avisos_por_fecha(fecha))
+        finally:
+            db.CACHE_MAX_ENTRADAS = 0
+
+    def realizar(i):
+        try:
+            db.marcar_realizado(orden(i, 2))
+        except ValueError:
+            pass  # transición no permitida (el aviso ya estaba anulado o cancelado)
+        return 1
+
+    def anular(i):
+        try:
+            db.marcar_anulado(orden(i, 3), "bench")
+        except ValueError:
+            pass  # transición no permitida (el aviso ya estaba realizado)
+        return 1
+
+    def sincronas(i, n=100):
+        for k in range(n):
+            db.actualizar_aviso({"ordenInterna": orden(i * n + k, 4), "tecnico": "Bench"})
+        return n
+
+    def en_cola(i, n=100):
+        import cola_escritura
+        cola = cola_escritura.cola()
+        for k in range(n):
+            cola.encolar("actualizar_aviso", {"ordenInterna": orden(i * n + k, 5), "tecnico": "Bench"})
+        cola.vaciar()
+        return n
+
+    escrituras = {
+        "actualizar_aviso": lambda i: db.actualizar_aviso(
+            {"ordenInterna": orden(i), "tecnico": "Bench", "estado": "pendiente"}) or 1,
+        "actualizar_aviso_campos_basicos": lambda i: db.actualizar_aviso_campos_basicos(
+            orden(i, 1), cliente="Cliente bench", horaInicio="09:00", horaFin="11:00",
+            tecnico="Bench", turno="mañana", fechaVisita=fecha) or 1,
+        "marcar_realizado": realizar,
+        "marcar_anulado": anular,
+        "marcar_desanulado": lambda i: db.marcar_desanulado(orden(i, 3)) or 1,
+        f"actualizar_avisos_bulk ({tamano_bulk})": lambda i: len(db.actualizar_avisos_bulk(
+            [{"ordenInterna": o, "tecnico": "Bench", "turno": "tarde", "fechaVisita": fecha} for o in lote(i)])),
+        f"marcar_realizado_bulk ({tamano_bulk})": lambda i: len(db.marcar_realizado_bulk(lote(i + 1))),
+        f"marcar_anulado_bulk ({tamano_bulk})": lambda i: len(db.marcar_anulado_bulk(lote(i + 2), "bench")),
+        "compactar_cambios": lambda i: db.compactar_cambios(),
+        "actualizar_aviso x100 (síncrono)": sincronas,
+        "actualizar_aviso x100 (cola_escritura)": en_cola,
+    }
+
+    resultados = {}
+    cache_original = db.CACHE_MAX_ENTRADAS
+    db.CACHE_MAX_ENTRADAS = 0  # se mide la consulta, no la caché
+    try:
+        for nombre, fn in lecturas.items():
+            fn(0)  # calentamiento (caché de páginas de SQLite)
+            resultados[nombre] = _medir(fn, repeticiones)
+            print(f"  {nombre}: {resultados[nombre]['mediana_ms']} ms")
+        resultados["obtener_avisos_por_fecha (caché)"] = _medir(cacheada, repeticiones)
+        for nombre, fn in escrituras.items():
+            resultados[nombre] = _medir(fn, repeticiones)
+            print(f"  {nombre}: {resultados[nombre]['mediana_ms']} ms")
+    finally:
+        db.CACHE_MAX_ENTRADAS = cache_original
+    return resultados
+
+
+def benchmarks_importadores(filas_excel, semilla, tmp, repeticiones):
+    import db
+    import importar_excel
+    import app as app_flask
+
+    resultados = {}
+
+    ruta_importador = os.path.join(tmp, "importador.xlsx")
+    generar_datos.crear_excel(ruta_importador, filas_excel, "importador", semilla)
+
+    def importar_tk(i):
+        destino = os.path.join(tmp, f"importador_{i}.db")
+        return importar_excel.importar_archivo(ruta_importador, destino)["insertados"]
+    resultados[f"importar_excel.importar_archivo ({filas_excel})"] = _medir(importar_tk, repeticiones)
+
+    # sin la lectura del libro: normalización por columnas + executemany
+    import pandas as pd
+    df_importador = pd.read_excel(ruta_importador)
+
+    def importar_df(i):
+        destino = os.path.join(tmp, f"importador_df_{i}.db")
+        with importar_excel._en_base(destino):
+            return importar_excel.importar_dataframe(df_importador)["insertados"]
+    resultados[f"importar_excel.importar_dataframe ({filas_excel})"] = _medir(importar_df, repeticiones)
+
+    # reimportación con un 1% de filas corregidas: solo se escribe ese 1%
+    df_corregido = df_importador.copy()
+    df_corregido.loc[::100, "CLIENTE"] = df_corregido.loc[::100, "CLIENTE"] + " (corregido)"
+    versiones = [df_importador, df_corregido]
+
+    def reimportar_df(i):
+        with importar_excel._en_base(os.path.join(tmp, "importador_df_0.db")):
+            return importar_excel.importar_dataframe(versiones[(i + 1) % 2])["actualizados"]
+    resultados[f"importar_excel.importar_dataframe reimportar 1% ({filas_excel})"] = _medir(
+        reimportar_df, repeticiones)
+
+    # app.py lee siempre EXCEL_PATH e importa en db.DB_PATH: base vacía propia
+    ruta_flask = os.path.join(tmp, "rutas.xlsx")
+    generar_datos.crear_excel(ruta_flask, filas_excel, "flask", semilla)
+    ruta_original, db_original = app_flask.EXCEL_PATH, db.DB_PATH
+    app_flask.EXCEL_PATH = ruta_flask
+    db.cerrar_conexiones()
+    db.DB_PATH = os.path.join(tmp, "flask.db")
+    try:
+        cliente = app_flask.app.test_client()
+        seleccion = [str(r) for r in generar_datos.dataframe_flask(filas_excel, semilla)["reparacion"]]
+
+        def importar_flask(i):
+            respuesta = cliente.post("/importar", data={"seleccion": seleccion})
+            assert respuesta.status_code in (200, 302), respuesta.status_code
+            return len(seleccion)
+        # primera pasada: todo nuevo; las siguientes: todo duplicado
+        resultados[f"app.importar nuevas ({filas_excel})"] = _medir(importar_flask, 1)
+        resultados[f"app.importar duplicadas ({filas_excel})"] = _medir(importar_flask, repeticiones)
+
+        def index_flask(i):
+            respuesta = cliente.get("/")
+            assert respuesta.status_code == 200, respuesta.status_code
+            return filas_excel
+        resultados[f"app.index ({filas_excel})"] = _medir(index_flask, repeticiones)
+    finally:
+        app_flask.EXCEL_PATH = ruta_original
+        db.cerrar_conexiones()
+        db.DB_PATH = db_original
+    for nombre, r in resultados.items():
+        print(f"  {nombre}: {r['mediana_ms']} ms")
+    return resultados
+
+
+def _meta(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "sqlite": sqlite3.sqlite_version,
+        "plataforma": platform.platform(),
+        "semilla": args.semilla,
+        "repeticiones": args.repeticiones,
+    }
+
+
+def comparar(actual, anterior):
+    """Imprime la relación mediana_actual / mediana_anterior de cada benchmark común."""
+    print(f"\nComparación con {anterior['meta'].get('commit')} ({anterior['meta'].get('fecha')}):")
+    regresiones = 0
+    for tamano, benchs in actual["resultados"].items():
+        previos = anterior["resultados"].get(tamano, {})
+        for nombre, r in benchs.items():
+            if nombre not in previos or not previos[nombre]["mediana_ms"]:
+                continue
+            ratio = r["mediana_ms"] / previos[nombre]["mediana_ms"]
+            marca = "  <-- más lento" if ratio >= UMBRAL_REGRESION else ""
+            regresiones += bool(marca)
+            print(f"  [{tamano}] {nombre}: {previos[nombre]['mediana_ms']} -> {r['mediana_ms']} ms (x{ratio:.2f}){marca}")
+    print(f"{regresiones} benchmarks al menos un {round((UMBRAL_REGRESION - 1) * 100)}% más lentos.")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanos", default="10000,100000", help="Filas de cada base, separadas por comas")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--tamano-bulk", type=int, default=1000, help="Órdenes por operación masiva")
+    parser.add_argument("--filas-excel", type=int, default=5000, help="Filas de los libros Excel a importar")
+    parser.add_argument("--semilla", type=int, default=1234)
+    parser.add_argument("--dir-datos", help="Guardar y reutilizar aquí las bases generadas")
+    parser.add_argument("--salida", default="benchmark_resultados.json")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior")
+    parser.add_argument("--sin-importadores", action="store_true")
+    args = parser.parse_args()
+
+    import db
+    resultados = {"meta": _meta(args), "resultados": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        for filas in [int(t) for t in args.tamanos.split(",") if t.strip()]:
+            print(f"\n== {filas} avisos ==")
+            inicio = time.perf_counter()
+            ruta = _preparar_db(filas, args.semilla, args.dir_datos, tmp)
+            print(f"  base lista en {time.perf_counter() - inicio:.1f} s")
+            db.cerrar_conexiones()
+            db.DB_PATH = ruta
+            resultados["resultados"][str(filas)] = benchmarks_db(args.repeticiones, args.tamano_bulk)
+            db.cerrar_conexiones()
+            os.remove(ruta)
+        if not args.sin_importadores:
+            print(f"\n== importadores ({args.filas_excel} filas) ==")
+            resultados["resultados"]["importadores"] = benchmarks_importadores(
+                args.filas_excel, args.semilla, tmp, args.repeticiones)
+
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(resultados, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Compara el pico de memoria (RSS) de leer todos los avisos como lista
+(db.obtener_todos_los_avisos) frente a recorrerlos con db.iter_avisos, y el de
+importar un libro Excel entero con pandas frente a hacerlo por bloques.
+
+Uso:
+    python benchmark_memoria.py --filas 200000
+    python benchmark_memoria.py --filas-excel 100000
+Cada modo se ejecuta en un proceso aparte para que los picos no se mezclen.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import generar_datos
+
+
+def _pico_rss_mb():
+    # VmHWM es del propio proceso; ru_maxrss (KiB en Linux) hereda el pico del padre
+    # que lo lanzó, y el padre puede haber generado antes un libro grande
+    try:
+        with open("/proc/self/status") as f:
+            for linea in f:
+                if linea.startswith("VmHWM:"):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def generar_db(ruta, filas, semilla=1234):
+    generar_datos.crear_db(ruta, filas, semilla)
+
+
+def _medir(modo, excel=None):
+    import db
+    import importar_excel
+    from exportacion import normalizar_aviso
+
+    base = _pico_rss_mb()
+    inicio = time.perf_counter()
+    n = 0
+    if modo == "excel_pandas":
+        import pandas as pd
+        n = importar_excel.importar_dataframe(pd.read_excel(excel))["insertados"]
+    elif modo == "excel_bloques":
+        n = importar_excel.importar_archivo(excel)["insertados"]
+    elif modo == "lista":
+        for av in db.obtener_todos_los_avisos():
+            normalizar_aviso(av)
+            n += 1
+    else:
+        for av in db.iter_avisos():
+            normalizar_aviso(av)
+            n += 1
+    print(f"{modo}\t{n}\t{time.perf_counter() - inicio:.2f}\t{base:.1f}\t{_pico_rss_mb():.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=200000)
+    parser.add_argument("--db", help="Usar una base existente en lugar de generar una")
+    parser.add_argument("--filas-excel", type=int, help="Medir la importación de un libro de N filas")
+    parser.add_argument("--modo", choices=["lista", "iterador", "excel_pandas", "excel_bloques"],
+                        help=argparse.SUPPRESS)
+    parser.add_argument("--excel", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.modo:
+        _medir(args.modo, args.excel)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.filas_excel:
+            excel = os.path.join(tmp, "importador.xlsx")
+            print(f"Generando libro de {args.filas_excel} filas...")
+            generar_datos.crear_excel(excel, args.filas_excel, "importador")
+            print("modo\tfilas\tsegundos\tRSS base (MB)\tRSS pico (MB)")
+            for modo in ("excel_pandas", "excel_bloques"):
+                # base vacía por modo: los dos insertan todas las filas
+                env = dict(os.environ, DB_PATH=os.path.join(tmp, f"{modo}.db"))
+                salida = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--modo", modo, "--excel", excel],
+                    env=env, capture_output=True, text=True, check=True,
+                )
+                print(salida.stdout.strip())
+            return
+        ruta = args.db
+        if not ruta:
+            ruta = os.path.join(tmp, "avisos_bench.db")
+            print(f"Generando {args.filas} avisos sintéticos...")
+            generar_db(ruta, args.filas)
+        print("modo\tfilas\tsegundos\tRSS base (MB)\tRSS pico (MB)")
+        for modo in ("lista", "iterador"):
+            env = dict(os.environ, DB_PATH=ruta)
+            salida = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--modo", modo],
+                env=env, capture_output=True, text=True, check=True,
+            )
+            print(salida.stdout.strip())
+
+
+if __name__ == "__main__":
+    main()
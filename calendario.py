@@ -1,14 +1,19 @@
 
 from PySide6.QtWidgets import QCalendarWidget
-from PySide6.QtGui import QTextCharFormat, QColor
+from PySide6.QtGui import QTextCharFormat, QColor, QFont
 from PySide6.QtCore import QDate, Signal
 import json
 import db  # import del módulo completo para evitar import circular
 
 class CalendarioAvisos(QCalendarWidget):
-    """Calendario que colorea días y emite señal con fecha seleccionada al hacer clic."""
+    """Calendario que colorea días según su carga y emite señal con fecha seleccionada al hacer clic."""
     fecha_clicked = Signal(str)  # emite fecha "yyyy-MM-dd" cuando el usuario hace click en un día
 
+    # avisos activos (no anulados ni cancelados) que caben en un día; por encima, sobrecargado
+    CAPACIDAD_DIA = 8
+    # colores del mapa de calor: vacío, ligero, cargado (>= 75% de la capacidad), sobrecargado
+    COLORES_CARGA = ("#F7FAFC", "#C6F6D5", "#FEEBC8", "#FEB2B2")
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setGridVisible(True)
@@ -18,6 +23,7 @@ class CalendarioAvisos(QCalendarWidget):
 
         # Estructuras internas
         self._fechas_con_avisos_set = set()  # set de strings "yyyy-MM-dd" para lookup rápido
+        self._conteos = {}  # "yyyy-MM-dd" -> {"total", "activos", "turnos", "estados"}
         self.festivos = []
 
         # Señales para recolorear al cambiar de mes
@@ -36,27 +42,25 @@ class CalendarioAvisos(QCalendarWidget):
         self.festivos = self._cargar_festivos()
 
     def _cargar_fechas_con_avisos(self):
-        """Carga las fechas con avisos. Usa db.obtener_fechas_con_avisos() si existe;
-        si no, las calcula desde db.obtener_todos_los_avisos()."""
-        fechas = []
+        """Carga, solo para el rango visible (minimumDate..maximumDate), los avisos
+        de cada día desglosados por turno y estado (db.conteo_por_fecha)."""
+        desde = self.minimumDate().toString("yyyy-MM-dd")
+        hasta = self.maximumDate().toString("yyyy-MM-dd")
+        conteos = {}
         try:
-            obtener_fechas = getattr(db, "obtener_fechas_con_avisos", None)
-            if callable(obtener_fechas):
-                fechas = obtener_fechas() or []
-            else:
-                # Fallback: derivar a partir de todos los avisos
-                fechas = []
-                try:
-                    for a in db.obtener_todos_los_avisos():
-                        f = (a.get("fechaVisita") or "").strip() if a.get("fechaVisita") is not None else ""
-                        if f:
-                            fechas.append(f)
-                except Exception:
-                    fechas = []
+            for fila in db.conteo_por_fecha(desde, hasta, incluir_archivo=True):
+                dia = conteos.setdefault(str(fila.fecha).strip(), {"total": 0, "activos": 0, "turnos": {}, "estados": {}})
+                turno = (fila.turno or "").strip().lower() or "sin turno"
+                estado = (fila.estado or "").strip().lower() or "sin estado"
+                dia["total"] += fila.n
+                if db.codigo_estado(fila.estado) not in (db.ESTADO_ANULADO, db.ESTADO_CANCELADO):
+                    dia["activos"] += fila.n
+                dia["turnos"][turno] = dia["turnos"].get(turno, 0) + fila.n
+                dia["estados"][estado] = dia["estados"].get(estado, 0) + fila.n
         except Exception:
-            fechas = []
-        # Normalizar a set
-        self._fechas_con_avisos_set = {str(f).strip() for f in fechas if f}
+            conteos = {}
+        self._conteos = conteos
+        self._fechas_con_avisos_set = set(conteos)
 
     def _cargar_festivos(self):
         """Carga lista de fechas festivas desde assets/festivos.json (lista de 'yyyy-MM-dd')."""
@@ -89,43 +93,43 @@ class CalendarioAvisos(QCalendarWidget):
         self.fecha_clicked.connect(callback)
 
     # ----------------------- Pintado -----------------------
+    def _nivel_carga(self, activos):
+        if activos <= 0:
+            return 0
+        if activos > self.CAPACIDAD_DIA:
+            return 3
+        return 2 if activos * 4 >= self.CAPACIDAD_DIA * 3 else 1
+
+    def _resumen_dia(self, conteo):
+        turnos = ", ".join(f"{n} {t}" for t, n in sorted(conteo["turnos"].items()))
+        estados = ", ".join(f"{n} {e}" for e, n in sorted(conteo["estados"].items()))
+        return f"{conteo['total']} avisos ({turnos})\n{estados}"
+
     def colorear_dias(self):
-        """Aplica formatos de color a las fechas dentro del rango min/max, según reglas:
+        """Aplica formatos de color a las fechas dentro del rango min/max:
         - Festivos y fines de semana -> gris
-        - Con avisos -> amarillo
-        - Sin avisos -> verde (como antes)
+        - Resto -> mapa de calor según avisos activos frente a CAPACIDAD_DIA
+          (vacío, ligero, cargado, sobrecargado), con el desglose en el tooltip
         """
-        fmt_reset = QTextCharFormat()
-
         fmt_festivo = QTextCharFormat()
         fmt_festivo.setBackground(QColor("#d3d3d3"))  # gris claro
 
-        fmt_con_avisos = QTextCharFormat()
-        fmt_con_avisos.setBackground(QColor("#ffd700"))  # amarillo dorado
-
-        fmt_sin_avisos = QTextCharFormat()
-        fmt_sin_avisos.setBackground(QColor("#C6F6D5"))  # verde suave
-
-        # Limpiar primero el rango visible (usamos min/max fijados)
-        visible_start = self.minimumDate()
+        fecha = QDate(self.minimumDate())
         visible_end = self.maximumDate()
-
-        # Reset de formato en rango
-        fecha = QDate(visible_start)
-        while fecha <= visible_end:
-            self.setDateTextFormat(fecha, fmt_reset)
-            fecha = fecha.addDays(1)
-
-        # Aplicar reglas
-        fecha = QDate(visible_start)
         while fecha <= visible_end:
             fecha_str = fecha.toString("yyyy-MM-dd")
+            conteo = self._conteos.get(fecha_str)
             if fecha_str in self.festivos or fecha.dayOfWeek() in (6, 7):
-                self.setDateTextFormat(fecha, fmt_festivo)
-            elif fecha_str in self._fechas_con_avisos_set:
-                self.setDateTextFormat(fecha, fmt_con_avisos)
+                fmt = QTextCharFormat(fmt_festivo)
             else:
-                self.setDateTextFormat(fecha, fmt_sin_avisos)
+                fmt = QTextCharFormat()
+                nivel = self._nivel_carga(conteo["activos"] if conteo else 0)
+                fmt.setBackground(QColor(self.COLORES_CARGA[nivel]))
+                if nivel == 3:
+                    fmt.setFontWeight(QFont.Bold)
+            if conteo:
+                fmt.setToolTip(self._resumen_dia(conteo))
+            self.setDateTextFormat(fecha, fmt)
             fecha = fecha.addDays(1)
 
     # ----------------------- Señales -----------------------
@@ -0,0 +1,232 @@
+"""
+Cola de escritura en segundo plano (write-behind) para las acciones de la interfaz.
+
+Las ventanas encolan mutaciones (funciones de escritura de db.py) y siguen sin
+esperar al disco. Un único hilo escritor junta lo que llega en VENTANA_MS y lo
+aplica en una sola transacción (un solo fsync por lote); cada mutación va en su
+SAVEPOINT, así que si una falla las demás se confirman igual. Los resultados
+llegan por señales Qt, ya en el hilo de la interfaz:
+
+    c = cola_escritura.cola()
+    c.aplicada.connect(...)        # (Mutacion, resultado)
+    c.fallida.connect(...)         # (Mutacion, mensaje)
+    c.encolar("marcar_realizado", orden, orden=orden)
+
+EscrituraOptimista añade, por ventana, los cambios locales que se muestran
+mientras la mutación está en cola y que se descartan si falla.
+"""
+import atexit
+import itertools
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, NamedTuple, Optional
+
+from PySide6.QtCore import QObject, Signal
+
+import db
+
+VENTANA_MS = 20   # espera tras la primera mutación para juntar las siguientes
+MAX_LOTE = 200
+
+# funciones de db.py que se pueden encolar
+ESCRITURAS = {
+    "actualizar_aviso", "actualizar_aviso_campos_basicos", "marcar_realizado",
+    "marcar_anulado", "marcar_desanulado", "actualizar_avisos_bulk",
+    "marcar_realizado_bulk", "marcar_anulado_bulk",
+}
+
+class Mutacion(NamedTuple):
+    id: int
+    funcion: str
+    args: tuple
+    kwargs: dict
+    orden: Optional[str]  # aviso afectado (para los cambios locales), si es uno
+
+_FIN = object()
+
+class ColaEscritura(QObject):
+    aplicada = Signal(object, object)  # (Mutacion, resultado), tras el commit
+    fallida = Signal(object, str)      # (Mutacion, mensaje); no se aplicó nada de ella
+    lote_terminado = Signal(int)       # número de mutaciones del lote, tras sus señales
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._cola = queue.Queue()
+        self._ids = itertools.count(1)
+        self._hilo = None
+        self._hilo_lock = threading.Lock()
+
+    def encolar(self, funcion: str, *args, orden: Optional[str] = None, **kwargs) -> Mutacion:
+        """Encola db.funcion(*args, **kwargs) y vuelve enseguida."""
+        if funcion not in ESCRITURAS:
+            raise ValueError(f"Función de escritura no válida: {funcion}")
+        mutacion = Mutacion(next(self._ids), funcion, args, kwargs, orden)
+        with self._hilo_lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name="cola_escritura", daemon=True)
+                self._hilo.start()
+            self._cola.put(mutacion)
+        return mutacion
+
+    def pendientes(self) -> int:
+        """Mutaciones encoladas o en curso."""
+        return self._cola.unfinished_tasks
+
+    def vaciar(self):
+        """Bloquea hasta que se haya aplicado todo lo encolado."""
+        self._cola.join()
+
+    def cerrar(self):
+        """Aplica lo pendiente y para el hilo (encolar() lo vuelve a arrancar)."""
+        with self._hilo_lock:
+            hilo, self._hilo = self._hilo, None
+            if hilo is None or not hilo.is_alive():
+                return
+            self._cola.put(_FIN)
+        hilo.join()
+
+    def _bucle(self):
+        while True:
+            primera = self._cola.get()
+            if primera is _FIN:
+                self._cola.task_done()
+                return
+            lote, fin = [primera], False
+            limite = time.monotonic() + VENTANA_MS / 1000
+            while len(lote) < MAX_LOTE:
+                try:
+                    siguiente = self._cola.get(timeout=max(limite - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if siguiente is _FIN:
+                    fin = True
+                    break
+                lote.append(siguiente)
+            try:
+                self._aplicar(lote)
+            finally:
+                for _ in range(len(lote) + fin):
+                    self._cola.task_done()
+            if fin:
+                return
+
+    def _aplicar(self, lote):
+        resultados = []
+        try:
+            with db.transaccion() as conn:
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                for mutacion in lote:
+                    try:
+                        # anidada: SAVEPOINT propio dentro de la transacción del lote
+                        with db.transaccion():
+                            resultado = getattr(db, mutacion.funcion)(*mutacion.args, **mutacion.kwargs)
+                    except Exception as e:
+                        resultados.append((mutacion, None, str(e) or type(e).__name__))
+                    else:
+                        resultados.append((mutacion, resultado, None))
+        except sqlite3.Error as e:
+            # falló el BEGIN o el commit: no se aplicó ninguna
+            resultados = [(m, None, f"Error de base de datos: {e}") for m in lote]
+        try:
+            for mutacion, resultado, error in resultados:
+                if error is None:
+                    self.aplicada.emit(mutacion, resultado)
+                else:
+                    self.fallida.emit(mutacion, error)
+            self.lote_terminado.emit(len(lote))
+        except RuntimeError:
+            pass  # objeto Qt ya destruido (cierre de la aplicación)
+
+class EscrituraOptimista(QObject):
+    """
+    Para una ventana: encola mutaciones junto con el cambio que producen en su
+    aviso, que aplicar() superpone a lo leído de la base hasta que se confirman.
+    Si una falla se descarta su cambio local y se emite `error`; tras cada lote
+    con mutaciones propias se emite `refrescar` para releer la base.
+    """
+    refrescar = Signal()
+    error = Signal(object, str)  # (Mutacion, mensaje)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._cambios: Dict[str, dict] = {}   # orden -> campos de Aviso
+        self._en_cola = Counter()             # orden -> mutaciones sin resolver
+        self._mias: Dict[int, Optional[str]] = {}
+        self._sucio = False
+        c = cola()
+        c.aplicada.connect(self._on_aplicada)
+        c.fallida.connect(self._on_fallida)
+        c.lote_terminado.connect(self._on_lote_terminado)
+
+    def encolar(self, funcion: str, *args, orden: Optional[str] = None,
+                cambios: Optional[dict] = None, **kwargs) -> Mutacion:
+        mutacion = cola().encolar(funcion, *args, orden=orden, **kwargs)
+        self._mias[mutacion.id] = orden
+        if orden and cambios:
+            cambios = dict(cambios)
+            if "estado" in cambios:
+                cambios["estado_code"] = db.codigo_estado(cambios["estado"])
+            self._cambios[orden] = {**self._cambios.get(orden, {}), **cambios}
+            self._en_cola[orden] += 1
+        return mutacion
+
+    def aplicar(self, avisos, visible: Optional[Callable] = None) -> list:
+        """Avisos con los cambios locales aplicados; `visible` descarta los que ya no tocan."""
+        if not self._cambios:
+            return avisos
+        resultado = []
+        for aviso in avisos:
+            cambios = self._cambios.get(aviso.get("ordenInterna"))
+            if cambios:
+                aviso = aviso._replace(**cambios)
+                if visible is not None and not visible(aviso):
+                    continue
+            resultado.append(aviso)
+        return resultado
+
+    def _resolver(self, mutacion, descartar: bool):
+        orden = self._mias.pop(mutacion.id)
+        self._sucio = True
+        if orden not in self._en_cola:
+            return
+        self._en_cola[orden] -= 1
+        if descartar or self._en_cola[orden] <= 0:
+            self._cambios.pop(orden, None)
+            if self._en_cola[orden] <= 0:
+                del self._en_cola[orden]
+
+    def _on_aplicada(self, mutacion, _resultado):
+        if mutacion.id in self._mias:
+            self._resolver(mutacion, descartar=False)
+
+    def _on_fallida(self, mutacion, mensaje):
+        if mutacion.id in self._mias:
+            self._resolver(mutacion, descartar=True)
+            self.error.emit(mutacion, mensaje)
+
+    def _on_lote_terminado(self, _n):
+        if self._sucio:
+            self._sucio = False
+            self.refrescar.emit()
+
+_cola = None
+_cola_lock = threading.Lock()
+
+def cola() -> ColaEscritura:
+    """Cola compartida por toda la aplicación (un solo hilo escritor)."""
+    global _cola
+    with _cola_lock:
+        if _cola is None:
+            _cola = ColaEscritura()
+        return _cola
+
+def cerrar():
+    """Aplica lo pendiente antes de salir (se registra con atexit)."""
+    if _cola is not None:
+        _cola.cerrar()
+
+atexit.register(cerrar)
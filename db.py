@@ -1,103 +1,1217 @@
 
 import os
+import re
+import json
+import time
+import base64
+import atexit
+import bisect
+import inspect
+import logging
 import sqlite3
-from typing import List, Dict, Optional
+import functools
+import threading
+import unicodedata
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Iterator, Iterable, NamedTuple
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "avisos.db")
+DB_PATH = os.environ.get("DB_PATH") or os.path.join(os.path.dirname(__file__), "avisos.db")
+# base aparte (ATTACH ... AS archivo) para los avisos archivados; None: avisos_archivo en DB_PATH
+DB_ARCHIVO_PATH = os.environ.get("DB_ARCHIVO_PATH") or None
 
-def get_connection():
-    conn = sqlite3.connect(DB_PATH)
+# --- Conexiones ---
+# Cada hilo reutiliza su propia conexión (sqlite3 no admite uso concurrente de
+# una misma conexión). Cuando un hilo termina, su conexión vuelve a un pool de
+# libres para el siguiente hilo (p.ej. los hilos por petición de Flask).
+
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KIB = 16384  # caché de páginas por conexión (~16 MB)
+MAX_CONEXIONES_LIBRES = 4
+
+_local = threading.local()
+_pool_lock = threading.Lock()
+_conexiones_en_uso = {}   # threading.Thread -> sqlite3.Connection
+_conexiones_libres = []
+_generacion_pool = 0      # cambia en cada cerrar_conexiones()
+
+def _abrir_conexion() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    # WAL: los lectores (app de escritorio / Flask) no bloquean al escritor
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(BUSY_TIMEOUT_MS)}")
+    conn.execute(f"PRAGMA cache_size=-{int(CACHE_SIZE_KIB)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.create_function("coincide_busqueda", -1, _coincide_busqueda, deterministic=True)
     return conn
 
-def _row_to_dict(row: sqlite3.Row) -> Dict:
-    return dict(row) if row else {}
+def _recuperar_conexiones_de_hilos_muertos():
+    """Devuelve al pool las conexiones de hilos que ya terminaron (llamar con _pool_lock)."""
+    for hilo in [h for h in _conexiones_en_uso if not h.is_alive()]:
+        conn = _conexiones_en_uso.pop(hilo)
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            pass
+        if len(_conexiones_libres) < MAX_CONEXIONES_LIBRES:
+            _conexiones_libres.append(conn)
+        else:
+            conn.close()
 
-# --- Lectura ---
+def get_connection() -> sqlite3.Connection:
+    """Conexión del hilo actual (se abre una sola vez y se reutiliza)."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "generacion", None) == _generacion_pool:
+        return conn
+    with _pool_lock:
+        _recuperar_conexiones_de_hilos_muertos()
+        conn = _conexiones_libres.pop() if _conexiones_libres else None
+        nueva = conn is None
+        if nueva:
+            conn = _abrir_conexion()
+        _conexiones_en_uso[threading.current_thread()] = conn
+        _local.conn = conn
+        _local.generacion = _generacion_pool
+    if not _esquema_listo:
+        _asegurar_esquema(conn)
+    if nueva and DB_ARCHIVO_PATH:
+        _adjuntar_archivo(conn)
+    return conn
 
-def obtener_avisos_pendientes() -> List[Dict]:
+@contextmanager
+def transaccion():
+    """
+    Ejecuta el bloque en una transacción: commit al salir, rollback si hay excepción.
+    Dentro de otra transacción ya abierta usa un SAVEPOINT: si el bloque falla solo
+    se deshace lo suyo, y el commit queda para la transacción de fuera.
+    """
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT 
-            idAviso, ordenInterna, cliente, direccion, localidad, codigoPostal,
-            telefono1, telefono2, aparato, marca, modelo, fechaAsignacion, averia,
-            tipoServicio, conCargo, importe, metodoPago, observacionesCobro,
-            estado, fechaVisita, tecnico, turno, proveedor, estadoCita, tipoOperacion,
-            horaInicio, horaFin
-        FROM avisos
-        WHERE (estado IS NULL OR TRIM(estado) = '' OR LOWER(estado) LIKE 'pend%')
-        ORDER BY fechaVisita ASC, horaInicio ASC
+    try:
+        if not conn.in_transaction:
+            with conn:
+                yield conn
+            return
+        conn.execute("SAVEPOINT transaccion")
+        try:
+            yield conn
+        except BaseException:
+            try:
+                conn.execute("ROLLBACK TO transaccion")
+                conn.execute("RELEASE transaccion")
+            except sqlite3.Error:
+                pass  # SQLite ya deshizo la transacción entera
+            raise
+        conn.execute("RELEASE transaccion")
+    finally:
+        _registrar_escritura()
+
+@contextmanager
+def carga_masiva():
+    """
+    Como transaccion(), para insertar muchos avisos de una vez: el índice FTS y el
+    registro de cambios se alimentan al final con un INSERT ... SELECT cada uno en
+    lugar de fila a fila desde sus triggers (FTS5 vuelca su buffer en cada sentencia
+    de trigger y una carga grande se vuelve cuadrática). Solo afecta a los INSERT
+    del bloque; antes de actualizar avisos que pueden haberse insertado en él hay
+    que llamar a _volcar_carga_masiva. Anidada dentro de otra, no hace nada propio.
+    """
+    with transaccion() as conn:
+        if getattr(_local, "carga_masiva", None) is not None:
+            yield conn
+            return
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")  # los DROP TRIGGER deben poder deshacerse
+        hay_fts = _hay_fts(conn)
+        ultimo = conn.execute("SELECT COALESCE(MAX(idAviso), 0) FROM avisos").fetchone()[0]
+        if hay_fts:
+            conn.execute("DROP TRIGGER IF EXISTS avisos_fts_ai")
+        conn.execute("DROP TRIGGER IF EXISTS avisos_changes_ai")
+        _local.carga_masiva = {"ultimo": ultimo, "fts": hay_fts}
+        try:
+            yield conn
+            _volcar_carga_masiva(conn)
+        finally:
+            _local.carga_masiva = None
+        if hay_fts:
+            conn.execute(_SQL_TRIGGER_FTS_ALTA)
+        conn.execute(_SQL_TRIGGER_CAMBIOS_ALTA)
+
+def _volcar_carga_masiva(conn):
+    """
+    Dentro de carga_masiva, indexa y registra ya los avisos insertados hasta ahora.
+    Los UPDATE de avisos mandan a FTS5 un 'delete' de la fila vieja, y si esa fila
+    aún no está en el índice FTS5 da la base por corrupta ("database disk image is
+    malformed"). Fuera de carga_masiva no hace nada.
+    """
+    carga = getattr(_local, "carga_masiva", None)
+    if carga is None:
+        return
+    ultimo = conn.execute("SELECT COALESCE(MAX(idAviso), 0) FROM avisos").fetchone()[0]
+    if ultimo <= carga["ultimo"]:
+        return
+    if carga["fts"]:
+        cols = ", ".join(_COLUMNAS_FTS)
+        conn.execute(f"""
+            INSERT INTO avisos_fts(rowid, {cols})
+            SELECT idAviso, {cols} FROM avisos WHERE idAviso > ?
+        """, (carga["ultimo"],))
+    conn.execute("""
+        INSERT INTO avisos_changes(idAviso, ordenInterna, op)
+        SELECT idAviso, ordenInterna, 'I' FROM avisos WHERE idAviso > ? ORDER BY idAviso
+    """, (carga["ultimo"],))
+    carga["ultimo"] = ultimo
+
+def cerrar_conexiones():
+    """
+    Cierra todas las conexiones abiertas (hook de apagado; se registra con atexit).
+    La siguiente conexión vuelve a comprobar el esquema, por si DB_PATH ha cambiado.
+    """
+    global _generacion_pool, _esquema_listo
+    with _pool_lock:
+        conexiones = list(_conexiones_en_uso.values()) + _conexiones_libres
+        _conexiones_en_uso.clear()
+        _conexiones_libres.clear()
+        _generacion_pool += 1
+    with _esquema_lock:
+        _esquema_listo = False
+    for conn in conexiones:
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute("PRAGMA optimize")
+            conn.close()
+        except sqlite3.Error:
+            pass
+    _local.conn = None
+
+atexit.register(cerrar_conexiones)
+
+def _adjuntar_archivo(conn):
+    """
+    Adjunta DB_ARCHIVO_PATH como "archivo". Una vista de main no puede leer de una
+    base adjunta, así que se crean vistas TEMP (por conexión): avisos_archivo, que
+    al leer tapa a la tabla de main del mismo nombre (incluye lo que se archivó
+    antes de separar el archivo), y avisos_todos.
+    """
+    conn.execute("ATTACH DATABASE ? AS archivo", (DB_ARCHIVO_PATH,))
+    conn.execute(_sql_tabla_archivo("archivo"))
+    conn.execute("CREATE INDEX IF NOT EXISTS archivo.idx_archivo_fecha_hora ON avisos_archivo(fechaVisita, horaInicio)")
+    conn.execute(f"""
+        CREATE TEMP VIEW IF NOT EXISTS avisos_archivo AS
+            SELECT {_COLUMNAS_SELECT} FROM main.avisos_archivo
+            UNION ALL SELECT {_COLUMNAS_SELECT} FROM archivo.avisos_archivo
+    """)
+    conn.execute(_sql_vista_todos("temp", "temp.avisos_archivo"))
+
+# --- Esquema ---
+# Bootstrap versionado (PRAGMA user_version): se ejecuta una vez por proceso,
+# al abrir la primera conexión. Cada migración se aplica una sola vez.
+
+
+_COLUMNAS_TIPOS = [
+    ("ordenInterna", "TEXT"), ("cliente", "TEXT"), ("direccion", "TEXT"),
+    ("localidad", "TEXT"), ("codigoPostal", "TEXT"), ("telefono1", "TEXT"),
+    ("telefono2", "TEXT"), ("aparato", "TEXT"), ("marca", "TEXT"), ("modelo", "TEXT"),
+    ("fechaAsignacion", "TEXT"), ("averia", "TEXT"), ("tipoServicio", "TEXT"),
+    ("conCargo", "BOOLEAN"), ("importe", "REAL"), ("metodoPago", "TEXT"),
+    ("observacionesCobro", "TEXT"), ("estado", "TEXT"), ("fechaVisita", "TEXT"),
+    ("tecnico", "TEXT"), ("turno", "TEXT"), ("proveedor", "TEXT"), ("estadoCita", "TEXT"),
+    ("tipoOperacion", "TEXT"), ("horaInicio", "TEXT"), ("horaFin", "TEXT"),
+]
+
+# Estados normalizados: avisos.estado_code (columna generada a partir de estado)
+# y tabla de consulta "estados". El texto de estado se sigue guardando tal cual.
+ESTADO_SIN_ESTADO = 0     # NULL o ''
+ESTADO_SIN_ASIGNAR = 1
+ESTADO_PENDIENTE = 2
+ESTADO_REALIZADO = 3
+ESTADO_ANULADO = 4
+ESTADO_CANCELADO = 5
+ESTADO_REACTIVABLE = 6
+ESTADO_OTRO = 7           # cualquier otro texto
+
+NOMBRES_ESTADO = {
+    ESTADO_SIN_ESTADO: "", ESTADO_SIN_ASIGNAR: "sin asignar", ESTADO_PENDIENTE: "pendiente",
+    ESTADO_REALIZADO: "realizado", ESTADO_ANULADO: "anulado", ESTADO_CANCELADO: "cancelado",
+    ESTADO_REACTIVABLE: "reactivable", ESTADO_OTRO: "otro",
+}
+ESTADOS_CERRADOS = (ESTADO_REALIZADO, ESTADO_ANULADO, ESTADO_CANCELADO)
+# lo que muestran los listados "sin anulados" (anulados y cancelados fuera)
+ESTADOS_VISIBLES = (ESTADO_SIN_ESTADO, ESTADO_SIN_ASIGNAR, ESTADO_PENDIENTE, ESTADO_REALIZADO,
+                    ESTADO_REACTIVABLE, ESTADO_OTRO)
+
+# prefijo (en minúsculas, sin espacios alrededor) -> código; el resto es ESTADO_OTRO
+_PREFIJOS_ESTADO = [("sin asignar", ESTADO_SIN_ASIGNAR), ("pend", ESTADO_PENDIENTE),
+                    ("realiz", ESTADO_REALIZADO), ("anul", ESTADO_ANULADO),
+                    ("canc", ESTADO_CANCELADO), ("reactiv", ESTADO_REACTIVABLE)]
+
+_SQL_CODIGO_ESTADO = "CASE WHEN estado IS NULL OR TRIM(estado) = '' THEN 0 " + " ".join(
+    f"WHEN LOWER(TRIM(estado)) LIKE '{p}%' THEN {c}" for p, c in _PREFIJOS_ESTADO
+) + f" ELSE {ESTADO_OTRO} END"
+
+# transiciones permitidas (además de quedarse en el mismo estado)
+_ABIERTOS = {ESTADO_SIN_ESTADO, ESTADO_SIN_ASIGNAR, ESTADO_PENDIENTE, ESTADO_REACTIVABLE, ESTADO_OTRO}
+TRANSICIONES = {
+    **{e: set(NOMBRES_ESTADO) - {ESTADO_OTRO} for e in _ABIERTOS},
+    ESTADO_REALIZADO: {ESTADO_PENDIENTE, ESTADO_REACTIVABLE},
+    ESTADO_ANULADO: {ESTADO_PENDIENTE, ESTADO_REACTIVABLE},
+    ESTADO_CANCELADO: {ESTADO_PENDIENTE, ESTADO_REACTIVABLE},
+}
+
+def codigo_estado(estado: Optional[str]) -> int:
+    """Código de un texto de estado (misma regla que la columna estado_code)."""
+    texto = (estado or "").strip().lower()
+    if not texto:
+        return ESTADO_SIN_ESTADO
+    for prefijo, codigo in _PREFIJOS_ESTADO:
+        if texto.startswith(prefijo):
+            return codigo
+    return ESTADO_OTRO
+
+def _origenes_permitidos(destino: int) -> List[int]:
+    return sorted(e for e in NOMBRES_ESTADO if destino == e or destino in TRANSICIONES[e])
+
+def _error_transicion(actual: int, destino: int) -> str:
+    return (f"Transición de estado no permitida: "
+            f"{NOMBRES_ESTADO[actual] or 'sin estado'} -> {NOMBRES_ESTADO[destino] or 'sin estado'}")
+
+# Predicados compartidos por las consultas y los índices parciales: SQLite solo
+# usa un índice parcial si el WHERE de la consulta contiene el mismo término.
+_FILTRO_PENDIENTES = f"estado_code IN ({ESTADO_SIN_ESTADO}, {ESTADO_PENDIENTE})"
+# el mismo filtro sobre el texto, tal como lo creó la migración 1 (antes de estado_code)
+_FILTRO_PENDIENTES_TEXTO = "(estado IS NULL OR TRIM(estado) = '' OR LOWER(estado) LIKE 'pend%')"
+_FILTRO_SIN_FECHA = "(fechaVisita IS NULL OR TRIM(COALESCE(fechaVisita, '')) = '')"
+
+_esquema_listo = False
+_esquema_lock = threading.Lock()
+
+def _tiene_indice_unico(conn, tabla: str, columna: str) -> bool:
+    for idx in conn.execute(f"PRAGMA index_list({tabla})").fetchall():
+        if idx["unique"] and not idx["partial"]:
+            cols = [c["name"] for c in conn.execute(f"PRAGMA index_info({idx['name']})")]
+            if cols == [columna]:
+                return True
+    return False
+
+def _migracion_1(conn):
+    """Tabla completa, columnas que falten en bases antiguas e índices de lectura."""
+    columnas = ",\n            ".join(f"{c} {t}" for c, t in _COLUMNAS_TIPOS[1:])
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS avisos (
+            idAviso INTEGER PRIMARY KEY AUTOINCREMENT,
+            ordenInterna TEXT UNIQUE,
+            {columnas}
+        )
+    """)
+    existentes = {r["name"] for r in conn.execute("PRAGMA table_info(avisos)")}
+    for col, tipo in _COLUMNAS_TIPOS:
+        if col not in existentes:
+            conn.execute(f"ALTER TABLE avisos ADD COLUMN {col} {tipo}")
+
+    # búsquedas/updates por orden (WHERE ordenInterna=?)
+    if not _tiene_indice_unico(conn, "avisos", "ordenInterna"):
+        try:
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_avisos_orden ON avisos(ordenInterna)")
+        except sqlite3.IntegrityError:
+            # bases antiguas con órdenes repetidas: índice normal
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_avisos_orden ON avisos(ordenInterna)")
+    # planificador del día (WHERE fechaVisita=? ORDER BY horaInicio) y calendario
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_avisos_fecha_hora ON avisos(fechaVisita, horaInicio)")
+    # pendientes, ya ordenados por fecha/hora
+    conn.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_avisos_pendientes
+        ON avisos(fechaVisita, horaInicio) WHERE {_FILTRO_PENDIENTES_TEXTO}
+    """)
+    # servicios sin asignar, ordenados por orden interna
+    conn.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_avisos_sin_fecha
+        ON avisos(ordenInterna) WHERE {_FILTRO_SIN_FECHA}
+    """)
+
+def _migracion_2(conn):
+    """Índices para la paginación por clave (keyset) de los listados."""
+    # COALESCE para que las claves nunca sean NULL y la comparación (a, b) > (?, ?) funcione
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_avisos_keyset
+        ON avisos(COALESCE(fechaVisita, ''), COALESCE(horaInicio, ''), idAviso)
+    """)
+    conn.execute("DROP INDEX IF EXISTS idx_avisos_sin_fecha")
+    conn.execute(f"""
+        CREATE INDEX idx_avisos_sin_fecha
+        ON avisos(COALESCE(ordenInterna, ''), idAviso) WHERE {_FILTRO_SIN_FECHA}
+    """)
+
+_COLUMNAS_FTS = ["ordenInterna", "cliente", "direccion", "localidad", "tecnico",
+                 "tipoOperacion", "telefono1", "telefono2"]
+
+_SQL_TRIGGER_FTS_ALTA = f"""
+        CREATE TRIGGER IF NOT EXISTS avisos_fts_ai AFTER INSERT ON avisos BEGIN
+            INSERT INTO avisos_fts(rowid, {", ".join(_COLUMNAS_FTS)})
+            VALUES (new.idAviso, {", ".join("new." + c for c in _COLUMNAS_FTS)});
+        END
+"""
+
+_SQL_TRIGGER_FTS_CAMBIO = f"""
+        CREATE TRIGGER IF NOT EXISTS avisos_fts_au AFTER UPDATE OF {", ".join(_COLUMNAS_FTS)} ON avisos BEGIN
+            INSERT INTO avisos_fts(avisos_fts, rowid, {", ".join(_COLUMNAS_FTS)})
+            VALUES ('delete', old.idAviso, {", ".join("old." + c for c in _COLUMNAS_FTS)});
+            INSERT INTO avisos_fts(rowid, {", ".join(_COLUMNAS_FTS)})
+            VALUES (new.idAviso, {", ".join("new." + c for c in _COLUMNAS_FTS)});
+        END
+"""
+
+def _migracion_3(conn):
+    """Índice FTS5 (sin acentos, con prefijos) sincronizado con avisos por triggers."""
+    cols = ", ".join(_COLUMNAS_FTS)
+    viejos = ", ".join(f"old.{c}" for c in _COLUMNAS_FTS)
+    try:
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS avisos_fts USING fts5(
+                {cols},
+                content='avisos', content_rowid='idAviso',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+    except sqlite3.OperationalError:
+        return  # SQLite sin FTS5: buscar_avisos usa LIKE
+    conn.execute(_SQL_TRIGGER_FTS_ALTA)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS avisos_fts_ad AFTER DELETE ON avisos BEGIN
+            INSERT INTO avisos_fts(avisos_fts, rowid, {cols}) VALUES ('delete', old.idAviso, {viejos});
+        END
+    """)
+    conn.execute(_SQL_TRIGGER_FTS_CAMBIO)
+    conn.execute("INSERT INTO avisos_fts(avisos_fts) VALUES ('rebuild')")
+
+def _migracion_4(conn):
+    """Índice cubriente para los conteos del calendario por fecha, turno y estado."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_avisos_fecha_turno_estado ON avisos(fechaVisita, turno, estado)")
+
+_SQL_TRIGGER_CAMBIOS_ALTA = """
+        CREATE TRIGGER IF NOT EXISTS avisos_changes_ai AFTER INSERT ON avisos BEGIN
+            INSERT INTO avisos_changes(idAviso, ordenInterna, op) VALUES (new.idAviso, new.ordenInterna, 'I');
+        END
+"""
+
+def _migracion_5(conn):
+    """Registro de cambios (avisos_changes) mantenido por triggers, para sincronizar por deltas."""
+    # AUTOINCREMENT: seq nunca se reutiliza, ni siquiera tras compactar el registro
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS avisos_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            idAviso INTEGER NOT NULL,
+            ordenInterna TEXT,
+            op TEXT NOT NULL CHECK (op IN ('I', 'U', 'D')),
+            ts TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_avisos_changes_aviso ON avisos_changes(idAviso, seq)")
+    conn.execute("CREATE TABLE IF NOT EXISTS avisos_meta (clave TEXT PRIMARY KEY, valor)")
+    conn.execute(_SQL_TRIGGER_CAMBIOS_ALTA)
+    for nombre, evento, fila, op in (("au", "UPDATE", "new", "U"), ("ad", "DELETE", "old", "D")):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS avisos_changes_{nombre} AFTER {evento} ON avisos BEGIN
+                INSERT INTO avisos_changes(idAviso, ordenInterna, op)
+                VALUES ({fila}.idAviso, {fila}.ordenInterna, '{op}');
+            END
+        """)
+
+def _migracion_6(conn):
+    """Estado normalizado: tabla estados, columna generada estado_code e índices por código."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS estados (
+            code INTEGER PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            cerrado INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.executemany(
+        "INSERT OR REPLACE INTO estados(code, nombre, cerrado) VALUES (?, ?, ?)",
+        [(c, n, int(c in ESTADOS_CERRADOS)) for c, n in NOMBRES_ESTADO.items()],
+    )
+    # columna generada VIRTUAL: no hay que rellenarla ni sincronizarla con triggers
+    columnas = {r["name"] for r in conn.execute("PRAGMA table_xinfo(avisos)")}
+    if "estado_code" not in columnas:
+        conn.execute(f"""
+            ALTER TABLE avisos ADD COLUMN estado_code INTEGER
+            GENERATED ALWAYS AS ({_SQL_CODIGO_ESTADO}) VIRTUAL
+        """)
+    conn.execute("DROP INDEX IF EXISTS idx_avisos_pendientes")
+    conn.execute(f"""
+        CREATE INDEX idx_avisos_pendientes
+        ON avisos(fechaVisita, horaInicio) WHERE {_FILTRO_PENDIENTES}
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_avisos_estado ON avisos(estado_code, fechaVisita, horaInicio)")
+
+def _sql_tabla_archivo(esquema: str) -> str:
+    # mismas columnas que avisos; idAviso se conserva al archivar (sin AUTOINCREMENT)
+    columnas = ",\n            ".join(f"{c} {t}" for c, t in _COLUMNAS_TIPOS[1:])
+    return f"""
+        CREATE TABLE IF NOT EXISTS {esquema}.avisos_archivo (
+            idAviso INTEGER PRIMARY KEY,
+            ordenInterna TEXT UNIQUE,
+            {columnas},
+            estado_code INTEGER GENERATED ALWAYS AS ({_SQL_CODIGO_ESTADO}) VIRTUAL,
+            archivadoEn TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """
+
+def _sql_vista_todos(esquema: str = "main", archivo: str = "main.avisos_archivo") -> str:
+    return f"""
+        CREATE {"TEMP " if esquema == "temp" else ""}VIEW IF NOT EXISTS avisos_todos AS
+            SELECT {_COLUMNAS_SELECT} FROM main.avisos
+            UNION ALL SELECT {_COLUMNAS_SELECT} FROM {archivo}
+    """
+
+def _migracion_7(conn):
+    """Archivo de avisos cerrados (avisos_archivo) y vista avisos_todos (activos + archivo)."""
+    conn.execute(_sql_tabla_archivo("main"))
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_archivo_fecha_hora ON avisos_archivo(fechaVisita, horaInicio)")
+    conn.execute(_sql_vista_todos())
+    # archivar no es borrar: con la marca 'archivando' en avisos_meta el DELETE no
+    # deja 'D' en avisos_changes (quien sincroniza por deltas conserva esos avisos)
+    conn.execute("DROP TRIGGER IF EXISTS avisos_changes_ad")
+    conn.execute("""
+        CREATE TRIGGER avisos_changes_ad AFTER DELETE ON avisos
+        WHEN NOT EXISTS (SELECT 1 FROM avisos_meta WHERE clave = 'archivando')
+        BEGIN
+            INSERT INTO avisos_changes(idAviso, ordenInterna, op) VALUES (old.idAviso, old.ordenInterna, 'D');
+        END
+    """)
+
+def _migracion_8(conn):
+    """Hash del contenido importado (reimportar_avisos) y su índice cubriente por orden."""
+    columnas = {r["name"] for r in conn.execute("PRAGMA table_info(avisos)")}
+    if "hashImportacion" not in columnas:
+        conn.execute("ALTER TABLE avisos ADD COLUMN hashImportacion INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_avisos_orden_hash ON avisos(ordenInterna, hashImportacion)")
+
+def _migracion_9(conn):
+    """Reglas código de aparato -> proveedor (exacto o prefijo) e índice por proveedor."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS proveedores_aparato (
+            codigo TEXT PRIMARY KEY,             -- sin espacios alrededor y en mayúsculas
+            proveedor TEXT NOT NULL,
+            exacto INTEGER NOT NULL DEFAULT 0    -- 0: vale para los códigos que empiezan así
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_avisos_proveedor ON avisos(proveedor, fechaVisita, horaInicio)")
+
+def _migracion_10(conn):
+    """Tabla de trabajo con el libro Excel de la web (libro_filas) y valores distintos para filtrar."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS libro_filas (
+            fila INTEGER PRIMARY KEY,            -- posición en el libro
+            orden TEXT NOT NULL DEFAULT '',      -- reparacion normalizada
+            cliente TEXT NOT NULL DEFAULT '',
+            aparato TEXT NOT NULL DEFAULT '',
+            localidad TEXT NOT NULL DEFAULT '',
+            tecnico TEXT NOT NULL DEFAULT ''
+        )
+    """)
+    for columna in ("orden", "cliente", "localidad", "tecnico"):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_libro_{columna} ON libro_filas({columna}, fila)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS libro_valores (
+            columna TEXT NOT NULL,
+            valor TEXT NOT NULL,
+            valor_min TEXT NOT NULL,             -- en minúsculas (lower() de SQLite solo entiende ASCII)
+            PRIMARY KEY (columna, valor)
+        ) WITHOUT ROWID
+    """)
+
+def _migracion_11(conn):
+    """Índice por técnico (listados de la API para la app móvil)."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_avisos_tecnico ON avisos(tecnico, fechaVisita, horaInicio)")
+
+def _migracion_12(conn):
+    """
+    avisos_changes_au solo para cambios de datos: poner al día hashImportacion (p.ej.
+    cuando cambian las columnas que entran en el hash) no es un cambio del aviso.
+    Una migración que añada columnas a avisos debe volver a crear este trigger.
+    """
+    columnas = [r["name"] for r in conn.execute("PRAGMA table_info(avisos)")
+                if r["name"] not in ("idAviso", "hashImportacion")]
+    conn.execute("DROP TRIGGER IF EXISTS avisos_changes_au")
+    conn.execute(f"""
+        CREATE TRIGGER avisos_changes_au AFTER UPDATE OF {", ".join(columnas)} ON avisos BEGIN
+            INSERT INTO avisos_changes(idAviso, ordenInterna, op) VALUES (new.idAviso, new.ordenInterna, 'U');
+        END
+    """)
+
+def _migracion_13(conn):
+    """
+    op 'A' en avisos_changes: el aviso pasó al archivo (archivar_avisos). Sigue en
+    avisos_todos, así que no es un 'D', pero la exportación incremental tiene que
+    enterarse. El CHECK no se puede cambiar sin rehacer la tabla: los triggers que
+    escriben en ella se quitan antes y se vuelven a crear tal cual, y sqlite_sequence
+    conserva el último seq (que no baja aunque compactar_cambios haya borrado filas).
+    """
+    triggers = conn.execute("""
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'trigger' AND name IN ('avisos_changes_ai', 'avisos_changes_au', 'avisos_changes_ad')
+    """).fetchall()
+    ultimo = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'avisos_changes'").fetchone()
+    for nombre, _ in triggers:
+        conn.execute(f"DROP TRIGGER {nombre}")
+    conn.execute("""
+        CREATE TABLE avisos_changes_nueva (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            idAviso INTEGER NOT NULL,
+            ordenInterna TEXT,
+            op TEXT NOT NULL CHECK (op IN ('I', 'U', 'D', 'A')),
+            ts TEXT NOT NULL DEFAULT (datetime('now'))
+        )
     """)
-    rows = cur.fetchall()
-    conn.close()
-    return [_row_to_dict(r) for r in rows]
+    conn.execute("INSERT INTO avisos_changes_nueva SELECT seq, idAviso, ordenInterna, op, ts FROM avisos_changes")
+    conn.execute("DROP TABLE avisos_changes")
+    conn.execute("ALTER TABLE avisos_changes_nueva RENAME TO avisos_changes")
+    conn.execute("CREATE INDEX idx_avisos_changes_aviso ON avisos_changes(idAviso, seq)")
+    if ultimo:
+        conn.execute("DELETE FROM sqlite_sequence WHERE name = 'avisos_changes'")
+        conn.execute("INSERT INTO sqlite_sequence(name, seq) VALUES ('avisos_changes', ?)", (ultimo[0],))
+    for _, sql in triggers:
+        conn.execute(sql)
+
+_MIGRACIONES = [_migracion_1, _migracion_2, _migracion_3, _migracion_4, _migracion_5, _migracion_6,
+                _migracion_7, _migracion_8, _migracion_9, _migracion_10, _migracion_11, _migracion_12,
+                _migracion_13]
 
-def obtener_avisos_por_fecha(fecha: str) -> List[Dict]:
+def _asegurar_esquema(conn):
+    global _esquema_listo
+    with _esquema_lock:
+        if _esquema_listo:
+            return
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < len(_MIGRACIONES):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for numero, migracion in enumerate(_MIGRACIONES, start=1):
+                    if numero > version:
+                        migracion(conn)
+                conn.execute(f"PRAGMA user_version={len(_MIGRACIONES)}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            conn.execute("ANALYZE")
+        _esquema_listo = True
+
+# --- Caché de lecturas ---
+# LRU por hilo (cada hilo tiene su conexión). Se vacía entera cuando cambia
+# PRAGMA data_version (escrituras de otras conexiones/procesos, p.ej. app.py) o
+# el contador local de escrituras (las de transaccion() en este proceso).
+
+CACHE_MAX_ENTRADAS = 128
+
+_escrituras = 0
+_stats_lock = threading.Lock()
+_cache_stats = {"aciertos": 0, "fallos": 0, "invalidaciones": 0}
+
+def _registrar_escritura():
+    global _escrituras
+    with _stats_lock:
+        _escrituras += 1
+
+def _contar(evento: str):
+    with _stats_lock:
+        _cache_stats[evento] += 1
+
+def _cache_del_hilo() -> OrderedDict:
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT 
-            idAviso, ordenInterna, cliente, direccion, localidad, codigoPostal,
-            telefono1, telefono2, aparato, marca, modelo, fechaAsignacion, averia,
-            tipoServicio, conCargo, importe, metodoPago, observacionesCobro,
-            estado, fechaVisita, tecnico, turno, proveedor, estadoCita, tipoOperacion,
-            horaInicio, horaFin
+    token = (id(conn), conn.execute("PRAGMA data_version").fetchone()[0], _escrituras)
+    cache = getattr(_local, "cache", None)
+    if cache is None:
+        cache = _local.cache = OrderedDict()
+    elif _local.cache_token != token:
+        if cache:
+            _contar("invalidaciones")
+            cache.clear()
+    _local.cache_token = token
+    return cache
+
+def _copiar_resultado(resultado):
+    # los Aviso son inmutables; basta con no compartir los contenedores
+    if isinstance(resultado, list):
+        return list(resultado)
+    if isinstance(resultado, Pagina):
+        return resultado._replace(avisos=list(resultado.avisos))
+    return resultado
+
+def _cacheado(fn):
+    @functools.wraps(fn)
+    def envoltura(*args, **kwargs):
+        if CACHE_MAX_ENTRADAS <= 0:
+            return fn(*args, **kwargs)
+        cache = _cache_del_hilo()
+        clave = (fn.__name__, args, tuple(sorted(kwargs.items())))
+        if clave in cache:
+            cache.move_to_end(clave)
+            _contar("aciertos")
+            return _copiar_resultado(cache[clave])
+        _contar("fallos")
+        resultado = fn(*args, **kwargs)
+        cache[clave] = _copiar_resultado(resultado)
+        while len(cache) > CACHE_MAX_ENTRADAS:
+            cache.popitem(last=False)
+        return resultado
+    return envoltura
+
+def estadisticas_cache() -> Dict:
+    """Aciertos/fallos/invalidaciones acumulados y entradas de la caché del hilo actual."""
+    with _stats_lock:
+        stats = dict(_cache_stats)
+    consultas = stats["aciertos"] + stats["fallos"]
+    stats["ratio_aciertos"] = stats["aciertos"] / consultas if consultas else 0.0
+    stats["entradas"] = len(getattr(_local, "cache", None) or ())
+    return stats
+
+def limpiar_cache():
+    cache = getattr(_local, "cache", None)
+    if cache:
+        cache.clear()
+
+# --- Lectura ---
+
+class Aviso(NamedTuple):
+    """
+    Fila de la tabla avisos. Inmutable y respaldada por una tupla (mucho más
+    ligera que un dict por fila). Admite lectura tipo dict (aviso.get("cliente"),
+    aviso["cliente"]) para el código existente; para exportar, to_dict().
+    """
+    idAviso: Optional[int] = None
+    ordenInterna: Optional[str] = None
+    cliente: Optional[str] = None
+    direccion: Optional[str] = None
+    localidad: Optional[str] = None
+    codigoPostal: Optional[str] = None
+    telefono1: Optional[str] = None
+    telefono2: Optional[str] = None
+    aparato: Optional[str] = None
+    marca: Optional[str] = None
+    modelo: Optional[str] = None
+    fechaAsignacion: Optional[str] = None
+    averia: Optional[str] = None
+    tipoServicio: Optional[str] = None
+    conCargo: Optional[int] = None
+    importe: Optional[float] = None
+    metodoPago: Optional[str] = None
+    observacionesCobro: Optional[str] = None
+    estado: Optional[str] = None
+    fechaVisita: Optional[str] = None
+    tecnico: Optional[str] = None
+    turno: Optional[str] = None
+    proveedor: Optional[str] = None
+    estadoCita: Optional[str] = None
+    tipoOperacion: Optional[str] = None
+    horaInicio: Optional[str] = None
+    horaFin: Optional[str] = None
+    estado_code: Optional[int] = None  # columna generada (ver ESTADO_*)
+
+    def get(self, campo: str, defecto=None):
+        i = _INDICE_CAMPO.get(campo)
+        if i is None:
+            return defecto
+        return tuple.__getitem__(self, i)
+
+    def __getitem__(self, clave):
+        if isinstance(clave, str):
+            i = _INDICE_CAMPO.get(clave)
+            if i is None:
+                raise KeyError(clave)
+            clave = i
+        return tuple.__getitem__(self, clave)
+
+    def to_dict(self) -> Dict:
+        return dict(zip(self._fields, self))
+
+_INDICE_CAMPO = {campo: i for i, campo in enumerate(Aviso._fields)}
+
+def _aviso_factory(cursor, row) -> Aviso:
+    """row_factory: construye el Aviso directamente desde la tupla del cursor."""
+    return tuple.__new__(Aviso, row)
+
+# el orden de las columnas debe coincidir con el de los campos de Aviso
+_COLUMNAS_SELECT = ", ".join(Aviso._fields)
+
+def _cursor_avisos():
+    cur = get_connection().cursor()
+    cur.row_factory = _aviso_factory
+    return cur
+
+# INDEXED BY: sin estadísticas (base recién creada) el planificador prefiere
+# idx_avisos_estado + ordenación temporal al índice parcial ya ordenado
+_SQL_PENDIENTES = f"""
+        SELECT {_COLUMNAS_SELECT}
+        FROM avisos INDEXED BY idx_avisos_pendientes
+        WHERE {_FILTRO_PENDIENTES}
+        ORDER BY fechaVisita ASC, horaInicio ASC
+"""
+
+_SQL_POR_FECHA = f"""
+        SELECT {_COLUMNAS_SELECT}
         FROM avisos
         WHERE fechaVisita = ?
         ORDER BY horaInicio ASC
-    """, (fecha,))
-    rows = cur.fetchall()
-    conn.close()
-    return [_row_to_dict(r) for r in rows]
+"""
 
-def obtener_todos_los_avisos() -> List[Dict]:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT 
-            idAviso, ordenInterna, cliente, direccion, localidad, codigoPostal,
-            telefono1, telefono2, aparato, marca, modelo, fechaAsignacion, averia,
-            tipoServicio, conCargo, importe, metodoPago, observacionesCobro,
-            estado, fechaVisita, tecnico, turno, proveedor, estadoCita, tipoOperacion,
-            horaInicio, horaFin
+_SQL_TODOS = f"""
+        SELECT {_COLUMNAS_SELECT}
         FROM avisos
         ORDER BY fechaVisita DESC, horaInicio DESC
-    """)
-    rows = cur.fetchall()
-    conn.close()
-    return [_row_to_dict(r) for r in rows]
+"""
 
-def obtener_avisos_sin_fecha() -> List[Dict]:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT
-            idAviso, ordenInterna, cliente, direccion, localidad, codigoPostal,
-            telefono1, telefono2, aparato, marca, modelo, fechaAsignacion, averia,
-            tipoServicio, conCargo, importe, metodoPago, observacionesCobro,
-            estado, fechaVisita, tecnico, turno, proveedor, estadoCita, tipoOperacion,
-            horaInicio, horaFin
+_SQL_SIN_FECHA = f"""
+        SELECT {_COLUMNAS_SELECT}
         FROM avisos
-        WHERE fechaVisita IS NULL OR TRIM(COALESCE(fechaVisita, '')) = ''
-        ORDER BY ordenInterna ASC
-    """)
-    rows = cur.fetchall()
-    conn.close()
-    return [_row_to_dict(r) for r in rows]
+        WHERE {_FILTRO_SIN_FECHA}
+        ORDER BY COALESCE(ordenInterna, '') ASC, idAviso ASC
+"""
 
+def _con_archivo(sql: str) -> str:
+    """La misma consulta sobre avisos_todos (activos + archivados)."""
+    assert "FROM avisos\n" in sql
+    return sql.replace("FROM avisos\n", "FROM avisos_todos\n")
+
+_SQL_POR_FECHA_ARCHIVO = _con_archivo(_SQL_POR_FECHA)
+_SQL_TODOS_ARCHIVO = _con_archivo(_SQL_TODOS)
+
+_SQL_FECHAS_CON_AVISOS = """
+        SELECT DISTINCT fechaVisita
+        FROM avisos
+        WHERE fechaVisita IS NOT NULL AND TRIM(fechaVisita) <> ''
+"""
+
+@_cacheado
+def obtener_avisos_pendientes() -> List[Aviso]:
+    cur = _cursor_avisos()
+    cur.execute(_SQL_PENDIENTES)
+    return cur.fetchall()
+
+@_cacheado
+def obtener_avisos_por_fecha(fecha: str, incluir_archivo: bool = False) -> List[Aviso]:
+    cur = _cursor_avisos()
+    cur.execute(_SQL_POR_FECHA_ARCHIVO if incluir_archivo else _SQL_POR_FECHA, (fecha,))
+    return cur.fetchall()
+
+def obtener_todos_los_avisos(incluir_archivo: bool = False) -> List[Aviso]:
+    cur = _cursor_avisos()
+    cur.execute(_SQL_TODOS_ARCHIVO if incluir_archivo else _SQL_TODOS)
+    return cur.fetchall()
+
+_SQL_AVISO = f"SELECT {_COLUMNAS_SELECT} FROM avisos_todos WHERE ordenInterna = ?"
+
+@_cacheado
+def obtener_aviso(ordenInterna: str) -> Optional[Aviso]:
+    """Un aviso por su orden interna, activo o archivado; None si no existe."""
+    cur = _cursor_avisos()
+    cur.execute(_SQL_AVISO, (ordenInterna,))
+    return cur.fetchone()
+
+@_cacheado
+def obtener_avisos_sin_fecha() -> List[Aviso]:
+    cur = _cursor_avisos()
+    cur.execute(_SQL_SIN_FECHA)
+    return cur.fetchall()
+
+@_cacheado
 def obtener_fechas_con_avisos() -> List[str]:
     """Fechas con al menos un aviso (para el calendario)."""
+    cur = get_connection().cursor()
+    cur.execute(_SQL_FECHAS_CON_AVISOS)
+    return [row[0] for row in cur.fetchall()]
+
+class ConteoFecha(NamedTuple):
+    fecha: str
+    turno: Optional[str]
+    estado: Optional[str]
+    n: int
+
+# agrupa en el orden del índice idx_avisos_fecha_turno_estado: sin ordenación temporal
+_SQL_CONTEO_POR_FECHA = """
+        SELECT fechaVisita, turno, estado, COUNT(*)
+        FROM avisos
+        WHERE fechaVisita BETWEEN ? AND ?
+        GROUP BY fechaVisita, turno, estado
+"""
+
+_SQL_CONTEO_POR_FECHA_ARCHIVO = _con_archivo(_SQL_CONTEO_POR_FECHA)
+
+@_cacheado
+def conteo_por_fecha(desde: str, hasta: str, incluir_archivo: bool = False) -> List[ConteoFecha]:
+    """
+    Número de avisos por fecha (yyyy-MM-dd, ambos extremos incluidos), desglosado
+    por turno y estado tal cual están guardados.
+    """
+    cur = get_connection().cursor()
+    cur.execute(_SQL_CONTEO_POR_FECHA_ARCHIVO if incluir_archivo else _SQL_CONTEO_POR_FECHA, (desde, hasta))
+    return [ConteoFecha(*row) for row in cur.fetchall()]
+
+# --- Búsqueda de texto ---
+
+LIMITE_BUSQUEDA = 200
+
+def _texto_busqueda(*valores) -> str:
+    """
+    Los textos como los ve el tokenizador del FTS (unicode61 remove_diacritics):
+    sin acentos, en minúsculas y con las palabras separadas por un espacio, con
+    otro delante (" palabra" en el texto = una palabra que empieza así).
+    """
+    texto = unicodedata.normalize("NFKD", " ".join(str(v) for v in valores if v is not None))
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).casefold()
+    return " " + " ".join(re.findall(r"\w+", texto))
+
+def _coincide_busqueda(palabras: str, *valores) -> int:
+    """Función SQL coincide_busqueda(palabras, col, ...): la búsqueda del FTS (prefijos) sin FTS."""
+    texto = _texto_busqueda(*valores)
+    return all(" " + p in texto for p in palabras.split())
+
+def _hay_fts(conn) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='avisos_fts'"
+    ).fetchone() is not None
+
+@_cacheado
+def buscar_avisos(
+    texto: str,
+    fecha: Optional[str] = None,
+    estado: Optional[str] = None,
+    limit: int = LIMITE_BUSQUEDA,
+    sin_fecha: bool = False,
+    estados: Optional[tuple] = None,
+    incluir_archivo: bool = False
+) -> List[Aviso]:
+    """
+    Busca en todo el histórico por orden, cliente, dirección, localidad, técnico,
+    tipo de operación y teléfonos. Cada palabra se busca como prefijo, sin
+    distinguir acentos ni mayúsculas; resultados ordenados por relevancia.
+    Con sin_fecha=True solo se buscan avisos sin fecha de visita; `estado` (texto)
+    o `estados` (códigos ESTADO_*) filtran por estado. Con incluir_archivo=True se
+    completan los resultados con avisos archivados: el archivo no tiene FTS, así que
+    se recorre con las mismas reglas de coincidencia (coincide_busqueda) pero sin
+    relevancia, los más recientes primero.
+    """
+    palabras = _texto_busqueda(texto).split()
+    if not palabras:
+        return []
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT DISTINCT fechaVisita
+    filtros, params_filtros = [], []
+    if fecha:
+        filtros.append("avisos.fechaVisita = ?")
+        params_filtros.append(fecha)
+    if estado:
+        filtros.append("avisos.estado_code = ?")
+        params_filtros.append(codigo_estado(estado))
+    if estados is not None:
+        codigos = [int(e) for e in estados]
+        filtros.append(f"avisos.estado_code IN ({','.join('?' * len(codigos)) or 'NULL'})")
+        params_filtros.extend(codigos)
+    if sin_fecha:
+        filtros.append(_FILTRO_SIN_FECHA)
+    cur = _cursor_avisos()
+    if _hay_fts(conn):
+        # se puntúan todas las coincidencias (bm25) y se devuelven las `limit` mejores
+        cur.execute(_sql_buscar_fts(filtros),
+                    [" ".join(f'"{p}"*' for p in palabras)] + params_filtros + [limit])
+    else:
+        _buscar_like(cur, "avisos", palabras, filtros, params_filtros, limit)
+    resultado = cur.fetchall()
+    if incluir_archivo and len(resultado) < limit:
+        cur = _cursor_avisos()
+        _buscar_like(cur, "avisos_archivo", palabras, filtros, params_filtros, limit - len(resultado))
+        resultado += cur.fetchall()
+    return resultado
+
+def _sql_buscar_fts(filtros: List[str]) -> str:
+    return f"""
+        SELECT {", ".join(f"avisos.{c}" for c in Aviso._fields)}
+        FROM avisos_fts JOIN avisos ON avisos.idAviso = avisos_fts.rowid
+        WHERE {" AND ".join(["avisos_fts MATCH ?"] + filtros)}
+        ORDER BY avisos_fts.rank
+        LIMIT ?
+    """
+
+def _buscar_like(cur, tabla: str, palabras: List[str], filtros: List[str], params_filtros: list, limit: int):
+    # cada palabra puede estar en cualquiera de las columnas del FTS; los filtros van
+    # antes (también sus parámetros): las filas descartadas no llaman a coincide_busqueda
+    where = f"coincide_busqueda(?, {', '.join(f'avisos.{c}' for c in _COLUMNAS_FTS)})"
+    cur.execute(f"""
+        SELECT {", ".join(f"avisos.{c}" for c in Aviso._fields)} FROM {tabla} AS avisos
+        WHERE {" AND ".join(filtros + [where])}
+        ORDER BY avisos.fechaVisita DESC
+        LIMIT ?
+    """, params_filtros + [" ".join(palabras), limit])
+
+# --- Paginación por clave (keyset) ---
+# El cursor es opaco para el llamador: codifica la clave de la última fila
+# devuelta y el total calculado en la primera página.
+
+TAMANO_PAGINA = 100
+
+class Pagina(NamedTuple):
+    avisos: List[Aviso]
+    cursor: Optional[str]  # None si no hay más páginas
+    total: int
+
+def _codificar_cursor(clave: list, total: int) -> str:
+    crudo = json.dumps({"k": clave, "t": total}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(crudo).decode("ascii")
+
+def _decodificar_cursor(cursor: str, campos: int):
+    # el cursor puede venir de fuera (p.ej. una URL): una clave que no sea una lista
+    # de `campos` valores simples acabaría en un error de SQLite en vez de ValueError
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        clave, total = datos["k"], int(datos["t"])
+        if (not isinstance(clave, list) or len(clave) != campos
+                or not all(isinstance(v, (str, int, float)) for v in clave)):
+            raise ValueError
+        return clave, total
+    except Exception:
+        raise ValueError("Cursor de paginación no válido")
+
+def _pagina(sql_pagina: str, sql_total: str, clave_de, tamano: int, cursor: Optional[str],
+            filtro: str = "", params_filtro: tuple = ()) -> Pagina:
+    """filtro: condición extra (" AND ...") que se añade a la página y al total."""
+    if tamano <= 0:
+        raise ValueError("El tamaño de página debe ser positivo")
+    conn = get_connection()
+    if cursor:
+        clave, total = _decodificar_cursor(cursor, sql_pagina[1].count("?") - 1)
+        # el primer término repite la clave principal para que SQLite busque por rango en el índice
+        condicion, params = "AND " + sql_pagina[1], [clave[0]] + list(clave)
+    else:
+        total = conn.execute(sql_total + filtro, params_filtro).fetchone()[0]
+        condicion, params = "", []
+    cur = _cursor_avisos()
+    # se pide una fila de más para saber si hay página siguiente
+    cur.execute(sql_pagina[0].format(condicion=condicion + filtro), params + list(params_filtro) + [tamano + 1])
+    avisos = cur.fetchall()
+    siguiente = None
+    if len(avisos) > tamano:
+        avisos = avisos[:tamano]
+        siguiente = _codificar_cursor(clave_de(avisos[-1]), total)
+    return Pagina(avisos, siguiente, total)
+
+_SQL_TODOS_PAGINA = (f"""
+        SELECT {_COLUMNAS_SELECT}
         FROM avisos
-        WHERE fechaVisita IS NOT NULL AND TRIM(fechaVisita) <> ''
-    """)
-    res = [row[0] for row in cur.fetchall()]
-    conn.close()
-    return res
+        WHERE 1 {{condicion}}
+        ORDER BY COALESCE(fechaVisita, '') DESC, COALESCE(horaInicio, '') DESC, idAviso DESC
+        LIMIT ?
+""", "COALESCE(fechaVisita, '') <= ? AND (COALESCE(fechaVisita, ''), COALESCE(horaInicio, ''), idAviso) < (?, ?, ?)")
+
+_SQL_SIN_FECHA_PAGINA = (f"""
+        SELECT {_COLUMNAS_SELECT}
+        FROM avisos
+        WHERE {_FILTRO_SIN_FECHA} {{condicion}}
+        ORDER BY COALESCE(ordenInterna, '') ASC, idAviso ASC
+        LIMIT ?
+""", "COALESCE(ordenInterna, '') >= ? AND (COALESCE(ordenInterna, ''), idAviso) > (?, ?)")
+
+@_cacheado
+def obtener_avisos_pagina(tamano: int = TAMANO_PAGINA, cursor: Optional[str] = None) -> Pagina:
+    """Todos los avisos por páginas (fecha y hora descendentes). Pasar Pagina.cursor para la siguiente."""
+    return _pagina(
+        _SQL_TODOS_PAGINA, "SELECT COUNT(*) FROM avisos",
+        lambda a: [a.fechaVisita or "", a.horaInicio or "", a.idAviso],
+        tamano, cursor,
+    )
+
+@_cacheado
+def obtener_avisos_sin_fecha_pagina(
+    tamano: int = TAMANO_PAGINA,
+    cursor: Optional[str] = None,
+    estados: Optional[tuple] = None
+) -> Pagina:
+    """
+    Avisos sin fecha por páginas (por orden interna). Pasar Pagina.cursor para la
+    siguiente, con los mismos `estados` (códigos ESTADO_*; None = todos).
+    """
+    filtro, params_filtro = "", ()
+    if estados is not None:
+        params_filtro = tuple(int(e) for e in estados)
+        filtro = f" AND estado_code IN ({','.join('?' * len(params_filtro)) or 'NULL'})"
+    return _pagina(
+        _SQL_SIN_FECHA_PAGINA, f"SELECT COUNT(*) FROM avisos WHERE {_FILTRO_SIN_FECHA}",
+        lambda a: [a.ordenInterna or "", a.idAviso],
+        tamano, cursor, filtro, params_filtro,
+    )
+
+# --- Lectura en streaming ---
+
+TAMANO_LOTE = 500
+
+def _iterar_cursor(cur, lote: int) -> Iterator[Aviso]:
+    try:
+        while True:
+            filas = cur.fetchmany(lote)
+            if not filas:
+                break
+            yield from filas
+    finally:
+        cur.close()
+
+def _clausulas_iter(filtro: Optional[dict], orden: Optional[List[str]], tabla: str = "avisos"):
+    columnas = {"idAviso", "estado_code"} | _ALLOWED_COLUMNS
+    where, params = [], []
+    for col, valor in (filtro or {}).items():
+        if col not in columnas:
+            raise ValueError(f"Columna de filtro no válida: {col}")
+        if valor is None:
+            where.append(f"{col} IS NULL")
+        elif isinstance(valor, (list, tuple, set, frozenset)):
+            valores = list(valor)
+            if not valores:
+                where.append("0")
+                continue
+            where.append(f"{col} IN ({','.join('?' * len(valores))})")
+            params.extend(valores)
+        else:
+            where.append(f"{col} = ?")
+            params.append(valor)
+    order_by = []
+    for item in (orden or ["fechaVisita DESC", "horaInicio DESC"]):
+        partes = item.split()
+        col = partes[0]
+        sentido = partes[1].upper() if len(partes) > 1 else "ASC"
+        if col not in columnas or sentido not in ("ASC", "DESC") or len(partes) > 2:
+            raise ValueError(f"Orden no válido: {item}")
+        order_by.append(f"{col} {sentido}")
+    sql = f"SELECT {_COLUMNAS_SELECT}\n        FROM {tabla}"
+    if where:
+        sql += "\n        WHERE " + " AND ".join(where)
+    sql += "\n        ORDER BY " + ", ".join(order_by)
+    return sql, params
+
+def iter_avisos(
+    filtro: Optional[dict] = None,
+    orden: Optional[List[str]] = None,
+    lote: int = TAMANO_LOTE,
+    incluir_archivo: bool = False
+) -> Iterator[Aviso]:
+    """
+    Recorre avisos sin cargarlos todos en memoria (fetchmany por lotes).
+    - filtro: {columna: valor}; None -> IS NULL, lista/tupla/set -> IN.
+    - orden: p.ej. ["fechaVisita DESC", "horaInicio DESC"] (por defecto, el de obtener_todos_los_avisos).
+    - incluir_archivo: recorre también los avisos archivados (vista avisos_todos).
+    """
+    sql, params = _clausulas_iter(filtro, orden, "avisos_todos" if incluir_archivo else "avisos")
+    cur = _cursor_avisos()
+    cur.execute(sql, params)
+    return _iterar_cursor(cur, lote)
+
+def iter_avisos_sin_fecha(lote: int = TAMANO_LOTE) -> Iterator[Aviso]:
+    """Como obtener_avisos_sin_fecha, en streaming."""
+    cur = _cursor_avisos()
+    cur.execute(_SQL_SIN_FECHA)
+    return _iterar_cursor(cur, lote)
+
+# --- Registro de cambios ---
+
+class Cambio(NamedTuple):
+    seq: int
+    idAviso: int
+    ordenInterna: Optional[str]
+    op: str  # 'I' alta, 'U' modificación, 'D' borrado, 'A' archivado
+    ts: str
+
+# un cambio por aviso, el último: rango por seq (clave primaria, ya ordenado) y
+# descarte por idx_avisos_changes_aviso; el coste depende de los cambios desde seq
+_SQL_CAMBIOS_DESDE = """
+        SELECT c.seq, c.idAviso, c.ordenInterna, c.op, c.ts
+        FROM avisos_changes AS c
+        WHERE c.seq > ?
+          AND NOT EXISTS (SELECT 1 FROM avisos_changes AS d WHERE d.idAviso = c.idAviso AND d.seq > c.seq)
+        ORDER BY c.seq
+"""
+
+def _horizonte_cambios(conn) -> int:
+    fila = conn.execute("SELECT valor FROM avisos_meta WHERE clave = 'horizonte_cambios'").fetchone()
+    return int(fila[0]) if fila else 0
+
+def ultimo_cambio() -> int:
+    """
+    seq del último cambio registrado (0 si no hay ninguno). Es el último asignado, no
+    MAX(seq): no baja aunque compactar_cambios borre las entradas más recientes.
+    """
+    return _seq_cambios(get_connection())
+
+def obtener_version_datos() -> str:
+    """
+    Versión de los avisos (activos y archivados), p.ej. para ETag: cambia con cada
+    alta, modificación, borrado o archivado (es ultimo_cambio).
+    """
+    return str(_seq_cambios(get_connection()))
+
+def cambios_desde(seq: int, limit: Optional[int] = None) -> List[Cambio]:
+    """
+    Avisos cambiados después de `seq`, uno por aviso (su último cambio) y por orden de seq.
+    Lanza ValueError si la compactación ya borró cambios posteriores a `seq`:
+    en ese caso hay que volver a sincronizar todo.
+    """
+    conn = get_connection()
+    if seq < _horizonte_cambios(conn):
+        raise ValueError(f"El registro de cambios ya no llega hasta {seq}")
+    sql = _SQL_CAMBIOS_DESDE + (" LIMIT ?" if limit else "")
+    params = (seq, limit) if limit else (seq,)
+    return [Cambio(*fila) for fila in conn.execute(sql, params)]
+
+def iter_avisos_cambiados(seq: int, lote: int = TAMANO_LOTE) -> Iterator[Aviso]:
+    """
+    Estado actual de los avisos cambiados después de `seq`, también los que ya se
+    archivaron (los borrados no aparecen), ordenados como obtener_todos_los_avisos.
+    Mismo ValueError que cambios_desde.
+    """
+    conn = get_connection()
+    if seq < _horizonte_cambios(conn):
+        raise ValueError(f"El registro de cambios ya no llega hasta {seq}")
+    cur = _cursor_avisos()
+    cur.execute(f"""
+        SELECT {_COLUMNAS_SELECT}
+        FROM avisos_todos
+        WHERE idAviso IN (SELECT idAviso FROM avisos_changes WHERE seq > ?)
+        ORDER BY fechaVisita DESC, horaInicio DESC
+    """, (seq,))
+    return _iterar_cursor(cur, lote)
+
+def compactar_cambios(dias_borrados: Optional[int] = 30, hasta_seq: Optional[int] = None) -> int:
+    """
+    Deja en avisos_changes solo el último cambio de cada aviso y, si se indica,
+    descarta los borrados con más de `dias_borrados` días. Con hasta_seq (hasta
+    dónde han sincronizado todos, p.ej. la última exportación incremental) descarta
+    también los demás cambios de más de `dias_borrados` días que no pasen de ese
+    seq: el registro queda acotado por tiempo. Sin hasta_seq se conserva un cambio
+    por aviso, así que crece con el número de avisos. Quien sincronice desde antes
+    de lo descartado recibirá ValueError. Devuelve las entradas eliminadas.
+    """
+    with transaccion() as conn:
+        borradas = conn.execute("""
+            DELETE FROM avisos_changes
+            WHERE seq < (SELECT MAX(c.seq) FROM avisos_changes AS c WHERE c.idAviso = avisos_changes.idAviso)
+        """).rowcount
+        if dias_borrados is not None:
+            limite = f"-{int(dias_borrados)} days"
+            # lo que se puede descartar: borrados y, si se sabe, lo ya sincronizado
+            descartable = "(op = 'D' OR seq <= :hasta)"
+            params = {"hasta": -1 if hasta_seq is None else int(hasta_seq)}
+            horizonte = conn.execute(
+                f"SELECT MAX(seq) FROM avisos_changes WHERE {descartable} AND ts < datetime('now', :limite)",
+                {**params, "limite": limite}
+            ).fetchone()[0]
+            if horizonte:
+                borradas += conn.execute(
+                    f"DELETE FROM avisos_changes WHERE {descartable} AND seq <= :horizonte",
+                    {**params, "horizonte": horizonte}
+                ).rowcount
+                conn.execute("""
+                    INSERT INTO avisos_meta(clave, valor) VALUES ('horizonte_cambios', ?)
+                    ON CONFLICT(clave) DO UPDATE SET valor = MAX(valor, excluded.valor)
+                """, (horizonte,))
+    return borradas
 
 # --- Escritura ---
 
@@ -133,34 +1247,76 @@ def actualizar_aviso(datos: dict):
         return
     payload = _normalize_update_payload(datos)
 
-    conn = get_connection()
-    cur = conn.cursor()
-
     id_aviso = payload.get("idAviso")
     orden = payload.get("ordenInterna")
     if not id_aviso and not orden:
-        conn.close()
         raise ValueError("Falta idAviso o ordenInterna/ordenTrabajo")
 
     # construir SET excluyendo identificadores
     campos = [k for k in payload.keys() if k not in ("idAviso", "ordenInterna")]
     if not campos:
-        conn.close()
         return  # nada que actualizar
 
     set_clause = ", ".join([f"{c}=?" for c in campos])
     valores = [payload[k] for k in campos]
 
-    if id_aviso:
-        sql = f"UPDATE avisos SET {set_clause} WHERE idAviso=?"
-        valores.append(id_aviso)
-    else:
-        sql = f"UPDATE avisos SET {set_clause} WHERE ordenInterna=?"
-        valores.append(orden)
+    columna, valor = ("idAviso", id_aviso) if id_aviso else ("ordenInterna", orden)
+    sql = f"UPDATE avisos SET {set_clause} WHERE {columna}=?"
+    valores.append(valor)
+    destino = codigo_estado(payload["estado"]) if "estado" in payload else None
+    if destino is not None:
+        sql += f" AND estado_code IN ({_sql_origenes(destino)})"
+
+    with transaccion() as conn:
+        cur = conn.execute(sql, valores)
+        if destino is not None:
+            _comprobar_transicion(conn, cur, columna, valor, destino)
+
+_SQL_CAMPOS_BASICOS = """
+    UPDATE avisos
+    SET cliente = COALESCE(?, cliente),
+        horaInicio = ?,
+        horaFin = ?,
+        tecnico = ?,
+        turno = ?,
+        fechaVisita = ?
+    WHERE ordenInterna = ?
+"""
+
+# Cambios de estado: el UPDATE solo se aplica desde los estados de origen
+# permitidos (TRANSICIONES); _comprobar_transicion convierte el "0 filas" en error.
+
+def _sql_origenes(destino: int) -> str:
+    return ", ".join(str(e) for e in _origenes_permitidos(destino))
+
+def _comprobar_transicion(conn, cur, columna: str, valor, destino: int):
+    if cur.rowcount:
+        return
+    fila = conn.execute(f"SELECT estado_code FROM avisos WHERE {columna} = ?", (valor,)).fetchone()
+    if fila is not None and fila[0] not in _origenes_permitidos(destino):
+        raise ValueError(_error_transicion(fila[0], destino))
+
+_SQL_REALIZADO = f"""
+    UPDATE avisos SET estado='realizado'
+     WHERE ordenInterna=? AND estado_code IN ({_sql_origenes(ESTADO_REALIZADO)})
+"""
+
+_SQL_ANULADO = f"""
+    UPDATE avisos SET estado='anulado'
+     WHERE ordenInterna=? AND estado_code IN ({_sql_origenes(ESTADO_ANULADO)})
+"""
 
-    cur.execute(sql, valores)
-    conn.commit()
-    conn.close()
+_SQL_ANULADO_CON_MOTIVO = f"""
+    UPDATE avisos
+       SET estado='anulado',
+           observacionesCobro = TRIM(COALESCE(observacionesCobro,'') || CASE WHEN ? <> '' THEN ' | Anulado: ' || ? ELSE '' END)
+     WHERE ordenInterna=? AND estado_code IN ({_sql_origenes(ESTADO_ANULADO)})
+"""
+
+_SQL_DESANULADO = f"""
+    UPDATE avisos SET estado='pendiente'
+     WHERE ordenInterna=? AND estado_code = {ESTADO_ANULADO}
+"""
 
 def actualizar_aviso_campos_basicos(
     ordenInterna: str,
@@ -173,29 +1329,15 @@ def actualizar_aviso_campos_basicos(
 ):
     if not ordenInterna:
         raise ValueError("Falta ordenInterna")
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        UPDATE avisos
-        SET cliente = COALESCE(?, cliente),
-            horaInicio = ?,
-            horaFin = ?,
-            tecnico = ?,
-            turno = ?,
-            fechaVisita = ?
-        WHERE ordenInterna = ?
-    """, (cliente, horaInicio, horaFin, tecnico, turno, fechaVisita, ordenInterna))
-    conn.commit()
-    conn.close()
+    with transaccion() as conn:
+        conn.execute(_SQL_CAMPOS_BASICOS, (cliente, horaInicio, horaFin, tecnico, turno, fechaVisita, ordenInterna))
 
 def marcar_realizado(ordenInterna: str):
     if not ordenInterna:
         raise ValueError("Falta ordenInterna")
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE avisos SET estado='realizado' WHERE ordenInterna=?", (ordenInterna,))
-    conn.commit()
-    conn.close()
+    with transaccion() as conn:
+        cur = conn.execute(_SQL_REALIZADO, (ordenInterna,))
+        _comprobar_transicion(conn, cur, "ordenInterna", ordenInterna, ESTADO_REALIZADO)
 
 def marcar_anulado(ordenInterna: str, motivo: Optional[str] = None):
     """
@@ -203,30 +1345,821 @@ def marcar_anulado(ordenInterna: str, motivo: Optional[str] = None):
     """
     if not ordenInterna:
         raise ValueError("Falta ordenInterna")
-    conn = get_connection()
-    cur = conn.cursor()
-    if motivo:
-        cur.execute(
-            """
-            UPDATE avisos
-               SET estado='anulado',
-                   observacionesCobro = TRIM(COALESCE(observacionesCobro,'') || CASE WHEN ? <> '' THEN ' | Anulado: ' || ? ELSE '' END)
-             WHERE ordenInterna=?
-            """, (motivo, motivo, ordenInterna)
-        )
-    else:
-        cur.execute("UPDATE avisos SET estado='anulado' WHERE ordenInterna=?", (ordenInterna,))
-    conn.commit()
-    conn.close()
+    with transaccion() as conn:
+        if motivo:
+            cur = conn.execute(_SQL_ANULADO_CON_MOTIVO, (motivo, motivo, ordenInterna))
+        else:
+            cur = conn.execute(_SQL_ANULADO, (ordenInterna,))
+        _comprobar_transicion(conn, cur, "ordenInterna", ordenInterna, ESTADO_ANULADO)
 
 def marcar_desanulado(ordenInterna: str):
     """
-    Revierte un aviso anulado a 'pendiente'.
+    Revierte un aviso anulado a 'pendiente' (los que no están anulados no cambian).
     """
     if not ordenInterna:
         raise ValueError("Falta ordenInterna")
+    with transaccion() as conn:
+        conn.execute(_SQL_DESANULADO, (ordenInterna,))
+
+# --- Escritura masiva (una sola transacción) ---
+
+_MAX_VARIABLES = 900  # por debajo del límite de parámetros de SQLite
+
+def _ordenes_existentes(conn, ordenes) -> Dict[str, int]:
+    """{ordenInterna: estado_code} de las órdenes que existen."""
+    ordenes = list(ordenes)
+    existentes = {}
+    for i in range(0, len(ordenes), _MAX_VARIABLES):
+        lote = ordenes[i:i + _MAX_VARIABLES]
+        marcas = ",".join("?" * len(lote))
+        cur = conn.execute(f"SELECT ordenInterna, estado_code FROM avisos WHERE ordenInterna IN ({marcas})", lote)
+        existentes.update((r[0], r[1]) for r in cur.fetchall())
+    return existentes
+
+def _ejecutar_bulk(sql: str, filas: List[tuple], destino: Optional[int] = None) -> Dict[str, Optional[str]]:
+    """
+    filas: (ordenInterna, parámetros del UPDATE). Aplica todas con executemany en
+    una transacción y devuelve {orden: None si se actualizó, o el motivo del fallo}.
+    destino: estado al que pasan (se rechazan las órdenes cuya transición no está permitida).
+    """
+    resultado = {}
+    validas = []
+    for orden, params in filas:
+        if not orden:
+            resultado[""] = "Falta ordenInterna"
+        else:
+            validas.append((str(orden), params))
+    if not validas:
+        return resultado
+    origenes = _origenes_permitidos(destino) if destino is not None else None
+    try:
+        with transaccion() as conn:
+            existentes = _ordenes_existentes(conn, {o for o, _ in validas})
+            conn.executemany(sql, [
+                p for o, p in validas
+                if o in existentes and (origenes is None or existentes[o] in origenes)
+            ])
+    except sqlite3.Error as e:
+        for orden, _ in validas:
+            resultado[orden] = f"Error de base de datos: {e}"
+        return resultado
+    for orden, _ in validas:
+        if orden not in existentes:
+            resultado[orden] = "No existe la orden"
+        elif origenes is not None and existentes[orden] not in origenes:
+            resultado[orden] = _error_transicion(existentes[orden], destino)
+        else:
+            resultado[orden] = None
+    return resultado
+
+def actualizar_avisos_bulk(cambios: List[dict]) -> Dict[str, Optional[str]]:
+    """
+    Versión masiva de actualizar_aviso_campos_basicos. Cada elemento es un dict con
+    ordenInterna (u ordenTrabajo) y los mismos campos; los que falten se guardan
+    como NULL, salvo cliente, que se conserva.
+    """
+    filas = []
+    for c in cambios:
+        orden = c.get("ordenInterna") or c.get("ordenTrabajo")
+        filas.append((orden, (
+            c.get("cliente"), c.get("horaInicio"), c.get("horaFin"), c.get("tecnico"),
+            c.get("turno"), c.get("fechaVisita"), str(orden),
+        )))
+    return _ejecutar_bulk(_SQL_CAMPOS_BASICOS, filas)
+
+def marcar_realizado_bulk(ordenes: List[str]) -> Dict[str, Optional[str]]:
+    return _ejecutar_bulk(_SQL_REALIZADO, [(o, (str(o),)) for o in ordenes], ESTADO_REALIZADO)
+
+def marcar_anulado_bulk(ordenes: List[str], motivo: Optional[str] = None) -> Dict[str, Optional[str]]:
+    if motivo:
+        return _ejecutar_bulk(_SQL_ANULADO_CON_MOTIVO, [(o, (motivo, motivo, str(o))) for o in ordenes],
+                              ESTADO_ANULADO)
+    return _ejecutar_bulk(_SQL_ANULADO, [(o, (str(o),)) for o in ordenes], ESTADO_ANULADO)
+
+# --- Importación con fusión ---
+# Un libro se importa con un único INSERT ... ON CONFLICT(ordenInterna) por fila
+# (executemany, una transacción); qué pasa con las órdenes que ya existen lo decide
+# la política. Los duplicados se detectan cruzando todas las órdenes de una vez
+# con una tabla temporal, no con una consulta por fila.
+
+POLITICAS_IMPORTACION = ("ignorar", "sobrescribir", "completar")
+# datos que trae el proveedor; estado, cita y cobro son de la planificación y la
+# reimportación no los toca
+COLUMNAS_PROVEEDOR = ("cliente", "direccion", "localidad", "codigoPostal", "telefono1", "telefono2",
+                      "aparato", "marca", "modelo", "fechaAsignacion", "averia")
+
+def _cargar_ordenes_consulta(conn, ordenes) -> int:
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS ordenes_consulta (orden TEXT PRIMARY KEY) WITHOUT ROWID")
+    conn.execute("DELETE FROM temp.ordenes_consulta")
+    return conn.executemany("INSERT OR IGNORE INTO temp.ordenes_consulta VALUES (?)",
+                            ((str(o),) for o in ordenes if o is not None and o != "")).rowcount
+
+def _sql_importar(columnas: List[str], politica: str) -> str:
+    sql = (f"INSERT INTO avisos ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))}) "
+           f"ON CONFLICT(ordenInterna) DO ")
+    fusion = [c for c in columnas if c in COLUMNAS_PROVEEDOR]
+    if politica == "ignorar" or not fusion:
+        return sql + "NOTHING"
+    if politica == "sobrescribir":
+        # los datos nuevos mandan, pero una celda vacía no borra lo que había
+        nuevo = {c: f"COALESCE(NULLIF(excluded.{c}, ''), avisos.{c})" for c in fusion}
+    else:
+        nuevo = {c: f"COALESCE(NULLIF(avisos.{c}, ''), excluded.{c})" for c in fusion}
+    # sin cambios reales no hay UPDATE (ni entrada en avisos_changes)
+    return (sql + "UPDATE SET " + ", ".join(f"{c} = {v}" for c, v in nuevo.items())
+            + " WHERE " + " OR ".join(f"avisos.{c} IS NOT {v}" for c, v in nuevo.items()))
+
+def _fusionar_repetidos(avisos: List[dict], politica: str) -> List[dict]:
+    """
+    Una fila por orden: las repetidas se fusionan con la primera según la política,
+    igual que si se importaran una detrás de otra (el UPSERT no puede insertar y
+    actualizar la misma orden en una sola pasada sin pasar por el trigger del FTS).
+    """
+    unicos: Dict[str, dict] = {}
+    for a in avisos:
+        orden = str(a["ordenInterna"])
+        previo = unicos.get(orden)
+        if previo is None:
+            unicos[orden] = dict(a)
+            continue
+        if politica == "ignorar":
+            continue
+        for c in COLUMNAS_PROVEEDOR:
+            valor = a.get(c)
+            if valor is not None and valor != "" and (politica == "sobrescribir" or previo.get(c) in (None, "")):
+                previo[c] = valor
+    return list(unicos.values())
+
+def importar_avisos(avisos: List[dict], politica: str = "ignorar") -> Dict[str, int]:
+    """
+    Inserta avisos (dicts con columnas de avisos y ordenInterna) en una transacción.
+    Las órdenes que ya existen, según `politica`:
+      ignorar       se dejan como están
+      sobrescribir  sus COLUMNAS_PROVEEDOR toman los valores nuevos no vacíos
+      completar     solo se rellenan sus COLUMNAS_PROVEEDOR vacías
+    Las archivadas no se tocan; una orden repetida cuenta como varias importaciones
+    seguidas. Devuelve {"insertados", "actualizados", "sin_cambios"}.
+    (carga_masiva: el índice FTS de los nuevos se rellena de una vez al final.)
+    """
+    if politica not in POLITICAS_IMPORTACION:
+        raise ValueError(f"Política de importación no válida: {politica}")
+    avisos = [a for a in avisos if a.get("ordenInterna")]
+    recibidos = len(avisos)
+    avisos = _fusionar_repetidos(avisos, politica)
+    if any(a.get("aparato") and not a.get("proveedor") for a in avisos):
+        # proveedor según el código de aparato (solo cuenta al insertar: no está en COLUMNAS_PROVEEDOR)
+        proveedores = obtener_proveedores_de_aparatos(a.get("aparato") for a in avisos)
+        avisos = [{**a, "proveedor": a.get("proveedor") or p} for a, p in zip(avisos, proveedores)]
+    columnas = ["ordenInterna"] + [c for c in dict.fromkeys(k for a in avisos for k in a)
+                                   if c in _ALLOWED_COLUMNS and c != "ordenInterna"]
+    resultado = {"insertados": 0, "actualizados": 0, "sin_cambios": 0}
+    if not avisos:
+        return resultado
+    with carga_masiva() as conn:
+        _cargar_ordenes_consulta(conn, (a["ordenInterna"] for a in avisos))
+        # orden -> 1 si está en avisos, 0 si solo está archivada
+        existentes = dict(conn.execute("""
+            SELECT o.orden, EXISTS (SELECT 1 FROM main.avisos a WHERE a.ordenInterna = o.orden)
+            FROM temp.ordenes_consulta o
+            WHERE EXISTS (SELECT 1 FROM avisos_todos t WHERE t.ordenInterna = o.orden)
+        """).fetchall())
+        conn.execute("DELETE FROM temp.ordenes_consulta")
+        filas = [tuple(str(a["ordenInterna"]) if c == "ordenInterna" else a.get(c) for c in columnas)
+                 for a in avisos if existentes.get(str(a["ordenInterna"]), 1)]
+        nuevas = {f[0] for f in filas if f[0] not in existentes}
+        if politica != "ignorar":
+            _volcar_carga_masiva(conn)  # por si el bloque de fuera ya insertó alguna de estas órdenes
+        cambios = conn.executemany(_sql_importar(columnas, politica), filas).rowcount
+    resultado["insertados"] = len(nuevas)
+    resultado["actualizados"] = cambios - len(nuevas)
+    resultado["sin_cambios"] = recibidos - cambios
+    return resultado
+
+# Reimportación incremental: cada aviso importado guarda el hash de sus datos de
+# proveedor tal como venían (hashImportacion, lo calcula quien importa). Al volver
+# a importar se cruzan los hashes de todo el archivo con los guardados y solo se
+# escriben las órdenes nuevas y las que cambiaron.
+
+def _actualizar_con_fts(conn, sql_update: str, filas: List[tuple]):
+    """
+    executemany de un UPDATE ... WHERE ordenInterna = ? (la orden, último parámetro)
+    con el índice FTS y avisos_changes puestos al día en una sentencia cada uno para
+    todas las filas, en lugar de fila a fila desde avisos_fts_au y avisos_changes_au
+    (como carga_masiva con los INSERT). Con un trigger, cada UPDATE abre además un
+    statement journal, y dentro de un SAVEPOINT con temp_store=MEMORY cerrarlo cuesta
+    lo que ya lleva escrito el savepoint: el executemany se volvía cuadrático.
+    """
+    _volcar_carga_masiva(conn)
+    hay_fts = _hay_fts(conn)
+    cols = ", ".join(_COLUMNAS_FTS)
+    conn.executemany("INSERT OR IGNORE INTO temp.ordenes_consulta VALUES (?)", ((f[-1],) for f in filas))
+    seleccion = f"SELECT idAviso, {cols} FROM avisos WHERE ordenInterna IN (SELECT orden FROM temp.ordenes_consulta)"
+    # se vuelve a crear tal cual está (la lista de columnas es de _migracion_12)
+    trigger_cambios = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'avisos_changes_au'").fetchone()[0]
+    conn.execute("DROP TRIGGER avisos_changes_au")
+    if hay_fts:
+        conn.execute("DROP TRIGGER IF EXISTS avisos_fts_au")
+        conn.execute(f"INSERT INTO avisos_fts(avisos_fts, rowid, {cols}) SELECT 'delete', * FROM ({seleccion})")
+    conn.executemany(sql_update, filas)
+    conn.execute("""
+        INSERT INTO avisos_changes(idAviso, ordenInterna, op)
+        SELECT idAviso, ordenInterna, 'U' FROM avisos
+        WHERE ordenInterna IN (SELECT orden FROM temp.ordenes_consulta) ORDER BY idAviso
+    """)
+    conn.execute(trigger_cambios)
+    if hay_fts:
+        conn.execute(f"INSERT INTO avisos_fts(rowid, {cols}) {seleccion}")
+        conn.execute(_SQL_TRIGGER_FTS_CAMBIO)
+    conn.execute("DELETE FROM temp.ordenes_consulta")
+
+def reimportar_avisos(columnas: List[str], filas: List[tuple], hashes: List[int]) -> Dict[str, int]:
+    """
+    filas: tuplas en el orden de `columnas` (que incluye ordenInterna); hashes: el de
+    cada fila. En una transacción inserta las órdenes nuevas, actualiza las
+    COLUMNAS_PROVEEDOR de las que tienen otro hash (sin borrar datos con celdas
+    vacías) y no toca las iguales ni las archivadas. Las filas sin orden se descartan
+    y, si una orden se repite, manda la última. Si hay columna aparato y no proveedor,
+    las nuevas reciben el proveedor de las reglas. {"insertados", "actualizados", "sin_cambios"}.
+    """
+    i_orden = columnas.index("ordenInterna")
+    ultimas = {}  # orden -> (fila, hash)
+    for fila, h in zip(filas, hashes):
+        if fila[i_orden]:
+            ultimas[str(fila[i_orden])] = (fila, h)
+    resultado = {"insertados": 0, "actualizados": 0, "sin_cambios": len(filas) - len(ultimas)}
+    if not ultimas:
+        return resultado
+    fusion = [c for c in columnas if c in COLUMNAS_PROVEEDOR]
+    indices = [columnas.index(c) for c in fusion]
+    sql_insert = (f"INSERT INTO avisos ({', '.join(columnas)}, hashImportacion) "
+                  f"VALUES ({', '.join('?' * (len(columnas) + 1))})")
+    sql_update = ("UPDATE avisos SET " + "".join(f"{c} = COALESCE(?, {c}), " for c in fusion)
+                  + "hashImportacion = ? WHERE ordenInterna = ?")
+    with transaccion() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")  # que nadie inserte las mismas órdenes entre la consulta y el INSERT
+        _cargar_ordenes_consulta(conn, ultimas)
+        guardados = dict(conn.execute("""
+            SELECT a.ordenInterna, a.hashImportacion
+            FROM temp.ordenes_consulta o JOIN main.avisos a ON a.ordenInterna = o.orden
+        """).fetchall())
+        archivadas = {r[0] for r in conn.execute("""
+            SELECT o.orden FROM temp.ordenes_consulta o
+            WHERE NOT EXISTS (SELECT 1 FROM main.avisos a WHERE a.ordenInterna = o.orden)
+              AND EXISTS (SELECT 1 FROM avisos_todos t WHERE t.ordenInterna = o.orden)
+        """)}
+        nuevas, cambiadas = [], []
+        for orden, (fila, h) in ultimas.items():
+            if orden in guardados:
+                if guardados[orden] != h:
+                    cambiadas.append(tuple(fila[i] for i in indices) + (h, orden))
+            elif orden not in archivadas:
+                nuevas.append(tuple(orden if i == i_orden else v for i, v in enumerate(fila)) + (h,))
+        # otro hash no siempre es otro dato (p.ej. si cambian las columnas que entran
+        # en el hash): a esas solo se les pone el hash nuevo, sin entrada en avisos_changes
+        solo_hash = []
+        if cambiadas:
+            conn.execute("DELETE FROM temp.ordenes_consulta")
+            conn.executemany("INSERT INTO temp.ordenes_consulta VALUES (?)", ((f[-1],) for f in cambiadas))
+            actuales = {r[0]: r[1:] for r in conn.execute(f"""
+                SELECT a.ordenInterna{"".join(f", a.{c}" for c in fusion)}
+                FROM temp.ordenes_consulta o JOIN main.avisos a ON a.ordenInterna = o.orden
+            """)}
+            distintas = []
+            for f in cambiadas:
+                actual = actuales[f[-1]]
+                # vacío (None, o NaN de pandas, que SQLite guarda como NULL) no cambia nada
+                if any(v is not None and v == v and v != a for v, a in zip(f[:len(fusion)], actual)):
+                    distintas.append(f)
+                else:
+                    solo_hash.append(f[-2:])
+            cambiadas = distintas
+        conn.execute("DELETE FROM temp.ordenes_consulta")
+        if nuevas and "aparato" in columnas and "proveedor" not in columnas:
+            i_aparato = columnas.index("aparato")
+            proveedores = obtener_proveedores_de_aparatos(f[i_aparato] for f in nuevas)
+            nuevas = [f[:-1] + (p, f[-1]) for f, p in zip(nuevas, proveedores)]
+            sql_insert = (f"INSERT INTO avisos ({', '.join(columnas)}, proveedor, hashImportacion) "
+                          f"VALUES ({', '.join('?' * (len(columnas) + 2))})")
+        if nuevas:
+            conn.executemany(sql_insert, nuevas)
+        if cambiadas:
+            _actualizar_con_fts(conn, sql_update, cambiadas)
+        if solo_hash:
+            conn.executemany("UPDATE avisos SET hashImportacion = ? WHERE ordenInterna = ?", solo_hash)
+    resultado["insertados"] = len(nuevas)
+    resultado["actualizados"] = len(cambiadas)
+    resultado["sin_cambios"] += len(ultimas) - len(nuevas) - len(cambiadas)
+    return resultado
+
+# --- Proveedor por código de aparato ---
+# El código de aparato del Excel identifica al proveedor del servicio. Las reglas
+# (proveedores_aparato) son códigos exactos o prefijos; se cargan en un índice en
+# memoria que solo se relee cuando cambian, y se aplican en bloque al importar y
+# con asignar_proveedores a los avisos que ya están en la base.
+
+LOTE_PROVEEDORES = 5000
+
+def _normalizar_codigo(codigo) -> str:
+    return str(codigo).strip().upper() if codigo is not None else ""
+
+class IndiceProveedores:
+    """Código de aparato -> proveedor: la regla exacta o, si no hay, el prefijo más largo."""
+
+    def __init__(self, reglas):
+        self._exactos: Dict[str, str] = {}
+        self._prefijos: Dict[str, str] = {}
+        for codigo, proveedor, exacto in reglas:
+            clave = _normalizar_codigo(codigo)
+            if clave:
+                (self._exactos if exacto else self._prefijos)[clave] = proveedor
+        # solo se prueban las longitudes de prefijo que hay, de la más larga a la más corta
+        self._longitudes = sorted({len(p) for p in self._prefijos}, reverse=True)
+
+    def __len__(self):
+        return len(self._exactos) + len(self._prefijos)
+
+    def buscar(self, aparato) -> Optional[str]:
+        codigo = _normalizar_codigo(aparato)
+        if not codigo:
+            return None
+        proveedor = self._exactos.get(codigo)
+        if proveedor is not None:
+            return proveedor
+        for n in self._longitudes:
+            if n <= len(codigo):
+                proveedor = self._prefijos.get(codigo[:n])
+                if proveedor is not None:
+                    return proveedor
+        return None
+
+_indice_proveedores = (None, None)  # (versión de las reglas, IndiceProveedores)
+_indice_proveedores_lock = threading.Lock()
+
+def _version_reglas(conn):
+    fila = conn.execute("SELECT valor FROM avisos_meta WHERE clave = 'reglas_proveedor'").fetchone()
+    return fila[0] if fila else 0
+
+def obtener_indice_proveedores() -> IndiceProveedores:
+    """Índice de las reglas; se vuelve a leer de la base solo si han cambiado (también desde otro proceso)."""
+    global _indice_proveedores
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE avisos SET estado='pendiente' WHERE ordenInterna=?", (ordenInterna,))
-    conn.commit()
-    conn.close()
+    version = _version_reglas(conn)
+    with _indice_proveedores_lock:
+        if _indice_proveedores[1] is None or _indice_proveedores[0] != version:
+            reglas = conn.execute("SELECT codigo, proveedor, exacto FROM proveedores_aparato").fetchall()
+            _indice_proveedores = (version, IndiceProveedores(reglas))
+        return _indice_proveedores[1]
+
+def obtener_proveedores_de_aparatos(aparatos: Iterable) -> List[Optional[str]]:
+    """Proveedor de cada código de `aparatos` (None si ninguna regla lo cubre); cada código distinto se busca una vez."""
+    indice = obtener_indice_proveedores()
+    vistos: Dict[str, Optional[str]] = {}
+    resultado = []
+    for aparato in aparatos:
+        codigo = _normalizar_codigo(aparato)
+        if codigo not in vistos:
+            vistos[codigo] = indice.buscar(codigo)
+        resultado.append(vistos[codigo])
+    return resultado
+
+def obtener_reglas_proveedor() -> List[sqlite3.Row]:
+    return get_connection().execute(
+        "SELECT codigo, proveedor, exacto FROM proveedores_aparato ORDER BY codigo").fetchall()
+
+def obtener_proveedores() -> List[str]:
+    """Proveedores conocidos: los de las reglas y los que ya tienen los avisos."""
+    cur = get_connection().execute("""
+        SELECT proveedor FROM proveedores_aparato
+        UNION
+        SELECT DISTINCT proveedor FROM avisos WHERE proveedor IS NOT NULL AND proveedor <> ''
+        ORDER BY 1
+    """)
+    return [r[0] for r in cur.fetchall()]
+
+def guardar_reglas_proveedor(reglas: Iterable[tuple], reemplazar: bool = False) -> int:
+    """
+    reglas: (código, proveedor) o (código, proveedor, exacto). Sin `exacto` la regla
+    es un prefijo. reemplazar=True borra antes las demás. Devuelve las guardadas.
+    """
+    filas = []
+    for regla in reglas:
+        codigo, proveedor = _normalizar_codigo(regla[0]), (regla[1] or "").strip()
+        if not codigo or not proveedor:
+            raise ValueError(f"Regla de proveedor incompleta: {regla!r}")
+        filas.append((codigo, proveedor, int(bool(regla[2])) if len(regla) > 2 else 0))
+    with transaccion() as conn:
+        if reemplazar:
+            conn.execute("DELETE FROM proveedores_aparato")
+        conn.executemany("INSERT OR REPLACE INTO proveedores_aparato(codigo, proveedor, exacto) VALUES (?, ?, ?)",
+                         filas)
+        conn.execute("""
+            INSERT INTO avisos_meta(clave, valor) VALUES ('reglas_proveedor', 1)
+            ON CONFLICT(clave) DO UPDATE SET valor = valor + 1
+        """)
+    return len(filas)
+
+def borrar_regla_proveedor(codigo: str) -> bool:
+    with transaccion() as conn:
+        borrada = conn.execute("DELETE FROM proveedores_aparato WHERE codigo = ?",
+                               (_normalizar_codigo(codigo),)).rowcount > 0
+        if borrada:
+            conn.execute("UPDATE avisos_meta SET valor = valor + 1 WHERE clave = 'reglas_proveedor'")
+    return borrada
+
+def asignar_proveedores(sobrescribir: bool = False, lote: int = LOTE_PROVEEDORES) -> int:
+    """
+    Rellena proveedor, según las reglas, en los avisos que ya están en la base: una
+    pasada por idAviso en transacciones de `lote` avisos. Sin `sobrescribir` solo
+    toca los que no tienen proveedor. Devuelve los avisos actualizados.
+    """
+    indice = obtener_indice_proveedores()
+    if not len(indice):
+        return 0
+    filtro = "" if sobrescribir else "AND (proveedor IS NULL OR proveedor = '')"
+    ultimo, total = 0, 0
+    while True:
+        with transaccion() as conn:
+            filas = conn.execute(f"""
+                SELECT idAviso, aparato, proveedor FROM avisos
+                WHERE idAviso > ? AND aparato IS NOT NULL AND aparato <> '' {filtro}
+                ORDER BY idAviso LIMIT ?
+            """, (ultimo, lote)).fetchall()
+            if not filas:
+                return total
+            ultimo = filas[-1][0]
+            proveedores = obtener_proveedores_de_aparatos(f[1] for f in filas)
+            cambios = [(nuevo, f[0]) for f, nuevo in zip(filas, proveedores) if nuevo is not None and nuevo != f[2]]
+            if cambios:
+                conn.executemany("UPDATE avisos SET proveedor = ? WHERE idAviso = ?", cambios)
+        total += len(cambios)
+
+# --- Libro Excel de la web (tabla de trabajo) ---
+# app.py vuelca aquí el libro cada vez que cambia, y el listado se pide por
+# páginas con filtros y orden resueltos por índices: el coste de cada página no
+# depende de cuántas filas tenga el libro. Los filtros de texto ("contiene")
+# se buscan primero entre los valores distintos (libro_valores) y luego por
+# el índice con IN.
+
+_ORDENES_LIBRO = {"orden": "orden", "cliente": "cliente", "localidad": "localidad"}
+_FILTROS_LIBRO = ("localidad", "tecnico")
+
+class FilaLibro(NamedTuple):
+    fila: int
+    orden: str
+    cliente: str
+    aparato: str
+    localidad: str
+    tecnico: str
+    duplicado: bool  # ya está en avisos (o archivado)
+
+class PaginaLibro(NamedTuple):
+    filas: List[FilaLibro]
+    siguiente: Optional[str]  # cursores para despues= / antes=; None en los extremos
+    anterior: Optional[str]
+    total: int
+
+def obtener_firma_libro() -> Optional[str]:
+    """Firma del libro volcado en libro_filas (la que se pasó a cargar_libro)."""
+    fila = get_connection().execute("SELECT valor FROM avisos_meta WHERE clave = 'libro_web'").fetchone()
+    return fila[0] if fila else None
+
+def cargar_libro(firma: str, filas: Iterable[tuple]) -> bool:
+    """
+    Sustituye el libro de la tabla de trabajo. filas: (orden, cliente, aparato,
+    localidad, tecnico) en el orden del libro. Si ya estaba cargado con la misma
+    `firma` no hace nada y devuelve False.
+    """
+    with transaccion() as conn:
+        # el UPSERT toma el bloqueo de escritura: dos cargas a la vez no se pisan
+        if not conn.execute("""
+            INSERT INTO avisos_meta(clave, valor) VALUES ('libro_web', ?)
+            ON CONFLICT(clave) DO UPDATE SET valor = excluded.valor WHERE valor IS NOT excluded.valor
+        """, (firma,)).rowcount:
+            return False
+        conn.execute("DELETE FROM libro_filas")
+        conn.execute("DELETE FROM libro_valores")
+        conn.executemany(
+            "INSERT INTO libro_filas(orden, cliente, aparato, localidad, tecnico) VALUES (?, ?, ?, ?, ?)",
+            (tuple(v or "" for v in f) for f in filas))
+        for columna in _FILTROS_LIBRO:
+            valores = [r[0] for r in conn.execute(f"SELECT DISTINCT {columna} FROM libro_filas")]
+            conn.executemany("INSERT INTO libro_valores(columna, valor, valor_min) VALUES (?, ?, ?)",
+                             [(columna, v, v.lower()) for v in valores])
+        conn.execute("ANALYZE libro_filas")
+    return True
+
+def obtener_libro_pagina(
+    localidad: str = "",
+    tecnico: str = "",
+    ordenar: str = "orden",
+    tamano: int = TAMANO_PAGINA,
+    despues: Optional[str] = None,
+    antes: Optional[str] = None
+) -> PaginaLibro:
+    """
+    Una página del libro cargado con cargar_libro. localidad/tecnico: texto que
+    debe contener la columna (sin distinguir mayúsculas). ordenar: orden, cliente
+    o localidad. Para moverse se pasa el cursor siguiente (despues=) o anterior
+    (antes=) de la página actual, con los mismos filtros y orden.
+    """
+    columna = _ORDENES_LIBRO.get(ordenar)
+    if columna is None:
+        raise ValueError(f"Orden no válido: {ordenar!r}")
+    if tamano <= 0:
+        raise ValueError("El tamaño de página debe ser positivo")
+    filtro, params_filtro = "", []
+    for nombre, texto in zip(_FILTROS_LIBRO, (localidad, tecnico)):
+        texto = (texto or "").strip().lower()
+        if texto:
+            filtro += (f" AND l.{nombre} IN (SELECT valor FROM libro_valores"
+                       f" WHERE columna = '{nombre}' AND instr(valor_min, ?) > 0)")
+            params_filtro.append(texto)
+    conn = get_connection()
+    cursor = despues or antes
+    if cursor:
+        clave, total = _decodificar_cursor(cursor, 2)
+        op = ">" if despues else "<"
+        # el primer término repite la clave principal para que SQLite busque por rango en el índice
+        condicion = f" AND l.{columna} {op}= ? AND (l.{columna}, l.fila) {op} (?, ?)"
+        params = [clave[0]] + list(clave)
+    else:
+        total = conn.execute(f"SELECT COUNT(*) FROM libro_filas l WHERE 1 {filtro}", params_filtro).fetchone()[0]
+        condicion, params = "", []
+    sentido = "ASC" if despues or not antes else "DESC"
+    filas = conn.execute(f"""
+        SELECT l.fila, l.orden, l.cliente, l.aparato, l.localidad, l.tecnico,
+               EXISTS (SELECT 1 FROM avisos_todos t WHERE t.ordenInterna = l.orden)
+        FROM libro_filas l
+        WHERE 1 {filtro}{condicion}
+        ORDER BY l.{columna} {sentido}, l.fila {sentido}
+        LIMIT ?
+    """, params_filtro + params + [tamano + 1]).fetchall()
+    # se pide una fila de más para saber si hay página más allá
+    hay_mas = len(filas) > tamano
+    filas = [FilaLibro(*f[:6], bool(f[6])) for f in filas[:tamano]]
+    if sentido == "DESC":
+        filas.reverse()
+    clave_de = lambda f: _codificar_cursor([getattr(f, columna), f.fila], total)
+    siguiente = clave_de(filas[-1]) if filas and (hay_mas if not antes else True) else None
+    anterior = clave_de(filas[0]) if filas and (hay_mas if antes else bool(despues)) else None
+    return PaginaLibro(filas, siguiente, anterior, total)
+
+# --- Archivo de avisos cerrados ---
+# Los avisos cerrados (ESTADOS_CERRADOS) antiguos pasan de avisos a avisos_archivo
+# (en DB_ARCHIVO_PATH si está configurada) para que la tabla activa no crezca con
+# los años. El histórico completo se lee con la vista avisos_todos o con
+# incluir_archivo=True en las lecturas.
+
+DIAS_ARCHIVO = 365
+LOTE_ARCHIVO = 5000
+
+_COLUMNAS_ARCHIVO = ", ".join(["idAviso"] + [c for c, _ in _COLUMNAS_TIPOS])
+
+def _tablas_archivo() -> List[str]:
+    """Tablas de archivo; la primera es donde se archiva."""
+    return ["archivo.avisos_archivo", "main.avisos_archivo"] if DB_ARCHIVO_PATH else ["main.avisos_archivo"]
+
+# cerrados con visita anterior al límite o, si no tienen fecha de visita, asignados antes;
+# UNION ALL en lugar de OR para que la primera parte busque por rango en idx_avisos_estado
+_CERRADOS = ", ".join(str(e) for e in ESTADOS_CERRADOS)
+_SQL_ARCHIVABLES = f"""
+        SELECT idAviso FROM avisos
+        WHERE estado_code IN ({_CERRADOS}) AND fechaVisita < :limite AND NOT {_FILTRO_SIN_FECHA}
+        UNION ALL
+        SELECT idAviso FROM avisos
+        WHERE estado_code IN ({_CERRADOS}) AND {_FILTRO_SIN_FECHA}
+          AND fechaAsignacion GLOB '[0-9][0-9][0-9][0-9]-*' AND fechaAsignacion < :limite
+        LIMIT :lote
+"""
+
+def archivar_avisos(dias: int = DIAS_ARCHIVO, lote: int = LOTE_ARCHIVO) -> int:
+    """
+    Mueve a avisos_archivo los avisos cerrados de hace más de `dias` días, en
+    transacciones de `lote` avisos para no bloquear a los demás escritores.
+    Dejan 'A' en avisos_changes, no 'D' (ver _migracion_7). Devuelve los archivados.
+    """
+    destino = _tablas_archivo()[0]
+    limite = get_connection().execute("SELECT date('now', ?)", (f"-{int(dias)} days",)).fetchone()[0]
+    total = 0
+    while True:
+        with transaccion() as conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS archivar_ids (idAviso INTEGER PRIMARY KEY)")
+            conn.execute("DELETE FROM temp.archivar_ids")
+            n = conn.execute(f"INSERT INTO temp.archivar_ids {_SQL_ARCHIVABLES}",
+                             {"limite": limite, "lote": lote}).rowcount
+            if n:
+                conn.execute("INSERT OR REPLACE INTO avisos_meta(clave, valor) VALUES ('archivando', 1)")
+                # con el archivo en otra base (WAL) el commit no es atómico entre ambas:
+                # primero se copia (OR REPLACE: repetir el lote es inocuo) y luego se borra
+                conn.execute(f"""
+                    INSERT OR REPLACE INTO {destino} ({_COLUMNAS_ARCHIVO})
+                    SELECT {_COLUMNAS_ARCHIVO} FROM main.avisos
+                    WHERE idAviso IN (SELECT idAviso FROM temp.archivar_ids)
+                """)
+                conn.execute("""
+                    INSERT INTO avisos_changes(idAviso, ordenInterna, op)
+                    SELECT idAviso, ordenInterna, 'A' FROM main.avisos
+                    WHERE idAviso IN (SELECT idAviso FROM temp.archivar_ids) ORDER BY idAviso
+                """)
+                conn.execute("DELETE FROM main.avisos WHERE idAviso IN (SELECT idAviso FROM temp.archivar_ids)")
+                conn.execute("DELETE FROM avisos_meta WHERE clave = 'archivando'")
+        total += n
+        if n < lote:
+            return total
+
+def desarchivar_avisos(ordenes: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Devuelve a avisos (p.ej. para reabrirlos) avisos archivados, conservando su idAviso.
+    {orden: None si se desarchivó, o el motivo del fallo}.
+    """
+    resultado = {}
+    ordenes = list(dict.fromkeys(str(o) for o in ordenes if o))
+    with transaccion() as conn:
+        activas = _ordenes_existentes(conn, ordenes)
+        for orden in ordenes:
+            if orden in activas:
+                resultado[orden] = "La orden ya está en avisos"
+                continue
+            resultado[orden] = "La orden no está archivada"
+            for tabla in _tablas_archivo():
+                cur = conn.execute(f"""
+                    INSERT INTO main.avisos ({_COLUMNAS_ARCHIVO})
+                    SELECT {_COLUMNAS_ARCHIVO} FROM {tabla} WHERE ordenInterna = ?
+                """, (orden,))
+                if cur.rowcount:
+                    conn.execute(f"DELETE FROM {tabla} WHERE ordenInterna = ?", (orden,))
+                    resultado[orden] = None
+                    break
+    return resultado
+
+# --- Instrumentación ---
+# Todas las funciones públicas quedan envueltas (al final del módulo): tiempo,
+# filas devueltas y filas de avisos afectadas, con histograma por función. Las
+# llamadas que superan UMBRAL_LENTA_MS se guardan (con su EXPLAIN QUERY PLAN)
+# en stats()["lentas"] y en el logger "db.lentas"; con DB_LOG_LENTAS=ruta,
+# también en ese fichero.
+
+UMBRAL_LENTA_MS = float(os.environ.get("DB_UMBRAL_LENTA_MS") or 100)
+MAX_LENTAS = 50
+MAX_SENTENCIAS_TRAZA = 20
+CUBETAS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+log_lentas = logging.getLogger("db.lentas")
+if os.environ.get("DB_LOG_LENTAS"):
+    _manejador = logging.FileHandler(os.environ["DB_LOG_LENTAS"], encoding="utf-8")
+    _manejador.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    log_lentas.addHandler(_manejador)
+    log_lentas.setLevel(logging.INFO)
+
+_metricas = {}                      # nombre -> dict de contadores
+_lentas = deque(maxlen=MAX_LENTAS)
+
+# no se miden: infraestructura, o llamadas que no son consultas
+_SIN_INSTRUMENTAR = {"get_connection", "transaccion", "carga_masiva", "cerrar_conexiones", "estadisticas_cache",
+                     "limpiar_cache", "stats", "reiniciar_stats", "codigo_estado"}
+
+def _trazar(sql: str):
+    # trace callback: recibe el SQL con los parámetros ya expandidos
+    sentencias = getattr(_local, "sentencias", None)
+    if sentencias is None:
+        return
+    sentencias.append(sql)
+    if len(sentencias) >= MAX_SENTENCIAS_TRAZA:
+        _local.conn.set_trace_callback(None)  # ya hay bastantes: el resto de la llamada sin coste
+
+def _capturar(conn, sentencias: Optional[list]):
+    """
+    Sentencias que anota _trazar a partir de ahora (None: ninguna). El trace
+    callback cuesta una llamada a Python por sentencia (p.ej. cada fila de un
+    executemany), así que solo está puesto mientras hay dónde anotar.
+    """
+    _local.sentencias = sentencias
+    try:
+        conn.set_trace_callback(
+            _trazar if sentencias is not None and len(sentencias) < MAX_SENTENCIAS_TRAZA else None)
+    except sqlite3.ProgrammingError:
+        pass  # conexión cerrada durante la llamada
+
+def _seq_cambios(conn) -> int:
+    # cada fila de avisos insertada, modificada o borrada añade una entrada a avisos_changes
+    fila = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'avisos_changes'").fetchone()
+    return fila[0] if fila else 0
+
+def _contar_filas(resultado) -> int:
+    if isinstance(resultado, Pagina):
+        return len(resultado.avisos)
+    if isinstance(resultado, PaginaLibro):
+        return len(resultado.filas)
+    if isinstance(resultado, (list, dict)):
+        return len(resultado)
+    return 1 if resultado is not None else 0
+
+def _planes(conn, sentencias: List[str]) -> List[Dict]:
+    planes = []
+    for sql in dict.fromkeys(sentencias):  # sin repetidas, en orden
+        if not re.match(r"\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b", sql, re.IGNORECASE):
+            continue
+        try:
+            plan = [fila[3] for fila in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+        except sqlite3.Error as e:
+            plan = [f"(sin plan: {e})"]
+        planes.append({"sql": " ".join(sql.split()), "plan": plan})
+    return planes
+
+def _registrar_llamada(nombre: str, ms: float, filas: int, afectadas: int, error: bool, sentencias):
+    with _stats_lock:
+        m = _metricas.get(nombre)
+        if m is None:
+            m = _metricas[nombre] = {"llamadas": 0, "errores": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                     "filas_devueltas": 0, "filas_afectadas": 0,
+                                     "histograma_ms": [0] * (len(CUBETAS_MS) + 1)}
+        m["llamadas"] += 1
+        m["errores"] += int(error)
+        m["total_ms"] += ms
+        m["max_ms"] = max(m["max_ms"], ms)
+        m["filas_devueltas"] += filas
+        m["filas_afectadas"] += afectadas
+        m["histograma_ms"][bisect.bisect_left(CUBETAS_MS, ms)] += 1
+    if ms >= UMBRAL_LENTA_MS:
+        lenta = {"funcion": nombre, "ms": round(ms, 1), "filas": filas, "afectadas": afectadas,
+                 "cuando": time.strftime("%Y-%m-%d %H:%M:%S"),
+                 "sentencias": _planes(get_connection(), sentencias)}
+        with _stats_lock:
+            _lentas.append(lenta)
+        log_lentas.info(json.dumps(lenta, ensure_ascii=False))
+
+def _iterar_medido(nombre: str, it, inicio: float, sentencias):
+    filas, error = 0, False
+    try:
+        for fila in it:
+            filas += 1
+            yield fila
+    except BaseException:
+        error = True
+        raise
+    finally:
+        _registrar_llamada(nombre, (time.perf_counter() - inicio) * 1000, filas, 0, error, sentencias)
+
+def _instrumentado(fn, escritura: bool):
+    @functools.wraps(fn)
+    def envoltura(*args, **kwargs):
+        conn = get_connection()
+        seq = _seq_cambios(conn) if escritura else 0
+        anteriores = getattr(_local, "sentencias", None)
+        sentencias = []
+        _capturar(conn, sentencias)
+        inicio = time.perf_counter()
+        try:
+            resultado = fn(*args, **kwargs)
+        except BaseException:
+            _registrar_llamada(fn.__name__, (time.perf_counter() - inicio) * 1000, 0, 0, True, sentencias)
+            raise
+        finally:
+            _capturar(conn, anteriores)
+        if inspect.isgenerator(resultado):
+            # se mide hasta que se termina de recorrer
+            return _iterar_medido(fn.__name__, resultado, inicio, sentencias)
+        ms = (time.perf_counter() - inicio) * 1000
+        afectadas = _seq_cambios(conn) - seq if escritura else 0
+        _registrar_llamada(fn.__name__, ms, _contar_filas(resultado), afectadas, False, sentencias)
+        return resultado
+    return envoltura
+
+def stats() -> Dict:
+    """
+    Instantánea de las métricas: por función (llamadas, errores, tiempos, filas e
+    histograma con cubetas CUBETAS_MS + resto), consultas lentas recientes y caché.
+    """
+    with _stats_lock:
+        funciones = {}
+        for nombre, m in sorted(_metricas.items()):
+            f = dict(m, histograma_ms=list(m["histograma_ms"]))
+            f["media_ms"] = round(m["total_ms"] / m["llamadas"], 3) if m["llamadas"] else 0.0
+            f["total_ms"] = round(m["total_ms"], 3)
+            f["max_ms"] = round(m["max_ms"], 3)
+            funciones[nombre] = f
+        lentas = list(_lentas)
+    return {
+        "funciones": funciones,
+        "cubetas_ms": list(CUBETAS_MS),
+        "umbral_lenta_ms": UMBRAL_LENTA_MS,
+        "lentas": lentas,
+        "cache": estadisticas_cache(),
+    }
+
+def reiniciar_stats():
+    with _stats_lock:
+        _metricas.clear()
+        _lentas.clear()
+
+def _instrumentar_modulo():
+    for nombre, fn in list(globals().items()):
+        if (nombre.startswith("_") or nombre in _SIN_INSTRUMENTAR or not inspect.isfunction(fn)
+                or fn.__module__ != __name__):
+            continue
+        escritura = not nombre.startswith(("obtener_", "buscar_", "conteo_", "iter_", "cambios_", "ultimo_"))
+        globals()[nombre] = _instrumentado(fn, escritura)
+
+_instrumentar_modulo()
@@ -0,0 +1,144 @@
+"""
+Fachada asíncrona de db.py.
+
+Las consultas se ejecutan en un pool acotado de hilos propios; cada hilo usa su
+propia conexión (db.get_connection es por hilo). Cada función devuelve un
+concurrent.futures.Future:
+
+    fut = db_async.obtener_avisos_por_fecha("2025-10-13")
+    fut.add_done_callback(...)                  # Qt, callbacks...
+    avisos = await db_async.esperar(fut)        # asyncio
+
+cancelar(fut) anula una consulta en cola o interrumpe (conn.interrupt()) la que
+ya está en marcha; ConsultaUnica cancela la anterior al lanzar una nueva (p.ej.
+mientras el usuario sigue escribiendo en un buscador).
+"""
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, CancelledError
+from typing import Optional
+
+import db
+
+MAX_HILOS = 3
+
+_executor = None
+_executor_lock = threading.Lock()
+_en_marcha = {}   # Future -> conexión que lo está ejecutando
+_en_marcha_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_HILOS, thread_name_prefix="db_async")
+        return _executor
+
+def _ejecutar(futuro: Future, fn, args, kwargs):
+    if not futuro.set_running_or_notify_cancel():
+        return  # cancelado mientras esperaba en la cola
+    conn = db.get_connection()
+    with _en_marcha_lock:
+        _en_marcha[futuro] = conn
+    try:
+        resultado = fn(*args, **kwargs)
+    except sqlite3.OperationalError as e:
+        with _en_marcha_lock:
+            interrumpido = _en_marcha.pop(futuro, None) is None
+        # cancelar() ya sacó el futuro de _en_marcha: la interrupción fue nuestra
+        futuro.set_exception(CancelledError() if interrumpido else e)
+    except BaseException as e:
+        with _en_marcha_lock:
+            _en_marcha.pop(futuro, None)
+        futuro.set_exception(e)
+    else:
+        with _en_marcha_lock:
+            interrumpido = _en_marcha.pop(futuro, None) is None
+        if interrumpido:
+            futuro.set_exception(CancelledError())
+        else:
+            futuro.set_result(resultado)
+
+def ejecutar(fn, *args, **kwargs) -> Future:
+    """Ejecuta fn(*args, **kwargs) (normalmente una función de db) en el pool."""
+    futuro = Future()
+    _get_executor().submit(_ejecutar, futuro, fn, args, kwargs)
+    return futuro
+
+def cancelar(futuro: Future) -> bool:
+    """
+    Cancela la consulta: si aún está en cola no llega a ejecutarse; si está en marcha
+    se interrumpe y el futuro termina con CancelledError. False si ya había terminado.
+    """
+    if futuro.cancel():
+        return True
+    with _en_marcha_lock:
+        conn = _en_marcha.pop(futuro, None)
+        if conn is None:
+            return False
+        # bajo el lock: el hilo no puede haber pasado a otra consulta con esta conexión
+        conn.interrupt()
+    return True
+
+def esperar(futuro: Future) -> "asyncio.Future":
+    """Awaitable para asyncio; cancelarlo desde asyncio cancela también la consulta."""
+    afuturo = asyncio.wrap_future(futuro)
+    afuturo.add_done_callback(lambda f: cancelar(futuro) if f.cancelled() else None)
+    return afuturo
+
+def cerrar(esperar_pendientes: bool = True):
+    """Para el pool de hilos (se vuelve a crear si se lanza otra consulta)."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=esperar_pendientes, cancel_futures=not esperar_pendientes)
+
+class ConsultaUnica:
+    """Mantiene solo la última consulta lanzada: cada lanzar() cancela la anterior."""
+
+    def __init__(self):
+        self._futuro: Optional[Future] = None
+        self._lock = threading.Lock()
+
+    def lanzar(self, fn, *args, **kwargs) -> Future:
+        futuro = ejecutar(fn, *args, **kwargs)
+        with self._lock:
+            anterior, self._futuro = self._futuro, futuro
+        if anterior is not None:
+            cancelar(anterior)
+        return futuro
+
+    def cancelar(self):
+        with self._lock:
+            anterior, self._futuro = self._futuro, None
+        if anterior is not None:
+            cancelar(anterior)
+
+# --- Funciones de db.py en el pool ---
+
+def _envolver(nombre):
+    fn = getattr(db, nombre)
+    def envoltura(*args, **kwargs) -> Future:
+        return ejecutar(fn, *args, **kwargs)
+    envoltura.__name__ = nombre
+    envoltura.__doc__ = f"Como db.{nombre}, pero devuelve un Future." + (
+        "\n\n" + fn.__doc__ if fn.__doc__ else "")
+    return envoltura
+
+# las funciones iter_* no se exponen: sus generadores se consumirían fuera del pool
+_FUNCIONES = [
+    "obtener_avisos_pendientes", "obtener_avisos_por_fecha", "obtener_todos_los_avisos",
+    "obtener_avisos_sin_fecha", "obtener_fechas_con_avisos", "conteo_por_fecha",
+    "buscar_avisos", "obtener_avisos_pagina", "obtener_avisos_sin_fecha_pagina",
+    "ultimo_cambio", "cambios_desde",
+    "actualizar_aviso", "actualizar_aviso_campos_basicos", "marcar_realizado",
+    "marcar_anulado", "marcar_desanulado", "actualizar_avisos_bulk",
+    "marcar_realizado_bulk", "marcar_anulado_bulk", "archivar_avisos", "desarchivar_avisos",
+    "asignar_proveedores",
+]
+
+for _nombre in _FUNCIONES:
+    globals()[_nombre] = _envolver(_nombre)
+del _nombre
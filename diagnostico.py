@@ -0,0 +1,77 @@
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QPushButton,
+    QLabel, QPlainTextEdit, QHeaderView
+)
+from PySide6.QtCore import Qt
+import db
+
+class DialogoDiagnostico(QDialog):
+    """Muestra db.stats(): tiempos por función, histogramas y consultas lentas."""
+
+    COLUMNAS = ["Función", "Llamadas", "Errores", "Media ms", "Máx ms", "Total ms",
+                "Filas devueltas", "Filas afectadas", "Histograma"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Diagnóstico de base de datos")
+        self.resize(1000, 600)
+        layout = QVBoxLayout(self)
+
+        self.lbl_resumen = QLabel("")
+        layout.addWidget(self.lbl_resumen)
+
+        self.tabla = QTableWidget(0, len(self.COLUMNAS))
+        self.tabla.setHorizontalHeaderLabels(self.COLUMNAS)
+        self.tabla.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.tabla.setSortingEnabled(True)
+        self.tabla.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        layout.addWidget(self.tabla, 3)
+
+        layout.addWidget(QLabel("Consultas lentas (más recientes al final):"))
+        self.txt_lentas = QPlainTextEdit(); self.txt_lentas.setReadOnly(True)
+        layout.addWidget(self.txt_lentas, 2)
+
+        botones = QHBoxLayout(); botones.addStretch()
+        btn_reiniciar = QPushButton("Reiniciar"); btn_reiniciar.clicked.connect(self._reiniciar); botones.addWidget(btn_reiniciar)
+        btn_refrescar = QPushButton("Refrescar"); btn_refrescar.clicked.connect(self.refrescar); botones.addWidget(btn_refrescar)
+        btn_cerrar = QPushButton("Cerrar"); btn_cerrar.clicked.connect(self.accept); botones.addWidget(btn_cerrar)
+        layout.addLayout(botones)
+
+        self.refrescar()
+
+    def _item(self, valor):
+        item = QTableWidgetItem()
+        item.setData(Qt.DisplayRole, valor)  # numérico: ordena como número
+        return item
+
+    def refrescar(self):
+        s = db.stats()
+        cubetas = [f"<{c}" for c in s["cubetas_ms"]] + [f">={s['cubetas_ms'][-1]}"]
+        self.tabla.setSortingEnabled(False)
+        self.tabla.setRowCount(0)
+        for nombre, m in s["funciones"].items():
+            fila = self.tabla.rowCount(); self.tabla.insertRow(fila)
+            histo = "  ".join(f"{c}:{n}" for c, n in zip(cubetas, m["histograma_ms"]) if n)
+            valores = [nombre, m["llamadas"], m["errores"], m["media_ms"], m["max_ms"], m["total_ms"],
+                       m["filas_devueltas"], m["filas_afectadas"], histo]
+            for col, valor in enumerate(valores):
+                self.tabla.setItem(fila, col, self._item(valor))
+        self.tabla.setSortingEnabled(True)
+
+        cache = s["cache"]
+        self.lbl_resumen.setText(
+            f"Umbral de consulta lenta: {s['umbral_lenta_ms']:g} ms  ·  "
+            f"Caché: {cache.get('aciertos', 0)} aciertos, {cache.get('fallos', 0)} fallos, "
+            f"{cache.get('invalidaciones', 0)} invalidaciones")
+
+        lineas = []
+        for l in s["lentas"]:
+            lineas.append(f"[{l['cuando']}] {l['funcion']}: {l['ms']} ms, {l['filas']} filas, {l['afectadas']} afectadas")
+            for sent in l["sentencias"]:
+                lineas.append(f"    {sent['sql']}")
+                lineas.extend(f"      → {p}" for p in sent["plan"])
+        self.txt_lentas.setPlainText("\n".join(lineas) or "Ninguna.")
+
+    def _reiniciar(self):
+        db.reiniciar_stats()
+        self.refrescar()
@@ -96,7 +96,11 @@ class EditarAvisoDialog(QDialog):
         self.input_telefono.setText(a.get("telefono", a.get("telefono1", "")) or "")
         self.input_proveedor.setText(a.get("proveedor", "") or "")
         self.combo_tipoOperacion.setCurrentText(a.get("tipoOperacion", "") or "")
-        self.combo_estado.setCurrentText(a.get("estado", "") or "")
+        # un aviso cerrado (realizado, anulado) muestra su estado aunque no se ofrezca
+        self._estado_inicial = a.get("estado", "") or ""
+        if self.combo_estado.findText(self._estado_inicial) < 0:
+            self.combo_estado.addItem(self._estado_inicial)
+        self.combo_estado.setCurrentText(self._estado_inicial)
         self.input_observaciones.setText(a.get("observaciones", "") or "")
         self.input_cobro.setText(str(a.get("cobro", "")) or "")
 
@@ -202,7 +206,6 @@ class EditarAvisoDialog(QDialog):
             "telefono": telefono or None,
             "proveedor": proveedor or None,
             "tipoOperacion": tipoOperacion or None,
-            "estado": estado or None,
             "fechaVisita": fechaVisita,
             "turno": turno,
             "horaInicio": hi,
@@ -210,6 +213,9 @@ class EditarAvisoDialog(QDialog):
             "observaciones": observaciones or None,
             "cobro": cobro
         }
+        # el estado solo se manda si se ha cambiado: db.actualizar_aviso comprueba la transición
+        if estado != self._estado_inicial:
+            datos["estado"] = estado or None
 
         try:
             self.guardar_callback(datos)
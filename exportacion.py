@@ -0,0 +1,132 @@
+import json
+from datetime import datetime
+
+# Normalización de avisos para la app móvil (sin dependencias de Qt, para poder
+# usarse desde la app de escritorio, scripts o Flask).
+
+def _s(s):
+    if s is None:
+        return ""
+    s = str(s).strip()
+    if s.lower() in {"nan", "none", "null"}:
+        return ""
+    return s
+
+def _bool_from_db(v):
+    if v in (1, True, "1", "true", "TRUE", "True", "sí", "si", "SI"):
+        return True
+    return False
+
+def normalizar_aviso(av):
+    tel1 = _s(av.get("telefono1"))
+    tel2 = _s(av.get("telefono2"))
+    telefonos = [t for t in (tel1, tel2) if t]
+    return {
+        "id": av.get("idAviso"),
+        "orden": _s(av.get("ordenInterna") or av.get("ordenTrabajo")),
+        "cliente": _s(av.get("cliente")),
+        "direccion": _s(av.get("direccion")),
+        "localidad": _s(av.get("localidad")),
+        "cp": _s(av.get("codigoPostal")),
+        "telefonos": telefonos,
+        "aparato": _s(av.get("aparato")),
+        "marca": _s(av.get("marca")),
+        "modelo": _s(av.get("modelo")),
+        "averia": _s(av.get("averia")),
+        "tipoServicio": _s(av.get("tipoServicio")),
+        "tipoOperacion": _s(av.get("tipoOperacion")),
+        "conCargo": _bool_from_db(av.get("conCargo")),
+        "importe": av.get("importe"),
+        "metodoPago": _s(av.get("metodoPago")),
+        "notas": _s(av.get("observacionesCobro")),  # app móvil leerá este campo
+        "estado": _s(av.get("estado")),
+        "fechaVisita": _s(av.get("fechaVisita")),
+        "turno": _s(av.get("turno")),
+        "tecnico": _s(av.get("tecnico")),
+        "horaInicio": _s(av.get("horaInicio")),
+        "horaFin": _s(av.get("horaFin")),
+        "proveedor": _s(av.get("proveedor")),
+        "estadoCita": _s(av.get("estadoCita")),
+    }
+
+def _clave_turno(turno):
+    turno = (turno or "").lower()
+    return "mañana" if turno.startswith("ma") else "tarde" if turno.startswith("ta") else "sin_turno"
+
+def agrupar_por_dia_y_turno(avisos):
+    dias = {}
+    sin_fecha = []
+    for av in avisos:
+        nav = normalizar_aviso(av)
+        f = nav.get("fechaVisita") or ""
+        if not f:
+            sin_fecha.append(nav)
+            continue
+        if f not in dias:
+            dias[f] = {"mañana": [], "tarde": [], "sin_turno": []}
+        dias[f][_clave_turno(nav.get("turno"))].append(nav)
+    out = {"dias": dias}
+    if sin_fecha:
+        out["sin_fecha"] = sin_fecha
+    return out
+
+def _indentar(texto, espacios):
+    pad = " " * espacios
+    return texto.replace("\n", "\n" + pad)
+
+def escribir_json_todos(f, avisos, generated_at=None, cabecera=None):
+    """
+    Escribe en `f` el mismo JSON que agrupar_por_dia_y_turno, pero en streaming:
+    `avisos` debe venir ordenado por fechaVisita (p.ej. db.iter_avisos()) y solo se
+    mantiene en memoria el día en curso y los avisos sin fecha.
+    `cabecera`: claves extra que se escriben tras "generated_at".
+    Devuelve el número total de avisos escritos.
+    """
+    if generated_at is None:
+        generated_at = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+    f.write('{\n  "version": 1,\n  "generated_at": %s,' % json.dumps(generated_at))
+    for clave, valor in (cabecera or {}).items():
+        f.write('\n  %s: %s,' % (json.dumps(clave), json.dumps(valor, ensure_ascii=False)))
+    f.write('\n  "dias": {')
+
+    total = 0
+    sin_fecha = []
+    dia_actual, grupos = None, None
+    primero = True
+
+    def volcar_dia():
+        nonlocal primero
+        if dia_actual is None:
+            return
+        f.write("" if primero else ",")
+        f.write("\n    %s: %s" % (json.dumps(dia_actual, ensure_ascii=False),
+                                  _indentar(json.dumps(grupos, ensure_ascii=False, indent=2), 4)))
+        primero = False
+
+    for av in avisos:
+        total += 1
+        nav = normalizar_aviso(av)
+        dia = nav.get("fechaVisita") or ""
+        if not dia:
+            sin_fecha.append(nav)
+            continue
+        if dia != dia_actual:
+            volcar_dia()
+            dia_actual, grupos = dia, {"mañana": [], "tarde": [], "sin_turno": []}
+        grupos[_clave_turno(nav.get("turno"))].append(nav)
+    volcar_dia()
+
+    f.write("\n  }" if not primero else "}")
+    if sin_fecha:
+        f.write(',\n  "sin_fecha": %s' % _indentar(json.dumps(sin_fecha, ensure_ascii=False, indent=2), 2))
+    f.write(',\n  "total": %d\n}' % total)
+    return total
+
+def escribir_json_cambios(f, avisos, borrados, desde, hasta, generated_at=None):
+    """
+    Exportación incremental: como escribir_json_todos, pero solo con los avisos
+    cambiados entre los seq `desde` y `hasta` del registro de cambios
+    (db.iter_avisos_cambiados) y la lista de órdenes borradas.
+    """
+    cabecera = {"incremental": True, "desde": desde, "hasta": hasta, "borrados": list(borrados)}
+    return escribir_json_todos(f, avisos, generated_at=generated_at, cabecera=cabecera)
@@ -0,0 +1,171 @@
+"""
+Generador determinista de datos sintéticos (misma semilla -> mismos datos).
+
+    python generar_datos.py --filas 100000 --db /tmp/avisos_100k.db
+    python generar_datos.py --filas 5000 --excel /tmp/rutas.xlsx --formato flask
+
+Genera avisos con nombres, direcciones y localidades gallegas/españolas, estados,
+turnos y fechas mezclados (incluidos avisos sin fecha y valores vacíos), y los
+libros Excel que leen app.py (formato "flask") e importar_excel.py ("importador").
+"""
+import argparse
+import os
+import random
+from datetime import date, timedelta
+
+NOMBRES = ["José", "María", "Manuel", "Carmen", "Antonio", "Ana", "Francisco", "Laura", "Javier",
+           "Lucía", "David", "Marta", "Xosé", "Uxía", "Brais", "Iria", "Pablo", "Sara", "Andrés", "Noelia"]
+APELLIDOS = ["García", "Fernández", "González", "Rodríguez", "López", "Martínez", "Pérez", "Sánchez",
+             "Vázquez", "Castro", "Núñez", "Otero", "Iglesias", "Rey", "Domínguez", "Álvarez", "Souto", "Piñeiro"]
+VIAS = ["Calle", "Avenida", "Rúa", "Praza", "Camiño", "Travesía", "Plaza", "Paseo"]
+NOMBRES_VIA = ["Mayor", "de Vigo", "do Príncipe", "de España", "Real", "Rosalía de Castro",
+               "García Barbón", "Curros Enríquez", "de la Constitución", "Castelao", "Gran Vía",
+               "Urzaiz", "do Mar", "San Roque", "Concepción Arenal"]
+LOCALIDADES = [("VIGO", "362"), ("PONTEVEDRA", "360"), ("REDONDELA", "368"), ("CANGAS", "369"),
+               ("MARÍN", "369"), ("O PORRIÑO", "364"), ("SANXENXO", "369"), ("VILAGARCÍA DE AROUSA", "366"),
+               ("OURENSE", "320"), ("SANTIAGO DE COMPOSTELA", "157"), ("A CORUÑA", "150"), ("LUGO", "270")]
+APARATOS = ["LAV", "FRI", "LVV", "SEC", "HOR", "MIC", "VIT", "CAL", "TV", "AA"]
+MARCAS = ["Balay", "Bosch", "Siemens", "Fagor", "Teka", "Zanussi", "AEG", "LG", "Samsung", "Beko", ""]
+AVERIAS = ["No enciende", "Hace ruido al centrifugar", "No enfría", "Pierde agua por la puerta",
+           "Salta el diferencial", "No calienta", "Error E21 en pantalla", "Olor a quemado",
+           "No desagua", "La puerta no cierra", "Revisar instalación"]
+TECNICOS = ["Iván", "Rubén", "Óscar", "Marcos", "Diego", "Alberto", ""]
+TIPOS_OPERACION = ["reparación", "instalación", "revisión", "recogida", ""]
+# (valor, peso): estados mezclados, incluidos vacíos y variantes de mayúsculas
+ESTADOS = [("pendiente", 30), ("Pendiente", 5), ("sin asignar", 20), ("realizado", 25),
+           ("anulado", 8), ("cancelado", 3), ("", 5), (None, 4)]
+TURNOS = [("mañana", 50), ("tarde", 40), ("", 5), (None, 5)]
+HORAS = {"mañana": [("09:00", "11:00"), ("10:00", "12:00"), ("11:00", "13:00")],
+         "tarde": [("15:00", "17:00"), ("16:00", "18:00"), ("17:00", "19:00")]}
+
+FECHA_BASE = date(2023, 1, 2)
+DIAS_RANGO = 3 * 365
+PROPORCION_SIN_FECHA = 0.12
+
+# orden de las columnas de las tuplas que devuelve generar_avisos
+COLUMNAS = ["ordenInterna", "cliente", "direccion", "localidad", "codigoPostal", "telefono1",
+            "telefono2", "aparato", "marca", "modelo", "fechaAsignacion", "averia", "tipoServicio",
+            "conCargo", "importe", "metodoPago", "observacionesCobro", "estado", "fechaVisita",
+            "tecnico", "turno", "proveedor", "estadoCita", "tipoOperacion", "horaInicio", "horaFin"]
+
+
+def _elegir(rnd, opciones):
+    valores, pesos = zip(*opciones)
+    return rnd.choices(valores, weights=pesos)[0]
+
+
+def generar_avisos(filas, semilla=1234):
+    """Tuplas en el orden de COLUMNAS; ordenInterna única (100000000 + i)."""
+    rnd = random.Random(semilla)
+    for i in range(filas):
+        localidad, prefijo_cp = rnd.choice(LOCALIDADES)
+        turno = _elegir(rnd, TURNOS)
+        estado = _elegir(rnd, ESTADOS)
+        sin_fecha = rnd.random() < PROPORCION_SIN_FECHA
+        fecha = None if sin_fecha else (FECHA_BASE + timedelta(days=rnd.randrange(DIAS_RANGO))).isoformat()
+        hora_inicio, hora_fin = rnd.choice(HORAS[turno]) if turno in HORAS and fecha else (None, None)
+        asignacion = FECHA_BASE + timedelta(days=rnd.randrange(DIAS_RANGO))
+        con_cargo = rnd.random() < 0.3
+        yield (
+            str(100000000 + i),
+            f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}",
+            f"{rnd.choice(VIAS)} {rnd.choice(NOMBRES_VIA)} {rnd.randint(1, 250)}, {rnd.randint(1, 8)}º",
+            localidad,
+            f"{prefijo_cp}{rnd.randint(0, 99):02d}",
+            f"6{rnd.randint(10000000, 99999999)}",
+            f"986{rnd.randint(100000, 999999)}" if rnd.random() < 0.4 else None,
+            f"{rnd.choice(APARATOS)}{rnd.randint(100, 9999)}",
+            rnd.choice(MARCAS),
+            None,
+            asignacion.isoformat(),
+            rnd.choice(AVERIAS),
+            rnd.choice(["Reparación", "Recogida", "Garantía"]),
+            int(con_cargo),
+            round(rnd.uniform(30, 250), 2) if con_cargo else None,
+            rnd.choice(["efectivo", "tarjeta", "bizum"]) if con_cargo else None,
+            None,
+            estado,
+            fecha,
+            rnd.choice(TECNICOS) if fecha else None,
+            turno,
+            None,
+            None,
+            rnd.choice(TIPOS_OPERACION),
+            hora_inicio,
+            hora_fin,
+        )
+
+
+def crear_db(ruta, filas, semilla=1234, lote=10000):
+    """Crea (o amplía) la base `ruta` con el esquema de db.py y `filas` avisos sintéticos."""
+    import db
+    db.cerrar_conexiones()
+    db.DB_PATH = ruta
+    columnas = ", ".join(COLUMNAS)
+    sql = f"INSERT INTO avisos ({columnas}) VALUES ({', '.join('?' * len(COLUMNAS))})"
+    avisos = generar_avisos(filas, semilla)
+    with db.carga_masiva() as conn:
+        while True:
+            bloque = [a for _, a in zip(range(lote), avisos)]
+            if not bloque:
+                break
+            conn.executemany(sql, bloque)
+    db.get_connection().execute("ANALYZE")
+    db.cerrar_conexiones()
+
+
+def dataframe_flask(filas, semilla=1234):
+    """Libro con las columnas que lee app.py (reparacion, NOMBRE, apel1, TELE1...)."""
+    import pandas as pd
+    filas_df = []
+    for a in generar_avisos(filas, semilla):
+        nombre, apel1 = a[1].split(" ", 1)
+        filas_df.append({
+            "Id": len(filas_df) + 1, "NOMBRE": nombre, "apel1": apel1, "DIRECCION": a[2],
+            "LOCALIDAD": a[3], "CODIGOPOSTAL": a[4], "TELE1": a[5], "TELE2": a[6] or "",
+            "aparato": a[7], "marca": a[8], "modelo": "", "fecha1": a[10], "averia2": a[11],
+            "reparacion": a[0], "FINAL": "",
+        })
+    return pd.DataFrame(filas_df)
+
+
+def dataframe_importador(filas, semilla=1234):
+    """Libro con las columnas que lee importar_excel.py (ORDEN INTERNA, POBLACION...)."""
+    import pandas as pd
+    filas_df = []
+    for a in generar_avisos(filas, semilla):
+        filas_df.append({
+            "ORDEN INTERNA": a[0], "ORDEN TRABAJO": f"OT{a[0]}", "CLIENTE": a[1], "DIRECCION": a[2],
+            "POBLACION": a[3], "TELEFONO": a[5], "APARATO": a[7], "FECHA VISITA": a[18], "HORA INICIO": a[24] or "",
+            "TURNO": a[20] or "", "OBSERVACIONES": a[11],
+        })
+    return pd.DataFrame(filas_df)
+
+
+def crear_excel(ruta, filas, formato="flask", semilla=1234):
+    df = dataframe_flask(filas, semilla) if formato == "flask" else dataframe_importador(filas, semilla)
+    df.to_excel(ruta, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=10000)
+    parser.add_argument("--semilla", type=int, default=1234)
+    parser.add_argument("--db", help="Ruta de la base SQLite a crear")
+    parser.add_argument("--excel", help="Ruta del libro Excel a crear")
+    parser.add_argument("--formato", choices=["flask", "importador"], default="flask")
+    args = parser.parse_args()
+    if not args.db and not args.excel:
+        parser.error("indica --db y/o --excel")
+    if args.db:
+        if os.path.exists(args.db):
+            parser.error(f"{args.db} ya existe")
+        crear_db(args.db, args.filas, args.semilla)
+        print(f"{args.filas} avisos en {args.db}")
+    if args.excel:
+        crear_excel(args.excel, args.filas, args.formato, args.semilla)
+        print(f"{args.filas} filas en {args.excel} (formato {args.formato})")
+
+
+if __name__ == "__main__":
+    main()
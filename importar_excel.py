@@ -1,11 +1,236 @@
+"""
+Importa los Excel del proveedor (ORDEN INTERNA, POBLACION, FECHA VISITA...) en avisos.
+
+    python importar_excel.py                          # diálogo para elegir un archivo
+    python importar_excel.py carpeta/ otro.xlsx       # sin interfaz: archivos y/o carpetas
+    python importar_excel.py exportes/ --procesos 8 --db /ruta/avisos.db
+
+Sin interfaz, los libros se leen y normalizan en paralelo (un proceso por libro)
+y un único escritor inserta lo que llega en transacciones grandes; al final se
+muestra, por archivo, filas leídas, nuevas, actualizadas, sin cambios y filas por segundo.
+
+Reimportar un archivo solo escribe lo que cambió: cada aviso guarda el hash de sus
+datos de proveedor (db.reimportar_avisos).
+"""
+import argparse
+import hashlib
+import itertools
+import json
 import os
-import sqlite3
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import Manager
+
 import pandas as pd
-from datetime import datetime
-from tkinter import Tk, filedialog, messagebox
+
+import db
+
+TAMANO_BLOQUE = 5000
+
+# columna del Excel del proveedor -> columna de avisos (db.py)
+COLUMNAS_EXCEL = {
+    "ORDEN INTERNA": "ordenInterna",
+    "CLIENTE": "cliente",
+    "DIRECCION": "direccion",
+    "POBLACION": "localidad",
+    "TELEFONO": "telefono1",
+    "APARATO": "aparato",  # identifica al proveedor del servicio (db.obtener_indice_proveedores)
+    "HORA INICIO": "horaInicio",
+    "TURNO": "turno",
+    "OBSERVACIONES": "averia",
+}
+COLUMNA_FECHA = "FECHA VISITA"
+
+_COLUMNAS_INSERT = list(COLUMNAS_EXCEL.values()) + ["fechaVisita", "estado"]
+# entran en el hash las columnas que una reimportación puede actualizar
+_COLUMNAS_HASH = [c for c in _COLUMNAS_INSERT if c in db.COLUMNAS_PROVEEDOR]
+
+
+def _columna_texto(df, nombre):
+    """Columna entera a texto sin espacios alrededor; vacíos y NaN -> None."""
+    if nombre not in df:
+        return pd.Series(None, index=df.index, dtype=object)
+    serie = df[nombre]
+    if pd.api.types.is_float_dtype(serie) and (serie.dropna() % 1 == 0).all():
+        serie = serie.astype("Int64")  # órdenes/teléfonos numéricos leídos como float por tener NaN
+    texto = serie.astype("string").str.strip()
+    texto = texto.mask(texto == "")
+    return texto.astype(object).where(texto.notna(), None)
+
+
+def _columna_fecha(df, nombre):
+    """Columna entera a yyyy-MM-dd; lo que no es una fecha -> None."""
+    if nombre not in df:
+        return pd.Series(None, index=df.index, dtype=object)
+    serie = df[nombre]
+    if not pd.api.types.is_datetime64_any_dtype(serie):
+        # "mixed": cada celda con su propio formato, como hacía el pd.to_datetime por fila
+        serie = pd.to_datetime(serie, errors="coerce", format="mixed")
+    texto = serie.dt.strftime("%Y-%m-%d")
+    return texto.astype(object).where(serie.notna(), None)
+
+
+def normalizar_dataframe(df):
+    """DataFrame del Excel -> DataFrame con las columnas de avisos, listas para insertar."""
+    salida = pd.DataFrame({destino: _columna_texto(df, origen) for origen, destino in COLUMNAS_EXCEL.items()})
+    salida["fechaVisita"] = _columna_fecha(df, COLUMNA_FECHA)
+    # 🔧 Corrección: invertir la lógica del estado
+    # Antes: pendiente si había fecha (incorrecto)
+    # Ahora: pendiente si NO hay fecha (correcto)
+    salida["estado"] = salida["fechaVisita"].notna().map({True: "sin asignar", False: "pendiente"})
+    return salida[_COLUMNAS_INSERT]
+
+
+def hash_filas(normalizado):
+    """Hash de contenido (int64) de cada fila de normalizar_dataframe, calculado por columnas."""
+    hashes = pd.util.hash_pandas_object(normalizado[_COLUMNAS_HASH], index=False)
+    return hashes.to_numpy().view("int64").tolist()
+
+
+def _preparar(df):
+    normalizado = normalizar_dataframe(df)
+    return list(normalizado.itertuples(index=False, name=None)), hash_filas(normalizado)
+
+
+def _sumar(total, parcial):
+    for clave, n in parcial.items():
+        total[clave] = total.get(clave, 0) + n
+    return total
+
+
+def importar_dataframe(df):
+    """
+    Importa las filas del Excel ya leído en una sola transacción (db.carga_masiva:
+    el índice de búsqueda se actualiza una vez al final): inserta las órdenes nuevas
+    y actualiza las que cambiaron. {"insertados", "actualizados", "sin_cambios"}.
+    """
+    with db.carga_masiva():
+        return db.reimportar_avisos(_COLUMNAS_INSERT, *_preparar(df))
+
+
+# --- Lectura en streaming ---
+# openpyxl en modo read-only recorre las filas sin cargar el libro entero: la
+# memoria depende del tamaño de bloque, no del del archivo.
+
+def leer_excel_por_bloques(ruta_excel, tamano=TAMANO_BLOQUE, requeridas=(), desde=(0, 0)):
+    """
+    Recorre todas las hojas del libro (la primera fila de cada una es la cabecera)
+    y devuelve (nº de hoja, nombre, filas de la hoja leídas, DataFrame) por bloques
+    de `tamano` filas. Se saltan las hojas sin las columnas `requeridas` y las filas
+    vacías. desde=(hoja, filas): empezar detrás de esa posición (para reanudar).
+    """
+    from openpyxl import load_workbook
+    libro = load_workbook(ruta_excel, read_only=True, data_only=True)
+    try:
+        for n_hoja, hoja in enumerate(libro.worksheets):
+            if n_hoja < desde[0]:
+                continue
+            filas = hoja.iter_rows(values_only=True)
+            cabecera = next(filas, None)
+            if cabecera is None:
+                continue
+            cabecera = [str(c).strip() if c is not None else f"_{i}" for i, c in enumerate(cabecera)]
+            if any(c not in cabecera for c in requeridas):
+                continue
+            ancho = len(cabecera)
+            leidas = desde[1] if n_hoja == desde[0] else 0
+            if leidas:
+                next(itertools.islice(filas, leidas - 1, None), None)
+            while True:
+                bloque = list(itertools.islice(filas, tamano))
+                if not bloque:
+                    break
+                leidas += len(bloque)
+                # read-only no garantiza que todas las filas tengan el ancho de la cabecera
+                bloque = [f[:ancho] if len(f) >= ancho else f + (None,) * (ancho - len(f)) for f in bloque]
+                df = pd.DataFrame(bloque, columns=cabecera).dropna(how="all")
+                yield n_hoja, hoja.title, leidas, df
+    finally:
+        libro.close()
+
+
+def contar_filas(ruta_excel):
+    """Filas de datos del libro según las dimensiones guardadas (None si no constan)."""
+    from openpyxl import load_workbook
+    libro = load_workbook(ruta_excel, read_only=True)
+    try:
+        total = 0
+        for hoja in libro.worksheets:
+            if hoja.max_row is None:
+                return None
+            total += max(hoja.max_row - 1, 0)
+        return total
+    finally:
+        libro.close()
+
+
+def _clave_reanudacion(ruta_excel):
+    # el mismo archivo (ruta, tamaño y fecha de modificación) reanuda; si cambia, empieza de cero
+    st = os.stat(ruta_excel)
+    firma = f"{os.path.abspath(ruta_excel)}|{st.st_size}|{st.st_mtime_ns}"
+    return "importacion:" + hashlib.sha1(firma.encode("utf-8")).hexdigest()
+
+
+def importar_archivo_por_bloques(ruta_excel, tamano=TAMANO_BLOQUE, progreso=None):
+    """
+    Importa el libro en streaming: cada bloque se normaliza e inserta en su propia
+    transacción, que guarda también hasta dónde se ha llegado (avisos_meta). Si la
+    importación se interrumpe, volver a llamar con el mismo archivo continúa tras el
+    último bloque confirmado. progreso(leidas, total o None, resumen) tras cada bloque.
+    Devuelve el resumen, {"insertados", "actualizados", "sin_cambios"}, contando lo
+    que hizo la ejecución interrumpida.
+    """
+    clave = _clave_reanudacion(ruta_excel)
+    fila = db.get_connection().execute("SELECT valor FROM avisos_meta WHERE clave = ?", (clave,)).fetchone()
+    estado = {"hoja": 0, "filas": 0, "leidas": 0, "resumen": {"insertados": 0, "actualizados": 0, "sin_cambios": 0}}
+    if fila:
+        estado.update(json.loads(fila[0]))
+    total = contar_filas(ruta_excel) if progreso else None
+    leidas_antes = estado["leidas"] - estado["filas"]  # filas de las hojas ya terminadas
+    for n_hoja, _nombre, leidas_hoja, df in leer_excel_por_bloques(
+            ruta_excel, tamano, requeridas=("ORDEN INTERNA",), desde=(estado["hoja"], estado["filas"])):
+        if n_hoja != estado["hoja"]:
+            leidas_antes, estado["hoja"] = estado["leidas"], n_hoja
+        estado["filas"] = leidas_hoja
+        estado["leidas"] = leidas_antes + leidas_hoja
+        with db.carga_masiva() as conn:
+            _sumar(estado["resumen"], db.reimportar_avisos(_COLUMNAS_INSERT, *_preparar(df)))
+            conn.execute("INSERT OR REPLACE INTO avisos_meta(clave, valor) VALUES (?, ?)",
+                         (clave, json.dumps(estado)))
+        if progreso:
+            progreso(estado["leidas"], total, estado["resumen"])
+    with db.transaccion() as conn:
+        conn.execute("DELETE FROM avisos_meta WHERE clave = ?", (clave,))
+    return estado["resumen"]
+
+
+@contextmanager
+def _en_base(db_path):
+    if not db_path or db_path == db.DB_PATH:
+        yield
+        return
+    anterior = db.DB_PATH
+    db.cerrar_conexiones()
+    db.DB_PATH = db_path
+    try:
+        yield
+    finally:
+        db.cerrar_conexiones()
+        db.DB_PATH = anterior
+
+
+def importar_archivo(ruta_excel, db_path=None, progreso=None):
+    """Importación sin interfaz (scripts, benchmarks), en streaming. Devuelve el resumen."""
+    with _en_base(db_path):
+        return importar_archivo_por_bloques(ruta_excel, progreso=progreso)
 
 
 def importar_excel_a_sqlite():
+    # Tk solo hace falta para el diálogo: el núcleo se puede usar sin entorno gráfico
+    from tkinter import Label, Tk, Toplevel, filedialog, messagebox
+
     root = Tk()
     root.withdraw()
 
@@ -18,79 +243,179 @@ def importar_excel_a_sqlite():
         messagebox.showinfo("Importador", "No se seleccionó ningún archivo.")
         return
 
-    # Cargar el Excel
+    # Importar por bloques; si se corta, volver a elegir el mismo archivo continúa donde iba
+    ventana = Toplevel(root)
+    ventana.title("Importador")
+    etiqueta = Label(ventana, text="Leyendo el Excel...", width=50, padx=20, pady=20)
+    etiqueta.pack()
+
+    def progreso(n, total, resumen):
+        etiqueta.config(text=f"{n} de {total or '?'} filas leídas, {resumen['insertados']} avisos nuevos")
+        ventana.update()
+
     try:
-        df = pd.read_excel(ruta_excel)
+        resumen = importar_archivo_por_bloques(ruta_excel, progreso=progreso)
     except Exception as e:
-        messagebox.showerror("Error", f"No se pudo leer el Excel: {e}")
+        messagebox.showerror("Error", f"No se pudo importar: {e}")
         return
+    finally:
+        ventana.destroy()
+    messagebox.showinfo("Importador", f"Importación completada correctamente: {resumen['insertados']} avisos "
+                                      f"nuevos, {resumen['actualizados']} actualizados "
+                                      f"({resumen['sin_cambios']} sin cambios).")
+
+
+# --- Importación sin interfaz, en paralelo ---
+
+LOTE_ESCRITURA = 50000  # filas por transacción del escritor
+ESPERA_COLA = 1.0       # segundos sin noticias de los lectores antes de comprobar que siguen vivos
+EXTENSIONES_EXCEL = (".xlsx", ".xlsm")
+
+
+def buscar_libros(rutas):
+    """Archivos Excel de `rutas` (archivos o carpetas, recorridas enteras), sin repetir y en orden."""
+    libros = []
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            for carpeta, _, archivos in os.walk(ruta):
+                libros.extend(os.path.join(carpeta, a) for a in archivos
+                              if a.lower().endswith(EXTENSIONES_EXCEL) and not a.startswith("~$"))
+        else:
+            libros.append(ruta)
+    return sorted(dict.fromkeys(os.path.abspath(r) for r in libros))
+
+
+def _parsear_libro(ruta, tamano, cola):
+    """
+    En un proceso del pool: lee y normaliza `ruta` y manda sus filas al escritor por
+    `cola`. El tiempo de lectura que informa no cuenta la espera a que haya sitio en la cola.
+    """
+    inicio = time.perf_counter()
+    leidas, espera = 0, 0.0
+    try:
+        for _, _, _, df in leer_excel_por_bloques(ruta, tamano, requeridas=("ORDEN INTERNA",)):
+            leidas += len(df)
+            bloque = _preparar(df)  # el hash también se calcula en paralelo
+            antes = time.perf_counter()
+            cola.put((ruta, "filas", bloque))
+            espera += time.perf_counter() - antes
+    except Exception as e:
+        cola.put((ruta, "error", f"{type(e).__name__}: {e}"))
+    finally:
+        cola.put((ruta, "fin", (leidas, time.perf_counter() - inicio - espera)))
+
+
+class InformeLibro:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.leidas = 0
+        self.nuevas = 0
+        self.actualizadas = 0
+        self.iguales = 0
+        self.lectura = 0.0    # leer y normalizar, sin esperas a la cola
+        self.escritura = 0.0
+        self.error = None
+
+    @property
+    def filas_por_segundo(self):
+        segundos = self.lectura + self.escritura
+        return self.leidas / segundos if segundos else 0.0
+
+
+def _escribir(pendientes, informes):
+    # una transacción para todo el lote; una reimportación por archivo para su informe
+    with db.carga_masiva():
+        for ruta, (filas, hashes) in pendientes.items():
+            inicio = time.perf_counter()
+            resumen = db.reimportar_avisos(_COLUMNAS_INSERT, filas, hashes)
+            informe = informes[ruta]
+            informe.nuevas += resumen["insertados"]
+            informe.actualizadas += resumen["actualizados"]
+            informe.iguales += resumen["sin_cambios"]
+            informe.escritura += time.perf_counter() - inicio
+    pendientes.clear()
+
+
+def importar_libros(rutas, procesos=None, tamano=TAMANO_BLOQUE, lote=LOTE_ESCRITURA):
+    """
+    Importa muchos libros: se leen en un pool de `procesos` (por defecto, uno por
+    núcleo) y este proceso, único escritor, inserta las filas en transacciones de
+    unas `lote` filas; de las órdenes que ya existen solo se actualizan las que
+    cambiaron. Devuelve un InformeLibro por archivo, en el orden de `rutas`; si un
+    lector muere sin avisar (falta de memoria, señal...), sus archivos quedan con error.
+    """
+    informes = {ruta: InformeLibro(ruta) for ruta in rutas}
+    if not informes:
+        return []
+    procesos = min(procesos or os.cpu_count() or 1, len(informes))
+    with Manager() as gestor, ProcessPoolExecutor(max_workers=procesos) as pool:
+        # cola acotada: si el escritor no da abasto, los lectores esperan en lugar de llenar la memoria
+        cola = gestor.Queue(maxsize=4 * procesos)
+        futuros = {pool.submit(_parsear_libro, ruta, tamano, cola): ruta for ruta in informes}
+        pendientes, en_cola, abiertos = {}, 0, set(informes)
+        while abiertos:
+            try:
+                ruta, tipo, dato = cola.get(timeout=ESPERA_COLA)
+            except queue.Empty:
+                # un lector que muere de golpe no manda "fin": se ve en su futuro (BrokenProcessPool...).
+                # Lo que mandó antes ya está en la cola, que está vacía
+                for futuro, ruta in futuros.items():
+                    if ruta in abiertos and futuro.done() and futuro.exception() is not None:
+                        error = futuro.exception()
+                        informes[ruta].error = f"el lector terminó sin avisar ({type(error).__name__}: {error})"
+                        abiertos.discard(ruta)
+                continue
+            if tipo == "filas":
+                filas, hashes = pendientes.setdefault(ruta, ([], []))
+                filas.extend(dato[0])
+                hashes.extend(dato[1])
+                en_cola += len(dato[0])
+                if en_cola >= lote:
+                    _escribir(pendientes, informes)
+                    en_cola = 0
+            elif tipo == "error":
+                informes[ruta].error = dato
+            else:
+                informes[ruta].leidas, informes[ruta].lectura = dato
+                abiertos.discard(ruta)
+        if pendientes:
+            _escribir(pendientes, informes)
+    return list(informes.values())
+
+
+def _imprimir_informe(informes, segundos):
+    ancho = max([len(os.path.basename(i.ruta)) for i in informes] + [7])
+    print(f"{'archivo':<{ancho}}  {'filas':>8}  {'nuevas':>8}  {'actualiz.':>9}  {'iguales':>8}  {'filas/s':>9}")
+    for i in informes:
+        nombre = os.path.basename(i.ruta)
+        print(f"{nombre:<{ancho}}  {i.leidas:>8}  {i.nuevas:>8}  {i.actualizadas:>9}  {i.iguales:>8}  "
+              f"{i.filas_por_segundo:>9.0f}" + (f"  ERROR {i.error}" if i.error else ""))
+    leidas = sum(i.leidas for i in informes)
+    print(f"{'total':<{ancho}}  {leidas:>8}  {sum(i.nuevas for i in informes):>8}  "
+          f"{sum(i.actualizadas for i in informes):>9}  {sum(i.iguales for i in informes):>8}  "
+          f"{leidas / segundos if segundos else 0:>9.0f}  ({segundos:.1f} s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("rutas", nargs="*", help="Libros Excel o carpetas con libros")
+    parser.add_argument("--procesos", type=int, help="Procesos lectores (por defecto, uno por núcleo)")
+    parser.add_argument("--db", help="Base SQLite de destino (por defecto DB_PATH)")
+    parser.add_argument("--lote", type=int, default=LOTE_ESCRITURA, help="Filas por transacción")
+    args = parser.parse_args(argv)
 
-    # Conectar o crear la base de datos
-    db_path = os.path.join(os.path.dirname(__file__), "avisos.db")
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-
-    # Crear tabla si no existe
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS avisos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ordenInterna TEXT,
-            ordenTrabajo TEXT,
-            cliente TEXT,
-            direccion TEXT,
-            poblacion TEXT,
-            telefono TEXT,
-            fechaVisita TEXT,
-            horaInicio TEXT,
-            turno TEXT,
-            estado TEXT,
-            observaciones TEXT
-        )
-    """)
-
-    # Insertar datos
-    for _, fila in df.iterrows():
-        ordenInterna = str(fila.get("ORDEN INTERNA", "")).strip()
-        ordenTrabajo = str(fila.get("ORDEN TRABAJO", "")).strip()
-        cliente = str(fila.get("CLIENTE", "")).strip()
-        direccion = str(fila.get("DIRECCION", "")).strip()
-        poblacion = str(fila.get("POBLACION", "")).strip()
-        telefono = str(fila.get("TELEFONO", "")).strip()
-        fecha_valida = False
-        fechaVisita = ""
-
-        try:
-            fecha_raw = fila.get("FECHA VISITA", "")
-            if not pd.isna(fecha_raw):
-                fechaVisita = pd.to_datetime(fecha_raw).strftime("%Y-%m-%d")
-                fecha_valida = True
-        except Exception:
-            fechaVisita = ""
-
-        horaInicio = str(fila.get("HORA INICIO", "")).strip()
-        turno = str(fila.get("TURNO", "")).strip()
-        observaciones = str(fila.get("OBSERVACIONES", "")).strip()
-
-        # 🔧 Corrección: invertir la lógica del estado
-        # Antes: pendiente si había fecha (incorrecto)
-        # Ahora: pendiente si NO hay fecha (correcto)
-        estado_importado = "sin asignar" if fecha_valida else "pendiente"
-
-        cur.execute("""
-            INSERT INTO avisos (
-                ordenInterna, ordenTrabajo, cliente, direccion, poblacion, telefono,
-                fechaVisita, horaInicio, turno, estado, observaciones
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            ordenInterna, ordenTrabajo, cliente, direccion, poblacion, telefono,
-            fechaVisita, horaInicio, turno, estado_importado, observaciones
-        ))
-
-    # Guardar cambios
-    conn.commit()
-    conn.close()
-    messagebox.showinfo("Importador", "Importación completada correctamente.")
+    if not args.rutas:
+        importar_excel_a_sqlite()
+        return 0
+    libros = buscar_libros(args.rutas)
+    if not libros:
+        parser.error("no se encontró ningún libro Excel")
+    inicio = time.perf_counter()
+    with _en_base(args.db):
+        informes = importar_libros(libros, args.procesos, lote=args.lote)
+    _imprimir_informe(informes, time.perf_counter() - inicio)
+    return 1 if any(i.error for i in informes) else 0
 
 
 if __name__ == "__main__":
-    importar_excel_a_sqlite()
+    raise SystemExit(main())
@@ -1,76 +1,13 @@
 
 from datetime import datetime
 from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QMessageBox, QFileDialog
+from PySide6.QtCore import Qt
 from calendario import CalendarioAvisos
 from pendientes import VentanaPendientes
 from config import cargar_config, guardar_config
-import json
+from exportacion import escribir_json_todos, escribir_json_cambios
 import db
 
-def _s(s):
-    if s is None:
-        return ""
-    s = str(s).strip()
-    if s.lower() in {"nan", "none", "null"}:
-        return ""
-    return s
-
-def _bool_from_db(v):
-    if v in (1, True, "1", "true", "TRUE", "True", "sí", "si", "SI"):
-        return True
-    return False
-
-def _normalizar_aviso(av):
-    tel1 = _s(av.get("telefono1"))
-    tel2 = _s(av.get("telefono2"))
-    telefonos = [t for t in (tel1, tel2) if t]
-    return {
-        "id": av.get("idAviso"),
-        "orden": _s(av.get("ordenInterna") or av.get("ordenTrabajo")),
-        "cliente": _s(av.get("cliente")),
-        "direccion": _s(av.get("direccion")),
-        "localidad": _s(av.get("localidad")),
-        "cp": _s(av.get("codigoPostal")),
-        "telefonos": telefonos,
-        "aparato": _s(av.get("aparato")),
-        "marca": _s(av.get("marca")),
-        "modelo": _s(av.get("modelo")),
-        "averia": _s(av.get("averia")),
-        "tipoServicio": _s(av.get("tipoServicio")),
-        "tipoOperacion": _s(av.get("tipoOperacion")),
-        "conCargo": _bool_from_db(av.get("conCargo")),
-        "importe": av.get("importe"),
-        "metodoPago": _s(av.get("metodoPago")),
-        "notas": _s(av.get("observacionesCobro")),  # app móvil leerá este campo
-        "estado": _s(av.get("estado")),
-        "fechaVisita": _s(av.get("fechaVisita")),
-        "turno": _s(av.get("turno")),
-        "tecnico": _s(av.get("tecnico")),
-        "horaInicio": _s(av.get("horaInicio")),
-        "horaFin": _s(av.get("horaFin")),
-        "proveedor": _s(av.get("proveedor")),
-        "estadoCita": _s(av.get("estadoCita")),
-    }
-
-def _agrupar_por_dia_y_turno(avisos):
-    dias = {}
-    sin_fecha = []
-    for av in avisos:
-        nav = _normalizar_aviso(av)
-        f = nav.get("fechaVisita") or ""
-        turno = (nav.get("turno") or "").lower()
-        if not f:
-            sin_fecha.append(nav)
-            continue
-        key = "mañana" if turno.startswith("ma") else "tarde" if turno.startswith("ta") else "sin_turno"
-        if f not in dias:
-            dias[f] = {"mañana": [], "tarde": [], "sin_turno": []}
-        dias[f][key].append(nav)
-    out = {"dias": dias}
-    if sin_fecha:
-        out["sin_fecha"] = sin_fecha
-    return out
-
 class VentanaPrincipal(QWidget):
     def __init__(self):
         super().__init__()
@@ -90,6 +27,22 @@ class VentanaPrincipal(QWidget):
         self.btn_export_json.clicked.connect(self.exportar_json_todos)
         barra.addWidget(self.btn_export_json)
 
+        self.btn_export_cambios = QPushButton("Exportar → JSON (cambios)")
+        self.btn_export_cambios.clicked.connect(self.exportar_json_cambios)
+        barra.addWidget(self.btn_export_cambios)
+
+        self.btn_archivar = QPushButton("Archivar cerrados")
+        self.btn_archivar.clicked.connect(self.archivar_cerrados)
+        barra.addWidget(self.btn_archivar)
+
+        self.btn_proveedores = QPushButton("Asignar proveedores")
+        self.btn_proveedores.clicked.connect(self.asignar_proveedores)
+        barra.addWidget(self.btn_proveedores)
+
+        self.btn_diagnostico = QPushButton("Diagnóstico BD")
+        self.btn_diagnostico.clicked.connect(self.abrir_diagnostico)
+        barra.addWidget(self.btn_diagnostico)
+
         # Calendario y otros controles
         self.calendario = CalendarioAvisos(parent=self)
         self.boton_asignar = QPushButton("Asignar casos")
@@ -112,24 +65,94 @@ class VentanaPrincipal(QWidget):
         self.boton_asignar.clicked.connect(self.asignar)
 
     def exportar_json_todos(self):
-        avisos = db.obtener_todos_los_avisos()
-        payload = {
-            "version": 1,
-            "generated_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
-            "total": len(avisos),
-            **_agrupar_por_dia_y_turno(avisos)
-        }
         ruta, _ = QFileDialog.getSaveFileName(self, "Exportar todo a JSON", "todas_las_ordenes.json", "JSON (*.json)")
         if not ruta:
             return
         try:
+            # se lee antes de exportar: lo que cambie durante la exportación saldrá en la próxima incremental
+            hasta = db.ultimo_cambio()
+            # en streaming: no se carga todo el histórico en memoria
             with open(ruta, "w", encoding="utf-8") as f:
-                json.dump(payload, f, ensure_ascii=False, indent=2)
+                escribir_json_todos(f, db.iter_avisos(incluir_archivo=True), cabecera={"hasta": hasta})
         except Exception as e:
             QMessageBox.critical(self, "Exportar", f"No se pudo exportar: {e}")
             return
+        self._guardar_ultimo_seq(hasta)
         QMessageBox.information(self, "Exportar", f"Exportado correctamente a\n{ruta}")
 
+    def exportar_json_cambios(self):
+        """Exporta solo lo cambiado desde la última exportación (registro avisos_changes)."""
+        desde = int(self.config.get("ultimo_seq_exportado", 0))
+        hasta = db.ultimo_cambio()
+        if hasta <= desde:
+            QMessageBox.information(self, "Exportar", "No hay cambios desde la última exportación.")
+            return
+        ruta, _ = QFileDialog.getSaveFileName(self, "Exportar cambios a JSON", f"cambios_{desde}_{hasta}.json", "JSON (*.json)")
+        if not ruta:
+            return
+        try:
+            borrados = [c.ordenInterna for c in db.cambios_desde(desde) if c.op == "D" and c.seq <= hasta]
+            with open(ruta, "w", encoding="utf-8") as f:
+                n = escribir_json_cambios(f, db.iter_avisos_cambiados(desde), borrados, desde, hasta)
+        except ValueError:
+            QMessageBox.warning(self, "Exportar", "El registro de cambios ya no cubre la última exportación.\n"
+                                                  "Haz una exportación completa.")
+            return
+        except Exception as e:
+            QMessageBox.critical(self, "Exportar", f"No se pudo exportar: {e}")
+            return
+        self._guardar_ultimo_seq(hasta)
+        try:
+            # esta exportación es la que lee el registro: lo ya exportado y antiguo sobra
+            db.compactar_cambios(hasta_seq=hasta)
+        except Exception:
+            pass
+        QMessageBox.information(self, "Exportar", f"Exportados {n} avisos cambiados y {len(borrados)} borrados a\n{ruta}")
+
+    def archivar_cerrados(self):
+        """Pasa al archivo los avisos cerrados de hace más de config["dias_archivo"] días."""
+        dias = int(self.config.get("dias_archivo", db.DIAS_ARCHIVO))
+        confirm = QMessageBox.question(
+            self, "Archivar",
+            f"¿Archivar los avisos realizados, anulados o cancelados de hace más de {dias} días?\n"
+            "Seguirán disponibles en el calendario, el planificador y la exportación completa.")
+        if confirm != QMessageBox.Yes:
+            return
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            n = db.archivar_avisos(dias)
+        except Exception as e:
+            QMessageBox.critical(self, "Archivar", f"No se pudo archivar: {e}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        self.refrescar()
+        QMessageBox.information(self, "Archivar", f"Archivados {n} avisos.")
+
+    def asignar_proveedores(self):
+        """Rellena el proveedor de los avisos que no lo tienen, según su código de aparato."""
+        if not db.obtener_reglas_proveedor():
+            QMessageBox.information(self, "Proveedores", "No hay reglas de proveedor.\n"
+                                    "Cárgalas con: python proveedores.py cargar reglas.csv")
+            return
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            n = db.asignar_proveedores()
+        except Exception as e:
+            QMessageBox.critical(self, "Proveedores", f"No se pudieron asignar: {e}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        self.refrescar()
+        QMessageBox.information(self, "Proveedores", f"Proveedor asignado a {n} avisos.")
+
+    def _guardar_ultimo_seq(self, seq):
+        self.config["ultimo_seq_exportado"] = seq
+        try:
+            guardar_config(self.config)
+        except Exception:
+            pass
+
     def _on_fecha_clicked(self, fecha):
         # import diferido para evitar import circular
         from planificador import abrir_planificador
@@ -197,6 +220,10 @@ class VentanaPrincipal(QWidget):
             except Exception:
                 pass
 
+    def abrir_diagnostico(self):
+        from diagnostico import DialogoDiagnostico
+        DialogoDiagnostico(parent=self).exec()
+
     def refrescar(self):
         """Exponer método público para que diálogos hijos puedan pedir refresco del calendario."""
         try:
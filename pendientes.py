@@ -5,16 +5,22 @@ from PySide6.QtWidgets import (
     QPushButton, QMenu, QMessageBox, QWidget, QLabel, QLineEdit, QComboBox,
     QFileDialog, QDateEdit, QFormLayout, QDialogButtonBox, QInputDialog
 )
-from PySide6.QtCore import Qt, QDate
+from PySide6.QtCore import Qt, QDate, Signal
 from PySide6.QtGui import QFont, QFontMetrics
 import csv
 import db
+import db_async
+from cola_escritura import EscrituraOptimista
 from editar_aviso_dialog import EditarAvisoDialog
 
 def _clean(s):
     s = "" if s is None else str(s).strip()
     return "" if s.lower() in {"nan", "none", "null", "na"} else " ".join(s.split())
 
+def _codigo_estado(aviso) -> int:
+    codigo = aviso.get("estado_code")
+    return db.codigo_estado(aviso.get("estado")) if codigo is None else codigo
+
 def _ellipsize(text: str, metrics: QFontMetrics, max_px: int) -> str:
     try:
         return metrics.elidedText(text, Qt.ElideRight, max_px)
@@ -22,8 +28,18 @@ def _ellipsize(text: str, metrics: QFontMetrics, max_px: int) -> str:
         return text if len(text) <= 120 else text[:119] + "…"
 
 class VentanaPendientes(QDialog):
+    TAMANO_PAGINA = 200
+    _busqueda_terminada = Signal(str, object)  # (texto, Future) desde el hilo de db_async
+
     def __init__(self, parent=None):
         super().__init__(parent)
+        self._busqueda = db_async.ConsultaUnica()
+        self._resultado_busqueda = (None, [])  # (texto, avisos)
+        self._busqueda_terminada.connect(self._on_busqueda_terminada)
+        # anular/desanular: se encolan y se pintan ya; la base se relee tras el commit
+        self._escritura = EscrituraOptimista(self)
+        self._escritura.refrescar.connect(self._on_escritura_confirmada)
+        self._escritura.error.connect(self._on_escritura_fallida)
         self.setWindowTitle("Servicios sin asignar")
         self.resize(900, 600)
         self.layout = QVBoxLayout(self)
@@ -35,17 +51,18 @@ class VentanaPendientes(QDialog):
     def _build_toolbar(self):
         toolbar = QHBoxLayout()
         self.search = QLineEdit()
-        self.search.setPlaceholderText("Buscar por orden, cliente o dirección...")
-        self.search.textChanged.connect(self._cargar)
+        self.search.setPlaceholderText("Buscar por orden, cliente, dirección o teléfono...")
+        self.search.textChanged.connect(self._buscar)
         toolbar.addWidget(self.search)
 
         self.filter_combo = QComboBox()
-        self.filter_combo.addItem("Todos (oculta anulados)", "")
-        self.filter_combo.addItem("sin asignar", "sin asignar")
-        self.filter_combo.addItem("pendiente", "pendiente")
-        self.filter_combo.addItem("realizado", "realizado")
-        self.filter_combo.addItem("anulado", "anulado")
-        self.filter_combo.currentIndexChanged.connect(self._cargar)
+        # cada opción filtra por códigos de estado (IN sobre estado_code, indexado)
+        self.filter_combo.addItem("Todos (oculta anulados)", db.ESTADOS_VISIBLES)
+        self.filter_combo.addItem("sin asignar", (db.ESTADO_SIN_ASIGNAR,))
+        self.filter_combo.addItem("pendiente", (db.ESTADO_PENDIENTE,))
+        self.filter_combo.addItem("realizado", (db.ESTADO_REALIZADO,))
+        self.filter_combo.addItem("anulado", (db.ESTADO_ANULADO,))
+        self.filter_combo.currentIndexChanged.connect(self._on_filtro_cambiado)
         toolbar.addWidget(self.filter_combo)
 
         self.btn_asignar_masivo = QPushButton("Asignar selección")
@@ -79,58 +96,98 @@ class VentanaPendientes(QDialog):
         self.lbl_count = QLabel("")
         footer.addWidget(self.lbl_count)
         footer.addStretch()
+        self.btn_mas = QPushButton("Cargar más")
+        self.btn_mas.clicked.connect(self._cargar_mas)
+        footer.addWidget(self.btn_mas)
         self.layout.addLayout(footer)
 
     def _cargar(self):
-        self.lista.clear()
-        q = (self.search.text() or "").strip().lower()
-        estado_filtrado = self.filter_combo.currentData() or ""
+        """Recarga desde la primera página."""
+        self._avisos_base = []
+        self._cursor_pagina = None
+        self._total_sin_fecha = 0
+        self._leer_avisos()
+        self._pintar()
+
+    def _estados_filtrados(self):
+        return tuple(self.filter_combo.currentData() or db.ESTADOS_VISIBLES)
+
+    def _on_filtro_cambiado(self):
+        # el filtro se aplica en la consulta: se recarga y se repite la búsqueda
+        self._resultado_busqueda = (None, [])
+        self._cargar()
+        if (self.search.text() or "").strip():
+            self._buscar()
+
+    def _cargar_mas(self):
+        if not self._cursor_pagina:
+            return
+        self._leer_avisos()
+        self._pintar()
 
-        avisos_base = []
+    def _leer_avisos(self):
         try:
-            obtener_sin_fecha = getattr(db, "obtener_avisos_sin_fecha", None)
-            if callable(obtener_sin_fecha):
-                avisos_base = obtener_sin_fecha()
-            else:
-                avisos_base = []
-                try:
-                    pend = db.obtener_avisos_pendientes()
-                except Exception:
-                    pend = []
-                id_vistos = set()
-                for a in pend:
-                    key = a.get("idAviso") or (a.get("ordenTrabajo") or a.get("ordenInterna"))
-                    if key not in id_vistos:
-                        avisos_base.append(a); id_vistos.add(key)
-                try:
-                    todos = db.obtener_todos_los_avisos()
-                except Exception:
-                    todos = []
-                for a in todos:
-                    fecha = (_clean(a.get("fechaVisita")))
-                    if not fecha:
-                        key = a.get("idAviso") or (a.get("ordenTrabajo") or a.get("ordenInterna"))
-                        if key not in id_vistos:
-                            avisos_base.append(a); id_vistos.add(key)
+            pagina = db.obtener_avisos_sin_fecha_pagina(self.TAMANO_PAGINA, self._cursor_pagina,
+                                                        estados=self._estados_filtrados())
         except Exception:
-            avisos_base = []
+            self._avisos_base = []
+            self._cursor_pagina = None
+            self._total_sin_fecha = 0
+            return
+        self._avisos_base.extend(pagina.avisos)
+        self._cursor_pagina = pagina.cursor
+        self._total_sin_fecha = pagina.total
+
+    def _buscar(self):
+        """Lanza la búsqueda en segundo plano; la anterior, si sigue en marcha, se cancela."""
+        q = (self.search.text() or "").strip().lower()
+        if not q:
+            self._busqueda.cancelar()
+        else:
+            futuro = self._busqueda.lanzar(db.buscar_avisos, q, sin_fecha=True, limit=500,
+                                           estados=self._estados_filtrados())
+            futuro.add_done_callback(lambda f, q=q: self._emitir_busqueda(q, f))
+        self._pintar()
 
-        filtrados_estado = []
-        for a in avisos_base:
-            estado = _clean(a.get("estado")).lower()
-            if not estado_filtrado and (estado.startswith("anul") or estado.startswith("canc")):
-                continue
-            if estado_filtrado and estado != estado_filtrado:
-                continue
-            filtrados_estado.append(a)
+    def _emitir_busqueda(self, q, futuro):
+        try:
+            self._busqueda_terminada.emit(q, futuro)
+        except RuntimeError:
+            pass  # el diálogo ya se cerró
+
+    def _on_busqueda_terminada(self, q, futuro):
+        if futuro.cancelled() or q != (self.search.text() or "").strip().lower():
+            return
+        if futuro.exception() is not None:
+            return  # se queda el filtro sobre lo cargado
+        self._resultado_busqueda = (q, futuro.result())
+        self._pintar()
+
+    def done(self, r):
+        self._busqueda.cancelar()
+        super().done(r)
+
+    def _pintar(self):
+        self.lista.clear()
+        q = (self.search.text() or "").strip().lower()
+        estados = set(self._estados_filtrados())
+        avisos_base = self._avisos_base
+        if q and self._resultado_busqueda[0] == q:
+            # resultado de la búsqueda en base (todos los avisos sin fecha, no solo las páginas
+            # cargadas); mientras llega se filtra lo ya cargado
+            avisos_base = self._resultado_busqueda[1]
+            q = ""
+
+        buscando = avisos_base is not self._avisos_base
+        # las páginas y la búsqueda ya vienen filtradas por estado; esto cubre los
+        # cambios locales aún en cola
+        avisos_base = self._escritura.aplicar(avisos_base)
+        filtrados_estado = [a for a in avisos_base if _codigo_estado(a) in estados]
 
         total_filtrado_pre_busqueda = len(filtrados_estado)
 
         mostrados = 0
         for aviso in filtrados_estado:
-            if aviso.get("ordenTrabajo") is None and aviso.get("ordenInterna"):
-                aviso["ordenTrabajo"] = aviso.get("ordenInterna")
-
             orden = _clean(aviso.get("ordenTrabajo") or aviso.get("ordenInterna"))
             cliente = _clean(aviso.get("cliente"))
             direccion = _clean(aviso.get("direccion"))
@@ -164,7 +221,7 @@ class VentanaPendientes(QDialog):
             btn_quick = QPushButton("Editar"); btn_quick.setFixedWidth(80)
             btn_quick.clicked.connect(lambda _c, a=aviso: self._abrir_editor(a)); vright.addWidget(btn_quick)
 
-            is_anulado = estado.lower().startswith("anul")
+            is_anulado = _codigo_estado(aviso) == db.ESTADO_ANULADO
             btn_toggle = QPushButton("Desanular" if is_anulado else "Anular")
             btn_toggle.setFixedWidth(80)
             if is_anulado:
@@ -188,7 +245,13 @@ class VentanaPendientes(QDialog):
             self.lista.addItem(item); self.lista.setItemWidget(item, item_widget)
             mostrados += 1
 
-        self.lbl_count.setText(f"Mostrando {mostrados} de {total_filtrado_pre_busqueda} servicios sin asignar")
+        texto = f"Mostrando {mostrados} de {total_filtrado_pre_busqueda} servicios sin asignar"
+        if buscando:
+            texto = f"{mostrados} servicios sin asignar coinciden con la búsqueda"
+        elif self._cursor_pagina:
+            texto += f" (cargados {len(avisos_base)} de {self._total_sin_fecha})"
+        self.lbl_count.setText(texto)
+        self.btn_mas.setEnabled(bool(self._cursor_pagina) and not buscando)
 
     def _on_item_double(self, item):
         if not item: return
@@ -207,7 +270,7 @@ class VentanaPendientes(QDialog):
         menu = QMenu(self)
         act_editar = menu.addAction("Editar / Reprogramar")
         act_asignar = menu.addAction("Asignar fecha")
-        is_anulado = _clean(aviso.get("estado")).lower().startswith("anul")
+        is_anulado = _codigo_estado(aviso) == db.ESTADO_ANULADO
         act_toggle = menu.addAction("Desanular" if is_anulado else "Anular aviso")
         act_export = menu.addAction("Exportar seleccion")
         accion = menu.exec(self.lista.mapToGlobal(pos))
@@ -233,42 +296,27 @@ class VentanaPendientes(QDialog):
         resp = QMessageBox.question(self, "Confirmar", f"¿Anular la orden {identificador}?",
                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if resp != QMessageBox.Yes: return
-        try:
-            if hasattr(db, "marcar_anulado") and callable(getattr(db, "marcar_anulado")):
-                db.marcar_anulado(identificador, (motivo or "").strip() or None)
-            else:
-                payload = {"ordenInterna": identificador, "estado": "anulado"}
-                mot = (motivo or "").strip()
-                if mot:
-                    payload["observacionesCobro"] = (aviso.get("observacionesCobro") or "") + f" | Anulado: {mot}"
-                db.actualizar_aviso(payload)
-            QMessageBox.information(self, "Anulado", f"Orden {identificador} anulada.")
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"No se pudo anular: {e}")
-        finally:
-            self._cargar(); self._notificar_refresco_parent()
+        self._escritura.encolar("marcar_anulado", identificador, (motivo or "").strip() or None,
+                                orden=aviso.get("ordenInterna"), cambios={"estado": "anulado"})
+        self._pintar()
 
     def _desanular_aviso(self, aviso):
         if not aviso: return
         identificador = aviso.get("ordenTrabajo") or aviso.get("ordenInterna")
         if not identificador:
             QMessageBox.warning(self, "Desanular", "Falta identificador de orden."); return
-        try:
-            if hasattr(db, "marcar_desanulado") and callable(getattr(db, "marcar_desanulado")):
-                db.marcar_desanulado(identificador)
-            else:
-                db.actualizar_aviso({"ordenInterna": identificador, "estado": "pendiente"})
-            QMessageBox.information(self, "Desanulado", f"Orden {identificador} desanulada (vuelve a 'pendiente').")
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"No se pudo desanular: {e}")
-        finally:
-            self._cargar(); self._notificar_refresco_parent()
+        self._escritura.encolar("marcar_desanulado", identificador,
+                                orden=aviso.get("ordenInterna"), cambios={"estado": "pendiente"})
+        self._pintar()
 
-    def _abrir_editor(self, aviso):
-        if aviso.get("ordenTrabajo") is None and aviso.get("ordenInterna"):
-            aviso["ordenTrabajo"] = aviso.get("ordenInterna")
+    def _on_escritura_confirmada(self):
+        self._cargar(); self._notificar_refresco_parent()
+
+    def _on_escritura_fallida(self, mutacion, mensaje):
+        QMessageBox.critical(self, "Error", f"No se pudo guardar la orden {mutacion.orden or ''}: {mensaje}")
 
-        aviso_para_dialogo = dict(aviso)
+    def _abrir_editor(self, aviso):
+        aviso_para_dialogo = aviso.to_dict()
         obs = aviso.get("observacionesCobro")
         if obs:
             aviso_para_dialogo.setdefault("notas", obs)
@@ -335,15 +383,16 @@ class VentanaPendientes(QDialog):
             if dia_sem in (6, 7): QMessageBox.warning(self, "Asignar", "No se permiten asignaciones en fines de semana."); return
         except Exception: QMessageBox.warning(self, "Asignar", "Fecha inválida."); return
         turno = combo_turno.currentText() or None
-        errores = []
+        cambios = []
         for it in items:
-            aviso = it.data(Qt.UserRole); orden_key = aviso.get("ordenTrabajo") or aviso.get("ordenInterna")
-            try:
-                db.actualizar_aviso_campos_basicos(
-                    ordenInterna=orden_key, cliente=None, horaInicio=None, horaFin=None, tecnico=None, turno=turno, fechaVisita=fecha
-                )
-            except Exception as e:
-                errores.append(f"{orden_key}: {e}")
+            aviso = it.data(Qt.UserRole)
+            cambios.append({"ordenInterna": aviso.get("ordenTrabajo") or aviso.get("ordenInterna"),
+                            "turno": turno, "fechaVisita": fecha})
+        try:
+            resultado = db.actualizar_avisos_bulk(cambios)
+            errores = [f"{orden_key}: {error}" for orden_key, error in resultado.items() if error]
+        except Exception as e:
+            errores = [str(e)]
         self._cargar(); self._notificar_refresco_parent()
         if errores:
             QMessageBox.warning(self, "Asignar masivo", "Algunas asignaciones fallaron:\n" + "\n".join(errores))
@@ -10,6 +10,7 @@ from PySide6.QtGui import QFont, QFontMetrics
 import json
 import csv
 import db
+from cola_escritura import EscrituraOptimista
 from editar_aviso_dialog import EditarAvisoDialog
 
 def _clean(s):
@@ -28,6 +29,10 @@ class PlanificadorDia(QDialog):
         self.fecha = fecha
         self.setWindowTitle(f"Planificador {fecha}")
         self.resize(1000, 650)
+        # realizado/desasignar: se encolan y se pintan ya; la base se relee tras el commit
+        self._escritura = EscrituraOptimista(self)
+        self._escritura.refrescar.connect(self._on_escritura_confirmada)
+        self._escritura.error.connect(self._on_escritura_fallida)
         self._build_ui()
         self._cargar_avisos()
 
@@ -47,6 +52,14 @@ class PlanificadorDia(QDialog):
 
         self.filter_tecnico = QComboBox(); self.filter_tecnico.addItem("Todos los técnicos",""); toolbar.addWidget(self.filter_tecnico)
 
+        # proveedor asignado por código de aparato (db.asignar_proveedores / importación)
+        self.filter_proveedor = QComboBox(); self.filter_proveedor.addItem("Todos los proveedores", ""); self.filter_proveedor.addItem("Sin proveedor", None)
+        try:
+            for p in db.obtener_proveedores(): self.filter_proveedor.addItem(p, p)
+        except Exception:
+            pass
+        self.filter_proveedor.currentIndexChanged.connect(self._cargar_avisos); toolbar.addWidget(self.filter_proveedor)
+
         self.btn_asignar_masivo = QPushButton("Asignar selección"); self.btn_asignar_masivo.clicked.connect(self._asignar_seleccionados); toolbar.addWidget(self.btn_asignar_masivo)
         self.btn_export = QPushButton("Exportar CSV"); self.btn_export.clicked.connect(self._exportar_seleccionados_csv); toolbar.addWidget(self.btn_export)
         self.btn_refrescar = QPushButton("Refrescar"); self.btn_refrescar.clicked.connect(self._cargar_avisos); toolbar.addWidget(self.btn_refrescar)
@@ -77,9 +90,11 @@ class PlanificadorDia(QDialog):
         texto = (self.search.text() or "").strip().lower()
         turno_filtrado = self.filter_turno.currentData() or ""
         tecnico_filtrado = self.filter_tecnico.currentData() or ""
+        proveedor_filtrado = self.filter_proveedor.currentData()  # "": todos, None: sin proveedor
 
         try:
-            avisos = db.obtener_avisos_por_fecha(self.fecha)
+            # días pasados: también los avisos ya archivados
+            avisos = db.obtener_avisos_por_fecha(self.fecha, incluir_archivo=True)
         except Exception:
             avisos = []
 
@@ -89,11 +104,17 @@ class PlanificadorDia(QDialog):
             if t: self.filter_tecnico.addItem(t, t)
         self.filter_tecnico.blockSignals(False)
 
+        # con texto, la búsqueda la resuelve el índice FTS de la base (por prefijo de palabra)
+        filtrar_texto = False
+        if texto:
+            try:
+                avisos = db.buscar_avisos(texto, fecha=self.fecha, limit=500, incluir_archivo=True)
+            except Exception:
+                filtrar_texto = True
+        avisos = self._escritura.aplicar(avisos, lambda a: a.fechaVisita == self.fecha)
+
         mostrados = 0
         for aviso in avisos:
-            if aviso.get("ordenTrabajo") is None and aviso.get("ordenInterna"):
-                aviso["ordenTrabajo"] = aviso.get("ordenInterna")
-
             orden = _clean(aviso.get("ordenTrabajo") or aviso.get("ordenInterna"))
             cliente = _clean(aviso.get("cliente"))
             direccion = _clean(aviso.get("direccion"))
@@ -101,10 +122,12 @@ class PlanificadorDia(QDialog):
             turno = _clean(aviso.get("turno")); tecnico = _clean(aviso.get("tecnico"))
             estado = _clean(aviso.get("estado")); tipoOperacion = _clean(aviso.get("tipoOperacion"))
             telefono = _clean(aviso.get("telefono") or aviso.get("telefono1") or aviso.get("telefono2"))
+            proveedor = _clean(aviso.get("proveedor"))
 
             if turno_filtrado and turno_filtrado != turno: continue
             if tecnico_filtrado and tecnico_filtrado != tecnico: continue
-            if texto:
+            if proveedor_filtrado != "" and (proveedor_filtrado or "") != proveedor: continue
+            if filtrar_texto:
                 hay = (texto in orden.lower() or texto in cliente.lower() or texto in direccion.lower()
                        or texto in tecnico.lower() or texto in tipoOperacion.lower() or texto in (telefono or "").lower())
                 if not hay: continue
@@ -120,6 +143,7 @@ class PlanificadorDia(QDialog):
             if estado: meta_parts.append(estado.capitalize())
             if turno or hi or hf: meta_parts.append(f"{turno} {hi}–{hf}".strip())
             if tecnico: meta_parts.append(f"T: {tecnico}")
+            if proveedor: meta_parts.append(f"P: {proveedor}")
             if telefono: meta_parts.append(f"Tel: {telefono}")
             lbl_meta = QLabel(" | ".join(meta_parts)); lbl_meta.setStyleSheet("color:#666; font-size:11px;"); vmid.addWidget(lbl_meta); hl.addLayout(vmid, 6)
 
@@ -157,10 +181,7 @@ class PlanificadorDia(QDialog):
         self._abrir_editor(items[0])
 
     def _abrir_editor(self, aviso):
-        if aviso.get("ordenTrabajo") is None and aviso.get("ordenInterna"):
-            aviso["ordenTrabajo"] = aviso.get("ordenInterna")
-
-        aviso_para_dialogo = dict(aviso)
+        aviso_para_dialogo = aviso.to_dict()
         obs = aviso.get("observacionesCobro")
         if obs:
             aviso_para_dialogo.setdefault("notas", obs)
@@ -169,7 +190,7 @@ class PlanificadorDia(QDialog):
             aviso_para_dialogo["notas"] = aviso.get("observacionesCobro")
 
         def guardar_cb(datos):
-            merged = aviso.copy(); merged.update(datos)
+            merged = aviso.to_dict(); merged.update(datos)
             if "ordenTrabajo" in merged and "ordenInterna" not in merged:
                 merged["ordenInterna"] = merged["ordenTrabajo"]
             # Mapear 'notas' -> 'observacionesCobro' si viene del diálogo
@@ -214,15 +235,16 @@ class PlanificadorDia(QDialog):
         hi = time_inicio.time().toString("HH:mm") if time_inicio.time().isValid() else None
         hf = time_fin.time().toString("HH:mm") if time_fin.time().isValid() else None
 
-        errores = []
-        for aviso in items:
-            try:
-                orden_key = aviso.get("ordenTrabajo") or aviso.get("ordenInterna")
-                db.actualizar_aviso_campos_basicos(
-                    ordenInterna=orden_key, cliente=None, horaInicio=hi, horaFin=hf, tecnico=None, turno=turno, fechaVisita=fecha_nueva
-                )
-            except Exception as e:
-                errores.append(f"{orden_key}: {e}")
+        cambios = [
+            {"ordenInterna": aviso.get("ordenTrabajo") or aviso.get("ordenInterna"),
+             "horaInicio": hi, "horaFin": hf, "turno": turno, "fechaVisita": fecha_nueva}
+            for aviso in items
+        ]
+        try:
+            resultado = db.actualizar_avisos_bulk(cambios)
+            errores = [f"{orden_key}: {error}" for orden_key, error in resultado.items() if error]
+        except Exception as e:
+            errores = [str(e)]
 
         self._cargar_avisos(); self._notificar_refresco_parent()
         if errores:
@@ -237,7 +259,7 @@ class PlanificadorDia(QDialog):
         if not ruta: return
         try:
             with open(ruta, "w", encoding="utf-8") as f:
-                json.dump(items, f, ensure_ascii=False, indent=2)
+                json.dump([dict(a.to_dict(), ordenTrabajo=a.get("ordenInterna")) for a in items], f, ensure_ascii=False, indent=2)
             QMessageBox.information(self, "Exportar", f"Exportados {len(items)} avisos a {ruta}")
         except Exception as e:
             QMessageBox.critical(self, "Exportar", f"Error exportando: {e}")
@@ -285,14 +307,7 @@ class PlanificadorDia(QDialog):
             self.lista.clearSelection(); row = self.lista.row(item); self.lista.item(row).setSelected(True)
             self._asignar_seleccionados()
         elif accion == act_marcar_ok:
-            try:
-                orden_key = aviso.get("ordenTrabajo") or aviso.get("ordenInterna")
-                try:
-                    db.marcar_realizado(orden_key)
-                except Exception:
-                    aviso_copy = aviso.copy(); aviso_copy["estado"] = "realizado"; db.actualizar_aviso(aviso_copy)
-                self._cargar_avisos(); self._notificar_refresco_parent()
-            except Exception: pass
+            self._marcar_realizado(aviso)
         elif accion == act_copiar_dir:
             clipboard = QApplication.clipboard(); clipboard.setText(aviso.get("direccion", "") or "")
         elif accion == act_desasignar:
@@ -305,37 +320,26 @@ class PlanificadorDia(QDialog):
             QMessageBox.critical(self, "Desasignar", "Falta identificador de la orden. No se puede desasignar."); return
         confirm = QMessageBox.question(self, "Desasignar", f"¿Deseas devolver la orden {identificador} a 'sin asignar'?\nSe eliminará la fecha y la asignación.")
         if confirm != QMessageBox.Yes: return
-        try:
-            aviso_copy = aviso.copy()
-            for k in ("fechaVisita","turno","horaInicio","horaFin","tecnico"): aviso_copy[k] = None
-            aviso_copy["estado"] = "sin asignar"
-            try:
-                db.actualizar_aviso(aviso_copy)
-            except Exception:
-                try:
-                    db.actualizar_aviso_campos_basicos(
-                        ordenInterna=identificador, cliente=None, horaInicio=None, horaFin=None, tecnico=None, turno=None, fechaVisita=None
-                    )
-                    aviso_estado = {"ordenTrabajo": identificador, "estado": "sin asignar"}
-                    try: db.actualizar_aviso(aviso_estado)
-                    except Exception: pass
-                except Exception: pass
-            QMessageBox.information(self, "Desasignar", f"Orden {identificador} devuelta a sin asignar.")
-        except Exception as e:
-            QMessageBox.critical(self, "Desasignar", f"No se pudo desasignar: {e}")
-        finally:
-            self._cargar_avisos(); self._notificar_refresco_parent()
+        cambios = {k: None for k in ("fechaVisita","turno","horaInicio","horaFin","tecnico")}
+        cambios["estado"] = "sin asignar"
+        # una transición no permitida (p.ej. un aviso ya realizado) llega por _on_escritura_fallida
+        self._escritura.encolar("actualizar_aviso", dict(aviso.to_dict(), **cambios),
+                                orden=aviso.get("ordenInterna"), cambios=cambios)
+        self._cargar_avisos()
 
     def _marcar_realizado(self, aviso):
-        try:
-            orden_key = aviso.get("ordenTrabajo") or aviso.get("ordenInterna")
-            db.marcar_realizado(orden_key)
-        except Exception:
-            aviso_copy = aviso.copy(); aviso_copy["estado"] = "realizado"
-            try: db.actualizar_aviso(aviso_copy)
-            except Exception: pass
+        orden_key = aviso.get("ordenTrabajo") or aviso.get("ordenInterna")
+        if not orden_key: return
+        self._escritura.encolar("marcar_realizado", orden_key, orden=aviso.get("ordenInterna"),
+                                cambios={"estado": "realizado"})
+        self._cargar_avisos()
+
+    def _on_escritura_confirmada(self):
         self._cargar_avisos(); self._notificar_refresco_parent()
 
+    def _on_escritura_fallida(self, mutacion, mensaje):
+        QMessageBox.warning(self, "Guardar", f"No se pudo guardar la orden {mutacion.orden or ''}: {mensaje}")
+
     def _notificar_refresco_parent(self):
         try:
             p = self.parent()
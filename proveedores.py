@@ -0,0 +1,66 @@
+"""
+Reglas código de aparato -> proveedor y asignación en bloque a los avisos.
+
+    python proveedores.py cargar reglas.csv [--reemplazar]
+    python proveedores.py listar
+    python proveedores.py asignar [--sobrescribir]
+    python proveedores.py borrar LAV
+
+El CSV (separado por ; o ,) tiene por fila: código, proveedor y, opcionalmente,
+"exacto" (1/sí) si la regla es solo para ese código; si no, vale para todos los
+códigos que empiezan así (gana el prefijo más largo). La importación ya aplica
+las reglas a los avisos nuevos; "asignar" las aplica a los que ya estaban.
+"""
+import argparse
+import csv
+import time
+
+import db
+
+
+def leer_reglas(ruta):
+    with open(ruta, newline="", encoding="utf-8-sig") as f:
+        separador = ";" if ";" in f.readline() else ","
+        f.seek(0)
+        reglas = []
+        for fila in csv.reader(f, delimiter=separador):
+            fila = [c.strip() for c in fila]
+            if not fila or not fila[0] or fila[0].lower() in ("codigo", "código"):
+                continue  # vacías y cabecera
+            exacto = len(fila) > 2 and fila[2].lower() in ("1", "si", "sí", "s", "x", "exacto", "true")
+            reglas.append((fila[0], fila[1] if len(fila) > 1 else "", exacto))
+        return reglas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="orden", required=True)
+    cargar = sub.add_parser("cargar", help="Guardar las reglas de un CSV")
+    cargar.add_argument("csv")
+    cargar.add_argument("--reemplazar", action="store_true", help="Borrar antes las reglas que haya")
+    sub.add_parser("listar", help="Mostrar las reglas")
+    asignar = sub.add_parser("asignar", help="Aplicar las reglas a los avisos de la base")
+    asignar.add_argument("--sobrescribir", action="store_true", help="También a los que ya tienen proveedor")
+    borrar = sub.add_parser("borrar", help="Borrar la regla de un código")
+    borrar.add_argument("codigo")
+    args = parser.parse_args()
+
+    if args.orden == "cargar":
+        try:
+            n = db.guardar_reglas_proveedor(leer_reglas(args.csv), reemplazar=args.reemplazar)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"{n} reglas guardadas")
+    elif args.orden == "listar":
+        for r in db.obtener_reglas_proveedor():
+            print(f"{r['codigo']}{'' if r['exacto'] else '*'}\t{r['proveedor']}")
+    elif args.orden == "asignar":
+        inicio = time.perf_counter()
+        n = db.asignar_proveedores(sobrescribir=args.sobrescribir)
+        print(f"Proveedor asignado a {n} avisos ({time.perf_counter() - inicio:.1f} s)")
+    else:
+        print("Regla borrada" if db.borrar_regla_proveedor(args.codigo) else "No había regla para ese código")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,96 @@
+"""
+Planes de consulta de db.py sobre una base temporal con datos sintéticos
+(generar_datos): cada consulta pública debe resolverse con un índice, sin
+"SCAN avisos" a pelo ni "USE TEMP B-TREE" para ordenar.
+
+    python pruebaDB.py            # sale con código 1 si alguna consulta falla
+    python pruebaDB.py --base     # antes, prueba la conexión con la base real (DB_PATH)
+
+pytest hace la misma comprobación en tests/test_planes.py.
+"""
+import argparse
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+
 import db
+import generar_datos
+
+FILAS_SEMILLA = 3000
+
+CONSULTAS = {
+    "obtener_avisos_pendientes": (db._SQL_PENDIENTES, ()),
+    "obtener_avisos_por_fecha": (db._SQL_POR_FECHA, ("2025-01-01",)),
+    "obtener_avisos_por_fecha (con archivo)": (db._SQL_POR_FECHA_ARCHIVO, ("2025-01-01",)),
+    "obtener_todos_los_avisos": (db._SQL_TODOS, ()),
+    "obtener_avisos_sin_fecha": (db._SQL_SIN_FECHA, ()),
+    "obtener_fechas_con_avisos": (db._SQL_FECHAS_CON_AVISOS, ()),
+    "obtener_aviso": (db._SQL_AVISO, ("0",)),
+    "conteo_por_fecha": (db._SQL_CONTEO_POR_FECHA, ("2025-01-01", "2025-01-31")),
+    "obtener_avisos_pagina (siguiente)": (
+        db._SQL_TODOS_PAGINA[0].format(condicion="AND " + db._SQL_TODOS_PAGINA[1]), ("", "", "", 0, 100)),
+    "obtener_avisos_sin_fecha_pagina (siguiente)": (
+        db._SQL_SIN_FECHA_PAGINA[0].format(condicion="AND " + db._SQL_SIN_FECHA_PAGINA[1]), ("", "", 0, 100)),
+    "buscar_avisos": (db._sql_buscar_fts([]), ('"vigo"*', 200)),
+    "buscar_avisos (por fecha)": (db._sql_buscar_fts(["avisos.fechaVisita = ?"]), ('"vigo"*', "2025-01-01", 200)),
+    "cambios_desde": (db._SQL_CAMBIOS_DESDE, (0,)),
+    "iter_avisos por técnico (API)": db._clausulas_iter({"tecnico": "T1"}, ["fechaVisita ASC", "horaInicio ASC"]),
+    "actualizar por ordenInterna": ("UPDATE avisos SET estado=estado WHERE ordenInterna=?", ("0",)),
+}
+
+_SCAN_SIN_INDICE = re.compile(r"^SCAN (avisos|avisos_archivo|avisos_changes)\b(?!.*INDEX)")
 
-print("Probando conexión con la base de datos...")
+def plan(conn, sql, params):
+    return [fila[3] for fila in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
 
-try:
+def plan_con_indice(pasos):
+    return not any(_SCAN_SIN_INDICE.match(p) or "TEMP B-TREE" in p for p in pasos)
+
+@contextmanager
+def base_sembrada(filas=FILAS_SEMILLA):
+    """db.py apuntando a una base temporal con `filas` avisos y estadísticas (ANALYZE)."""
+    anterior, anterior_archivo = db.DB_PATH, db.DB_ARCHIVO_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_ARCHIVO_PATH = None
+        generar_datos.crear_db(os.path.join(tmp, "avisos.db"), filas)
+        try:
+            yield db.get_connection()
+        finally:
+            db.cerrar_conexiones()
+            db.DB_PATH, db.DB_ARCHIVO_PATH = anterior, anterior_archivo
+
+def comprobar_planes(conn):
+    """Imprime el plan de cada consulta; devuelve cuántas no usan índice."""
+    fallos = 0
+    for nombre, (sql, params) in CONSULTAS.items():
+        pasos = plan(conn, sql, params)
+        ok = plan_con_indice(pasos)
+        fallos += 0 if ok else 1
+        print(f"[{'OK' if ok else 'FALLO'}] {nombre}: {' / '.join(pasos)}")
+    return fallos
+
+def probar_base_real():
+    print(f"Probando conexión con {db.DB_PATH}...")
     avisos = db.obtener_avisos_pendientes()
     print(f"Se encontraron {len(avisos)} avisos pendientes.")
     if avisos:
-        print("Primer aviso:")
-        print(avisos[0])
-    else:
-        print("No hay avisos pendientes.")
-except Exception as e:
-    print("Error al consultar la base de datos:", e)
+        print("Primer aviso:", avisos[0].to_dict())
+    db.cerrar_conexiones()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base", action="store_true", help="Probar también la conexión con la base real")
+    args = parser.parse_args()
+    if args.base:
+        probar_base_real()
+    print("\nPlanes de consulta (EXPLAIN QUERY PLAN):")
+    with base_sembrada() as conn:
+        fallos = comprobar_planes(conn)
+    if fallos:
+        print(f"{fallos} consultas sin índice.")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    """db.py contra una base vacía en tmp_path (el esquema lo crean sus migraciones)."""
+    db.cerrar_conexiones()
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "avisos.db"))
+    monkeypatch.setattr(db, "DB_ARCHIVO_PATH", None)
+    yield db
+    db.cerrar_conexiones()
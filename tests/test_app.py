@@ -0,0 +1,70 @@
+import pytest
+
+import app
+import generar_datos
+
+
+@pytest.fixture
+def cliente(base, tmp_path, monkeypatch):
+    libro = tmp_path / "RutasDatos.xlsx"
+    generar_datos.crear_excel(str(libro), 30, formato="flask")
+    monkeypatch.setattr(app, "EXCEL_PATH", str(libro))
+    return app.app.test_client()
+
+
+def test_index_no_vacia_la_cache_de_lecturas(cliente):
+    assert cliente.get("/").status_code == 200
+    app.db.obtener_avisos_pendientes()
+    aciertos = app.db.estadisticas_cache()["aciertos"]
+    assert cliente.get("/?localidad=vigo").status_code == 200
+    app.db.obtener_avisos_pendientes()
+    assert app.db.estadisticas_cache()["aciertos"] == aciertos + 1
+
+
+def test_editar(cliente):
+    cliente.get("/")
+    orden = app.db.obtener_libro_pagina(tamano=1).filas[0].orden
+    app.db.importar_avisos([{"ordenInterna": orden, "cliente": "Ana Souto"}])
+    respuesta = cliente.get(f"/editar/{orden}")
+    assert respuesta.status_code == 200 and "Ana Souto" in respuesta.get_data(as_text=True)
+    assert cliente.get("/editar/no-existe").status_code == 404
+
+
+def _avisos_api(base):
+    base.importar_avisos([
+        {"ordenInterna": "A", "tecnico": "Xoán", "estado": "pendiente", "fechaVisita": "2025-03-04", "horaInicio": "12:00"},
+        {"ordenInterna": "B", "tecnico": "Xoán", "estado": "realizado", "fechaVisita": "2025-03-04", "horaInicio": "09:00"},
+        {"ordenInterna": "C", "tecnico": "Uxía", "estado": "pendiente", "fechaVisita": "2025-03-03", "horaInicio": "10:00"},
+    ])
+
+
+def test_api_avisos_filtros(cliente, base):
+    _avisos_api(base)
+    datos = cliente.get("/api/avisos?tecnico=Xoán").get_json()
+    assert datos["total"] == 2 and [a["orden"] for a in datos["avisos"]] == ["B", "A"]
+    datos = cliente.get("/api/avisos?fecha=2025-03-04&estado=pendiente").get_json()
+    assert [a["orden"] for a in datos["avisos"]] == ["A"]
+    datos = cliente.get("/api/avisos?estado=pendiente&estado=realizado").get_json()
+    assert [a["orden"] for a in datos["avisos"]] == ["C", "B", "A"]
+    assert cliente.get("/api/avisos").status_code == 400
+    assert cliente.get("/api/avisos?estado=inventado").status_code == 400
+
+
+def test_api_aviso(cliente, base):
+    _avisos_api(base)
+    respuesta = cliente.get("/api/avisos/C")
+    assert respuesta.status_code == 200 and respuesta.get_json()["tecnico"] == "Uxía"
+    assert cliente.get("/api/avisos/no-existe").status_code == 404
+
+
+@pytest.mark.parametrize("ruta", ["/api/avisos?fecha=2025-03-04", "/api/avisos/A"])
+def test_api_etag(cliente, base, ruta):
+    _avisos_api(base)
+    primera = cliente.get(ruta)
+    etag = primera.headers["ETag"]
+    assert primera.status_code == 200 and primera.headers["Cache-Control"] == "no-cache"
+    repetida = cliente.get(ruta, headers={"If-None-Match": etag})
+    assert repetida.status_code == 304 and repetida.get_data() == b"" and repetida.headers["ETag"] == etag
+    base.actualizar_aviso({"ordenInterna": "A", "tecnico": "Uxía"})
+    nueva = cliente.get(ruta, headers={"If-None-Match": etag})
+    assert nueva.status_code == 200 and nueva.headers["ETag"] != etag
@@ -0,0 +1,28 @@
+def _avisos_juan(base):
+    base.importar_avisos([
+        {"ordenInterna": "A1", "cliente": "Juan Pérez", "estado": "realizado", "fechaVisita": "2020-01-01"},
+        {"ordenInterna": "A2", "cliente": "Juan López", "estado": "pendiente", "fechaVisita": "2020-01-02"},
+        {"ordenInterna": "A3", "cliente": "Ana", "estado": "realizado", "fechaVisita": "2020-01-01"},
+    ])
+
+
+def _ordenes(avisos):
+    return [a.ordenInterna for a in avisos]
+
+
+def test_buscar_con_filtros_en_el_archivo(base):
+    _avisos_juan(base)
+    assert base.archivar_avisos(dias=30) == 2
+    assert _ordenes(base.buscar_avisos("juan", incluir_archivo=True)) == ["A2", "A1"]
+    assert _ordenes(base.buscar_avisos("juan", fecha="2020-01-01", incluir_archivo=True)) == ["A1"]
+    assert _ordenes(base.buscar_avisos("juan", estados=(base.ESTADO_REALIZADO,), incluir_archivo=True)) == ["A1"]
+    assert base.buscar_avisos("juan", fecha="2020-01-03", incluir_archivo=True) == []
+
+
+def test_buscar_con_filtros_sin_fts(base, monkeypatch):
+    _avisos_juan(base)
+    monkeypatch.setattr(base, "_hay_fts", lambda conn: False)
+    assert _ordenes(base.buscar_avisos("juan")) == ["A2", "A1"]
+    assert _ordenes(base.buscar_avisos("juan", fecha="2020-01-01")) == ["A1"]
+    assert _ordenes(base.buscar_avisos("juan", estados=(base.ESTADO_PENDIENTE,))) == ["A2"]
+    assert _ordenes(base.buscar_avisos("juan", estado="realizado")) == ["A1"]
@@ -0,0 +1,69 @@
+import pytest
+
+
+def test_cambios_desde_da_el_ultimo_cambio_de_cada_aviso(base):
+    base.importar_avisos([{"ordenInterna": "A", "cliente": "a"}, {"ordenInterna": "B", "cliente": "b"}])
+    desde = base.ultimo_cambio()
+    base.actualizar_aviso_campos_basicos("A", cliente="a2")
+    base.actualizar_aviso_campos_basicos("B", cliente="b2")
+    base.actualizar_aviso_campos_basicos("A", cliente="a3")
+    cambios = base.cambios_desde(desde)
+    assert [c.ordenInterna for c in cambios] == ["B", "A"]
+    assert [c.seq for c in cambios] == sorted(c.seq for c in cambios)
+    assert cambios[-1].seq == base.ultimo_cambio()
+    assert base.cambios_desde(base.ultimo_cambio()) == []
+
+
+def test_archivar_deja_cambio_y_sale_en_la_exportacion_incremental(base):
+    base.importar_avisos([
+        {"ordenInterna": "A", "cliente": "a", "estado": "realizado", "fechaVisita": "2020-01-01"},
+        {"ordenInterna": "B", "cliente": "b", "estado": "pendiente", "fechaVisita": "2020-01-01"},
+    ])
+    desde = base.ultimo_cambio()
+    version = base.obtener_version_datos()
+    base.actualizar_aviso_campos_basicos("A", cliente="a2", fechaVisita="2020-01-01")
+    assert base.archivar_avisos(dias=30) == 1
+    assert [(c.ordenInterna, c.op) for c in base.cambios_desde(desde)] == [("A", "A")]
+    assert [(a.ordenInterna, a.cliente) for a in base.iter_avisos_cambiados(desde)] == [("A", "a2")]
+    assert base.obtener_version_datos() != version
+
+
+def _envejecer_cambios(base, dias):
+    with base.transaccion() as conn:
+        conn.execute("UPDATE avisos_changes SET ts = datetime('now', ?)", (f"-{dias} days",))
+
+
+def test_compactar_deja_uno_por_aviso_sin_hasta_seq(base):
+    base.importar_avisos([{"ordenInterna": "A", "cliente": "a"}, {"ordenInterna": "B", "cliente": "b"}])
+    base.actualizar_aviso_campos_basicos("A", cliente="a2")
+    _envejecer_cambios(base, 60)
+    ultimo = base.ultimo_cambio()
+    assert base.compactar_cambios() == 1
+    assert [c.ordenInterna for c in base.cambios_desde(0)] == ["B", "A"]
+    assert base.ultimo_cambio() == ultimo
+
+
+def test_compactar_hasta_seq_acota_el_registro_por_tiempo(base):
+    base.importar_avisos([{"ordenInterna": o, "cliente": o} for o in "ABC"])
+    base.actualizar_aviso_campos_basicos("C", cliente="c2")
+    exportado = base.ultimo_cambio()
+    _envejecer_cambios(base, 60)
+    base.actualizar_aviso_campos_basicos("A", cliente="a2")  # reciente: se queda
+    ultimo = base.ultimo_cambio()
+    assert base.compactar_cambios(hasta_seq=exportado) == 4
+    assert [(c.ordenInterna, c.seq) for c in base.cambios_desde(exportado)] == [("A", ultimo)]
+    assert base.ultimo_cambio() == ultimo
+    with pytest.raises(ValueError):
+        base.cambios_desde(exportado - 1)
+
+
+def test_compactar_no_descarta_lo_no_sincronizado(base):
+    base.importar_avisos([{"ordenInterna": o, "cliente": o} for o in "AB"])
+    with base.transaccion() as conn:
+        conn.execute("DELETE FROM avisos WHERE ordenInterna = 'B'")
+    ultimo = base.ultimo_cambio()
+    _envejecer_cambios(base, 60)
+    # la 'I' de B (queda su 'D') y el 'D' antiguo; la 'I' de A no se ha sincronizado
+    assert base.compactar_cambios(hasta_seq=0) == 2
+    assert [tuple(r) for r in base.get_connection().execute("SELECT ordenInterna, op FROM avisos_changes")] == [("A", "I")]
+    assert base.ultimo_cambio() == ultimo
@@ -0,0 +1,106 @@
+import pytest
+
+
+def _estado(base, orden):
+    return base.get_connection().execute(
+        "SELECT estado FROM avisos WHERE ordenInterna = ?", (orden,)).fetchone()[0]
+
+
+@pytest.mark.parametrize("estado", ["realizado", "anulado"])
+def test_editar_aviso_cerrado(base, estado):
+    base.importar_avisos([{"ordenInterna": "A", "cliente": "a", "estado": estado}])
+    base.actualizar_aviso({"ordenTrabajo": "A", "cliente": "a2"})
+    base.actualizar_aviso({"ordenTrabajo": "A", "cliente": "a3", "estado": estado})
+    assert (base.obtener_aviso("A").cliente, _estado(base, "A")) == ("a3", estado)
+    with pytest.raises(ValueError, match="no permitida"):
+        base.actualizar_aviso({"ordenTrabajo": "A", "cliente": "a4", "estado": None})
+    assert base.obtener_aviso("A").cliente == "a3"
+
+
+class _SinMensajes:
+    # un QMessageBox modal dejaría el test esperando
+    def __getattr__(self, nombre):
+        def mensaje(parent, titulo, texto, *args):
+            raise AssertionError(f"{titulo}: {texto}")
+        return mensaje
+
+
+def test_dialogo_no_manda_el_estado_si_no_cambia(base, monkeypatch):
+    widgets = pytest.importorskip("PySide6.QtWidgets")
+    import editar_aviso_dialog
+    app = widgets.QApplication.instance() or widgets.QApplication([])
+    monkeypatch.setattr(editar_aviso_dialog, "QMessageBox", _SinMensajes())
+    base.importar_avisos([{"ordenInterna": "A", "cliente": "a", "estado": "realizado",
+                           "fechaVisita": "2020-01-01", "horaInicio": "09:00", "horaFin": "10:00"}])
+    enviados = []
+    dlg = editar_aviso_dialog.EditarAvisoDialog(base.obtener_aviso("A").to_dict(), enviados.append)
+    assert dlg.combo_estado.currentText() == "realizado"
+    dlg.input_cliente.setText("a2")
+    dlg.on_guardar()
+    assert "estado" not in enviados[0]
+    base.actualizar_aviso(enviados[0])
+    assert (base.obtener_aviso("A").cliente, _estado(base, "A")) == ("a2", "realizado")
+    dlg.combo_estado.setCurrentText("pendiente")
+    dlg.on_guardar()
+    assert enviados[1]["estado"] == "pendiente"
+    dlg.deleteLater()
+    app.processEvents()
+
+
+@pytest.mark.parametrize("actual, destino, permitida", [
+    ("pendiente", "realizado", True),
+    ("pendiente", "anulado", True),
+    ("", "cancelado", True),
+    ("sin asignar", "pendiente", True),
+    ("reactivable", "realizado", True),
+    ("en taller", "pendiente", True),
+    ("realizado", "pendiente", True),
+    ("anulado", "reactivable", True),
+    ("cancelado", "cancelado", True),
+    ("realizado", "anulado", False),
+    ("anulado", "realizado", False),
+    ("cancelado", "sin asignar", False),
+    ("realizado", "", False),
+    ("pendiente", "en taller", False),
+])
+def test_transiciones(base, actual, destino, permitida):
+    base.importar_avisos([{"ordenInterna": "A", "estado": actual}])
+    seq = base.ultimo_cambio()
+    if permitida:
+        base.actualizar_aviso({"ordenInterna": "A", "estado": destino})
+        assert _estado(base, "A") == destino
+    else:
+        with pytest.raises(ValueError, match="no permitida"):
+            base.actualizar_aviso({"ordenInterna": "A", "estado": destino})
+        assert (_estado(base, "A"), base.ultimo_cambio()) == (actual, seq)
+
+
+def test_marcar_realizado_y_anulado(base):
+    base.importar_avisos([{"ordenInterna": "A", "estado": "pendiente"},
+                          {"ordenInterna": "B", "estado": "anulado"}])
+    base.marcar_realizado("A")
+    with pytest.raises(ValueError, match="realizado -> anulado"):
+        base.marcar_anulado("A", "cliente ausente")
+    with pytest.raises(ValueError, match="anulado -> realizado"):
+        base.marcar_realizado("B")
+    base.marcar_desanulado("A")  # solo revierte anulados: no hace nada
+    base.marcar_desanulado("B")
+    assert (_estado(base, "A"), _estado(base, "B")) == ("realizado", "pendiente")
+    base.marcar_realizado("no-existe")  # sin aviso no hay transición que comprobar
+
+
+def test_transiciones_en_bloque(base):
+    base.importar_avisos([{"ordenInterna": "A", "estado": "pendiente"},
+                          {"ordenInterna": "B", "estado": "anulado"},
+                          {"ordenInterna": "C", "estado": "realizado"}])
+    resultado = base.marcar_realizado_bulk(["A", "B", "C", "X"])
+    assert resultado["A"] is None and resultado["C"] is None
+    assert "anulado -> realizado" in resultado["B"]
+    assert resultado["X"] == "No existe la orden"
+    assert [_estado(base, o) for o in "ABC"] == ["realizado", "anulado", "realizado"]
+
+    base.importar_avisos([{"ordenInterna": "D", "estado": "pendiente"}])
+    resultado = base.marcar_anulado_bulk(["A", "D"], "duplicado")
+    assert "realizado -> anulado" in resultado["A"] and resultado["D"] is None
+    assert _estado(base, "A") == "realizado"
+    assert (_estado(base, "D"), base.obtener_aviso("D").observacionesCobro) == ("anulado", "| Anulado: duplicado")
@@ -0,0 +1,74 @@
+import os
+
+import pandas as pd
+
+import importar_excel
+
+
+def _integridad_fts(conn):
+    conn.execute("INSERT INTO avisos_fts(avisos_fts) VALUES ('integrity-check')")
+
+
+def test_importar_avisos_con_orden_repetida(base):
+    resultado = base.importar_avisos(
+        [{"ordenInterna": "1", "cliente": "a"}, {"ordenInterna": "1", "cliente": "b", "localidad": "Vigo"}],
+        "sobrescribir")
+    assert resultado == {"insertados": 1, "actualizados": 0, "sin_cambios": 1}
+    aviso = base.obtener_aviso("1")
+    assert (aviso.cliente, aviso.localidad) == ("b", "Vigo")
+    _integridad_fts(base.get_connection())
+    assert [a.ordenInterna for a in base.buscar_avisos("vigo")] == ["1"]
+
+
+def test_importar_avisos_completar_repetida_no_pisa(base):
+    base.importar_avisos([{"ordenInterna": "1", "cliente": "a"}, {"ordenInterna": "1", "cliente": "b"}], "completar")
+    assert base.obtener_aviso("1").cliente == "a"
+    _integridad_fts(base.get_connection())
+
+
+def _libro(ruta, clientes):
+    pd.DataFrame({
+        "ORDEN INTERNA": [str(o) for o in clientes],
+        "CLIENTE": list(clientes.values()),
+        "POBLACION": ["Vigo"] * len(clientes),
+    }).to_excel(ruta, index=False)
+
+
+def test_importar_libros_con_ordenes_compartidas(base, tmp_path):
+    a, b = tmp_path / "a.xlsx", tmp_path / "b.xlsx"
+    _libro(a, {100: "Ana", 101: "Brais"})
+    _libro(b, {101: "Brais Otero", 102: "Iria"})
+    assert importar_excel.main([str(a), str(b), "--db", base.DB_PATH, "--procesos", "1"]) == 0
+    conn = base.get_connection()
+    _integridad_fts(conn)
+    assert {a.ordenInterna for a in base.buscar_avisos("otero")} == {"101"}
+    assert len(base.buscar_avisos("vigo")) == 3
+    # un 'I' por aviso nuevo, también para los que se actualizaron en el mismo bloque
+    assert conn.execute("SELECT COUNT(*) FROM avisos_changes WHERE op = 'I'").fetchone()[0] == 3
+
+
+def _lector_que_muere(ruta, tamano, cola):
+    os._exit(1)  # como un lector que mata el sistema por falta de memoria
+
+
+def test_importar_libros_lector_muerto_no_se_queda_esperando(base, tmp_path, monkeypatch):
+    libro = tmp_path / "a.xlsx"
+    _libro(libro, {100: "Ana"})
+    monkeypatch.setattr(importar_excel, "_parsear_libro", _lector_que_muere)
+    monkeypatch.setattr(importar_excel, "ESPERA_COLA", 0.1)
+    assert importar_excel.main([str(libro), "--db", base.DB_PATH, "--procesos", "1"]) == 1
+
+
+def test_reimportar_con_hashes_de_otra_version_no_reescribe(base):
+    df = pd.DataFrame({"ORDEN INTERNA": ["1", "2"], "CLIENTE": ["Ana", "Brais"], "POBLACION": ["Vigo", "Cangas"]})
+    importar_excel.importar_dataframe(df)
+    conn = base.get_connection()
+    # como si los hashes guardados fueran de otras columnas (p.ej. antes de añadir "aparato")
+    conn.execute("UPDATE avisos SET hashImportacion = hashImportacion + 1")
+    conn.commit()
+    seq = base.ultimo_cambio()
+    assert importar_excel.importar_dataframe(df) == {"insertados": 0, "actualizados": 0, "sin_cambios": 2}
+    assert base.ultimo_cambio() == seq
+    df.loc[1, "CLIENTE"] = "Brais Otero"
+    assert importar_excel.importar_dataframe(df)["actualizados"] == 1
+    assert [c.ordenInterna for c in base.cambios_desde(seq)] == ["2"]
@@ -0,0 +1,28 @@
+def test_traza_solo_durante_las_llamadas_medidas(base, monkeypatch):
+    conn = base.get_connection()
+    trazadas = []
+    with monkeypatch.context() as m:
+        m.setattr(base, "_trazar", trazadas.append)
+        conn.execute("SELECT 1")
+        assert trazadas == []  # fuera de una llamada medida no hay trace callback
+        base.obtener_aviso("1")
+        n = len(trazadas)
+        assert "FROM avisos_todos" in trazadas[-1]
+        conn.execute("SELECT 2")
+        assert len(trazadas) == n
+    monkeypatch.setattr(base, "UMBRAL_LENTA_MS", 0)
+    base.reiniciar_stats()
+    base.obtener_avisos_pendientes()
+    lenta = base.stats()["lentas"][-1]
+    assert lenta["funcion"] == "obtener_avisos_pendientes" and lenta["sentencias"]
+
+
+def test_carga_masiva_no_se_mide_y_pagina_libro_cuenta_filas(base):
+    base.reiniciar_stats()
+    with base.carga_masiva() as conn:
+        conn.execute("INSERT INTO avisos(ordenInterna) VALUES ('1')")
+    base.cargar_libro("libro", [("1", "Ana", "LAV", "Vigo", "T1"), ("2", "Brais", "FRI", "Vigo", "T1")])
+    base.obtener_libro_pagina()
+    funciones = base.stats()["funciones"]
+    assert "carga_masiva" not in funciones
+    assert funciones["obtener_libro_pagina"]["filas_devueltas"] == 2
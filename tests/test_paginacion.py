@@ -0,0 +1,70 @@
+import base64
+import json
+
+import pytest
+
+
+def _insertar(base, filas):
+    with base.transaccion() as conn:
+        conn.executemany("INSERT INTO avisos (ordenInterna, fechaVisita, horaInicio, estado) VALUES (?, ?, ?, ?)",
+                         filas)
+
+
+def _recorrer(funcion, tamano, **kwargs):
+    paginas, cursor = [], None
+    while True:
+        pagina = funcion(tamano, cursor, **kwargs)
+        paginas.append(pagina)
+        cursor = pagina.cursor
+        if cursor is None:
+            return paginas
+
+
+def test_paginas_de_todos_con_empates(base):
+    # muchas filas con la misma fecha y hora (y sin fecha/hora): desempata idAviso
+    _insertar(base, [(f"O{i:02d}", ["2025-01-02", "2025-01-01", None][i % 3], ["09:00", None][i % 2], "pendiente")
+                     for i in range(23)])
+    paginas = _recorrer(base.obtener_avisos_pagina, 4)
+    avisos = [a for p in paginas for a in p.avisos]
+    assert len(paginas) == 6 and all(len(p.avisos) == 4 for p in paginas[:-1])
+    assert {p.total for p in paginas} == {23}
+    assert [a.idAviso for a in avisos] == [a.idAviso for a in sorted(
+        base.obtener_todos_los_avisos(),
+        key=lambda a: (a.fechaVisita or "", a.horaInicio or "", a.idAviso), reverse=True)]
+
+
+def test_paginas_sin_fecha_con_empates_y_estados(base):
+    # sin orden interna: todas empatan en COALESCE(ordenInterna, '')
+    _insertar(base, [(None if i % 2 else f"S{i:02d}", None, None, ["pendiente", "anulado"][i % 3 == 0])
+                     for i in range(17)])
+    _insertar(base, [("F1", "2025-01-01", None, "pendiente")])
+    todos = [a for p in _recorrer(base.obtener_avisos_sin_fecha_pagina, 3) for a in p.avisos]
+    assert len(todos) == 17 and len({a.idAviso for a in todos}) == 17
+    assert [(a.ordenInterna or "", a.idAviso) for a in todos] == sorted((a.ordenInterna or "", a.idAviso) for a in todos)
+    pendientes = [a for p in _recorrer(base.obtener_avisos_sin_fecha_pagina, 3, estados=(base.ESTADO_PENDIENTE,))
+                  for a in p.avisos]
+    assert [a.idAviso for a in pendientes] == [a.idAviso for a in todos if a.estado == "pendiente"]
+
+
+def _cursor(datos):
+    return base64.urlsafe_b64encode(json.dumps(datos).encode()).decode()
+
+
+@pytest.mark.parametrize("cursor", [
+    "no es base64!", _cursor([1, 2]), _cursor({"k": ["", 1]}), _cursor({"k": "x", "t": 5}),
+    _cursor({"k": ["", 1], "t": 5}),  # clave de obtener_avisos_sin_fecha_pagina
+    _cursor({"k": ["", "", {}], "t": 5}),
+])
+def test_cursor_no_valido(base, cursor):
+    _insertar(base, [("A", "2025-01-01", "09:00", "pendiente")])
+    with pytest.raises(ValueError, match="Cursor"):
+        base.obtener_avisos_pagina(2, cursor)
+
+
+def test_cursor_de_otro_listado(base):
+    _insertar(base, [(f"O{i}", "2025-01-01", "09:00", "pendiente") for i in range(3)])
+    cursor = base.obtener_avisos_pagina(1).cursor
+    with pytest.raises(ValueError, match="Cursor"):
+        base.obtener_avisos_sin_fecha_pagina(1, cursor)
+    with pytest.raises(ValueError):
+        base.obtener_avisos_pagina(0)
@@ -0,0 +1,16 @@
+import pytest
+
+import pruebaDB
+
+
+@pytest.fixture(scope="module")
+def conn():
+    with pruebaDB.base_sembrada() as conn:
+        yield conn
+
+
+@pytest.mark.parametrize("nombre", list(pruebaDB.CONSULTAS))
+def test_consulta_usa_indice(conn, nombre):
+    sql, params = pruebaDB.CONSULTAS[nombre]
+    pasos = pruebaDB.plan(conn, sql, params)
+    assert pruebaDB.plan_con_indice(pasos), " / ".join(pasos)